@@ -0,0 +1,189 @@
+"""Пакетный режим: геокодирование потока JSONL-запросов."""
+
+import asyncio
+import json
+import sys
+import time
+from collections import Counter, deque
+from contextlib import redirect_stdout
+from typing import (IO, AsyncIterable, AsyncIterator, Awaitable, Callable,
+                    Dict, Iterable, Optional, Tuple, Union)
+
+from Source import parsing
+from Source.output import JsonlWriter, dumps, human_output, result_record
+from Source.result import (STATUS_ERROR, STATUS_INVALID, STATUSES,
+                           GeocodeResult)
+from Source.scheduler import PRIORITY_BATCH, current_priority
+
+DEFAULT_CONCURRENCY = 8
+
+Record = Dict
+Records = Union[Iterable[Record], AsyncIterable[Record]]
+Handler = Callable[[str], Awaitable[Optional[GeocodeResult]]]
+
+
+class BatchStats:
+    """Счётчики пакетного прогона: всего, по статусам и скорость."""
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.by_status: Counter = Counter()
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, result: GeocodeResult) -> None:
+        self.count(result.status)
+
+    def count(self, status: str) -> None:
+        self.total += 1
+        self.by_status[status] += 1
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return max(end - self.started, 1e-9)
+
+    @property
+    def throughput(self) -> float:
+        return self.total / self.elapsed
+
+    def format_report(self) -> str:
+        lines = [
+            f"Обработано запросов: {self.total} "
+            f"за {self.elapsed:.2f} с ({self.throughput:.1f} запр./с)",
+        ]
+        for status in STATUSES:
+            lines.append(f"    {status}: {self.by_status.get(status, 0)}")
+        return "\n".join(lines)
+
+
+def parse_record(line: str) -> Record:
+    """Строка JSONL -> запись вида {"query": ..., ["id": ...]}.
+
+    Допускается как объект с полем query, так и просто JSON-строка.
+    """
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return {"query": None, "raw": line}
+
+    if isinstance(data, str):
+        return {"query": data}
+    if isinstance(data, dict):
+        return data
+    return {"query": None, "raw": line}
+
+
+async def _iterate(records: Records) -> AsyncIterator[Record]:
+    if hasattr(records, "__aiter__"):
+        async for record in records:  # type: ignore[union-attr]
+            yield record
+    else:
+        for record in records:  # type: ignore[union-attr]
+            yield record
+
+
+async def _geocode_record(
+        record: Record,
+        handler: Optional[Handler] = None,
+        ) -> Tuple[Record, GeocodeResult]:
+    # Запись обрабатывается в своей задаче, поэтому приоритет не утекает.
+    current_priority.set(PRIORITY_BATCH)
+    query = record.get("query")
+    if not isinstance(query, str):
+        return record, GeocodeResult(str(query or ""), STATUS_INVALID)
+
+    try:
+        result = await (handler or parsing.handle_free_query)(query)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[Batch] Ошибка при обработке запроса {query!r}: {exc}")
+        result = None
+
+    return record, result or GeocodeResult(query, STATUS_ERROR)
+
+
+async def geocode_stream(
+        records: Records,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        ordered: bool = True,
+        handler: Optional[Handler] = None,
+        ) -> AsyncIterator[Tuple[Record, GeocodeResult]]:
+    """Геокодирует записи, держа в работе не больше concurrency запросов.
+
+    Следующая запись читается только когда освобождается слот, поэтому
+    память не растёт с размером входа. При ordered=True результаты
+    отдаются в порядке входа, иначе — по мере готовности. handler
+    заменяет parsing.handle_free_query (например, чтобы добавить
+    общий для процесса ограничитель).
+    """
+    concurrency = max(1, concurrency)
+    queue: deque = deque()
+    pending: set = set()
+
+    try:
+        async for record in _iterate(records):
+            task = asyncio.ensure_future(_geocode_record(record, handler))
+            if ordered:
+                queue.append(task)
+                if len(queue) >= concurrency:
+                    yield await queue.popleft()
+                continue
+
+            pending.add(task)
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    yield finished.result()
+
+        while queue:
+            yield await queue.popleft()
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for finished in done:
+                yield finished.result()
+    finally:
+        for task in list(queue) + list(pending):
+            task.cancel()
+
+
+def format_result_line(record: Record, result: GeocodeResult) -> str:
+    return dumps(result_record(result, record))
+
+
+def _read_records(stream: IO[str]) -> Iterable[Record]:
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield parse_record(line)
+
+
+async def run_batch(
+        input_stream: IO[str],
+        output_stream: IO[str],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        ordered: bool = True,
+        ) -> BatchStats:
+    """Читает JSONL из input_stream и пишет JSONL-результаты в output_stream.
+
+    Диагностические сообщения конвейера уходят в stderr, чтобы не
+    смешиваться с потоком результатов; сами результаты там не повторяются.
+    """
+    stats = BatchStats()
+    writer = JsonlWriter(output_stream)
+    quiet = human_output.set(False)
+    try:
+        with redirect_stdout(sys.stderr):
+            async for record, result in geocode_stream(
+                    _read_records(input_stream), concurrency, ordered):
+                stats.add(result)
+                writer.write(result, record)
+    finally:
+        human_output.reset(quiet)
+        writer.flush()
+    stats.finish()
+    return stats
@@ -0,0 +1,73 @@
+"""Канонический вид адресной строки для ключей кэша.
+
+«Екатеринбург, ул. Белинского, д.86», «г екатеринбург ул белинского 86»
+и «ЕКБ, улица Белинского 86» дают один и тот же ключ
+«екатеринбург улица белинского 86».
+
+Всё построено на заранее собранных таблицах: str.translate убирает
+пунктуацию и ё, словарь раскрывает сокращения. Регулярные выражения
+не используются, вызов занимает единицы микросекунд.
+"""
+
+from typing import Dict
+
+# Знаки, которые отделяют слова, но сами ничего не значат.
+_SEPARATORS = ".,;:!?\"'`«»„“”()[]{}<>*_#№+=|\\~"
+_DASHES = "‐‑‒–—−"
+
+_TRANSLATION = str.maketrans({
+    **{char: " " for char in _SEPARATORS},
+    **{char: "-" for char in _DASHES},
+    "ё": "е",
+})
+
+# Сокращение -> каноническое слово; пустая строка — слово отбрасывается.
+# Тип улицы сохраняется (улица Ленина и проспект Ленина — разные
+# адреса), а «г», «д» и «Россия» ничего не различают и выкидываются.
+ABBREVIATIONS: Dict[str, str] = {
+    # служебные слова
+    "г": "", "гор": "", "город": "",
+    "д": "", "дом": "",
+    "россия": "", "рф": "",
+    # типы улиц
+    "ул": "улица",
+    "пр": "проспект", "пр-т": "проспект", "пр-кт": "проспект",
+    "просп": "проспект",
+    "пр-д": "проезд",
+    "пер": "переулок",
+    "б-р": "бульвар", "бул": "бульвар", "бульв": "бульвар",
+    "наб": "набережная",
+    "пл": "площадь",
+    "ш": "шоссе",
+    "туп": "тупик",
+    "мкр": "микрорайон", "мкрн": "микрорайон", "мкр-н": "микрорайон",
+    "тер": "территория",
+    # деление региона и дома
+    "обл": "область",
+    "респ": "республика",
+    "р-н": "район", "рн": "район",
+    "корп": "корпус",
+    "стр": "строение",
+    "кв": "квартира",
+    # разговорные названия городов
+    "екб": "екатеринбург", "ебург": "екатеринбург",
+    "спб": "санкт петербург", "питер": "санкт петербург",
+    "мск": "москва",
+    "нск": "новосибирск", "новосиб": "новосибирск",
+}
+
+
+def canonical_key(text: str) -> str:
+    """Ключ кэша: регистр, ё, пунктуация и сокращения не учитываются."""
+    words = []
+    for token in text.casefold().translate(_TRANSLATION).split():
+        replacement = ABBREVIATIONS.get(token)
+        if replacement is not None:
+            if replacement:
+                words.append(replacement)
+        elif "-" in token:
+            # «санкт-петербург» и «санкт петербург» — одно и то же
+            words.extend(part for part in token.split("-") if part)
+        else:
+            words.append(token)
+    return " ".join(words)
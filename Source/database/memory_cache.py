@@ -0,0 +1,98 @@
+"""Память процесса как первый уровень кэша перед SQLite."""
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from Source.utils import env_number
+
+
+class MemoryCache:
+    """LRU-кэш с ограничением числа записей и временем жизни (TTL).
+
+    max_entries=0 отключает кэш, ttl<=0 — записи не устаревают.
+    """
+
+    def __init__(self,
+                 max_entries: int = 10000,
+                 ttl: float = 3600.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def configure(self,
+                  max_entries: Optional[int] = None,
+                  ttl: Optional[float] = None) -> None:
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if ttl is not None:
+            self.ttl = ttl
+        self._shrink()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = item
+        if expires_at and expires_at <= self._clock():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        expires_at = self._clock() + self.ttl if self.ttl > 0 else 0.0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        self._shrink()
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def _shrink(self) -> None:
+        limit = max(self.max_entries, 0)
+        while len(self._data) > limit:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def format(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"Кэш в памяти: попаданий {self.hits} из {lookups} ({rate:.1%}), "
+            f"записей {len(self)}, вытеснено {self.evictions}, "
+            f"устарело {self.expirations}"
+        )
+
+
+memory_cache = MemoryCache(
+    max_entries=int(env_number("GEOCODER_MEMORY_CACHE_SIZE", 10000)),
+    ttl=env_number("GEOCODER_MEMORY_CACHE_TTL", 3600.0),
+)
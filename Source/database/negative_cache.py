@@ -0,0 +1,155 @@
+"""Отрицательный кэш: запросы, по которым адрес заведомо не найти.
+
+Если Nominatim ничего не нашёл, DaData не разобрала строку или адрес
+оказался вне России, запрос запоминается вместе с причиной на
+GEOCODER_NEGATIVE_TTL секунд. Пока запись действует, тот же запрос
+получает тот же ответ без обращения к внешним сервисам.
+
+Ошибки сети и таймауты сюда не попадают: их стоит повторить.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from Source.database.memory_cache import MemoryCache
+from Source.database.models import (NegativeResult, async_session, upsert,
+                                    utcnow, write_session)
+from Source.database.requests import cache_key, register_buffer
+from Source.database.write_behind import Hits, WriteBehindBuffer
+from Source.metrics import metrics
+from Source.result import STATUS_INVALID, STATUS_NOT_FOUND, STATUS_OUTSIDE_RUSSIA
+from Source.utils import env_number
+
+try:
+    from sqlalchemy import select  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover
+    select = None
+
+# Сколько секунд помнить отрицательный ответ; 0 — не помнить.
+NEGATIVE_TTL: float = env_number("GEOCODER_NEGATIVE_TTL", 86400.0)
+
+# Причина совпадает со статусом результата, который вернётся из кэша.
+REASONS = (STATUS_NOT_FOUND, STATUS_INVALID, STATUS_OUTSIDE_RUSSIA)
+
+
+@dataclass
+class NegativeStats:
+    lookups: int = 0
+    stored: int = 0
+    hits: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def saved(self) -> int:
+        """Столько обращений к внешним сервисам не понадобилось."""
+        return sum(self.hits.values())
+
+    def format(self) -> str:
+        reasons = ", ".join(
+            f"{reason} {count}" for reason, count in sorted(self.hits.items()))
+        return (
+            f"Отрицательный кэш: ответов {self.saved} из {self.lookups} "
+            f"проверок ({reasons or 'нет'}), записано {self.stored}"
+        )
+
+
+negative_stats = NegativeStats()
+
+# Первый уровень в памяти; срок действия хранится вместе с причиной.
+_memory = MemoryCache(
+    max_entries=int(env_number("GEOCODER_NEGATIVE_CACHE_SIZE", 10000)),
+    ttl=0,
+)
+
+
+async def _write_negatives(rows: List[Dict], _hits: Hits) -> None:
+    """Записывает пачку отрицательных ответов одной транзакцией."""
+    stmt = upsert(NegativeResult)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["query_key"],
+        set_={
+            "reason": stmt.excluded.reason,
+            "created_at": stmt.excluded.created_at,
+            "expires_at": stmt.excluded.expires_at,
+        },
+    )
+    async with write_session() as session:
+        await session.execute(stmt, rows)
+        await session.commit()
+    negative_stats.stored += len(rows)
+
+
+# Пишутся пачками по тем же правилам, что и строки кэша адресов.
+_buffer = register_buffer(WriteBehindBuffer(
+    _write_negatives,
+    flush_rows=int(env_number("GEOCODER_WRITE_BATCH_ROWS", 100)),
+    flush_interval=env_number("GEOCODER_WRITE_BATCH_MS", 200) / 1000,
+    max_rows=int(env_number("GEOCODER_WRITE_BUFFER_MAX", 10000)),
+    label="отрицательные ответы",
+))
+
+
+def _enabled() -> bool:
+    return NEGATIVE_TTL > 0 and async_session is not None
+
+
+async def find_negative(query: str, key: Optional[str] = None) -> Optional[str]:
+    """Причина, по которой запрос уже не удался, или None.
+
+    key — готовый ключ (для координат), по умолчанию cache_key(query).
+    """
+    if not _enabled():
+        return None
+    key = key or cache_key(query)
+    negative_stats.lookups += 1
+    now = utcnow()
+
+    remembered: Optional[Tuple[str, datetime]] = _memory.get(key)
+    if remembered is None:
+        buffered = _buffer.get(key)
+        if buffered is not None:
+            remembered = (buffered["reason"], buffered["expires_at"])
+    if remembered is None:
+        async with async_session() as session:
+            row = (await session.execute(
+                select(NegativeResult.reason, NegativeResult.expires_at)
+                .where(NegativeResult.query_key == key)
+            )).first()
+        if row is not None:
+            remembered = (row.reason, row.expires_at)
+            _memory.set(key, remembered)
+
+    if remembered is not None and remembered[1] <= now:
+        _memory.invalidate(key)
+        remembered = None
+
+    metrics.count("cache_lookups", tier="negative",
+                  result="miss" if remembered is None else "hit")
+    if remembered is None:
+        return None
+    reason = remembered[0]
+    negative_stats.hits[reason] = negative_stats.hits.get(reason, 0) + 1
+    metrics.count("negative_hits", reason=reason)
+    return reason
+
+
+async def remember_negative(
+        query: str, reason: str, key: Optional[str] = None) -> None:
+    """Запоминает неудачный запрос на NEGATIVE_TTL секунд.
+
+    Строка попадает в буфер отложенной записи и сразу видна при поиске.
+    """
+    if not _enabled() or reason not in REASONS:
+        return
+    key = key or cache_key(query)
+    now = utcnow()
+    expires_at = now + timedelta(seconds=NEGATIVE_TTL)
+    _memory.set(key, (reason, expires_at))
+
+    try:
+        await _buffer.add(dict(query_key=key, reason=reason, created_at=now,
+                               expires_at=expires_at))
+    except Exception as exc:  # noqa: BLE001
+        # пачка осталась в буфере и уйдёт со следующей записью
+        print(f"[БД] Не удалось сохранить отрицательный ответ: {exc}")
+
@@ -0,0 +1,451 @@
+"""Офлайн-геокодирование по локальной выгрузке адресов OSM.
+
+Импорт читает выгрузку потоком и пишет её пачками, поэтому память не
+зависит от размера файла (хоть вся Россия). Поддерживаются:
+
+    *.osm / *.xml            — OSM XML; точки (node) берутся как есть,
+                               у way/relation нужен элемент <center>
+                               (Overpass: «out center;»);
+    *.geojsonseq / *.jsonl   — по объекту GeoJSON на строку
+                               (osmium export -f geojsonseq);
+
+в том числе сжатые .gz и .bz2. Из PBF сначала делается geojsonseq:
+
+    osmium tags-filter russia.osm.pbf addr:housenumber -o addr.pbf
+    osmium export addr.pbf -f geojsonseq -o addr.geojsonseq
+
+Реестр держится на FTS5 и есть только в базе SQLite.
+"""
+
+import bz2
+import gzip
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from Source.canonical import canonical_key
+from Source.database import models
+from Source.database.models import async_session, write_session
+
+try:
+    from sqlalchemy import text  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover
+    text = None
+
+IMPORT_CHUNK_ROWS = 5000
+
+_HOUSE_RE = re.compile(r"^\d+[а-яa-z]?(?:/\d+[а-яa-z]?)?(?:[кс]\d+)?$")
+_HOUSE_PART_RE = re.compile(r"^(?:к|корп|корпус|с|стр|строение)\d+$")
+_PART_VALUE_RE = re.compile(r"^(?:\d+|[а-яa-z])$")
+_POSTCODE_RE = re.compile(r"^\d{6}$")
+
+# Слова ключа (Source.canonical), которые продолжают номер дома:
+# «10 корпус 2» — дом «10к2», «5 литера а» — дом «5а».
+HOUSE_PART_WORDS = {
+    "корпус": "к", "к": "к", "строение": "с", "с": "с",
+    "литера": "", "литер": "", "лит": "",
+}
+# После них идёт номер квартиры или помещения, а не дома.
+UNIT_WORDS = frozenset(("квартира", "офис", "помещение", "пом"))
+# Тип улицы различает адреса: улица Ленина и проспект Ленина — разные.
+STREET_TYPES = frozenset((
+    "улица", "проспект", "проезд", "переулок", "бульвар", "набережная",
+    "площадь", "шоссе", "тупик", "микрорайон", "территория", "аллея",
+    "линия", "квартал",
+))
+# «Свердловская область», «Пермский край», но «республика Татарстан».
+REGION_TYPES_BEFORE = frozenset(("область", "край", "район", "округ", "ао"))
+REGION_TYPES_AFTER = frozenset(("республика",))
+REGION_TYPES = REGION_TYPES_BEFORE | REGION_TYPES_AFTER
+
+_HOUSE_PARTS = (
+    (re.compile(r"корпус|корп\.?"), "к"),
+    (re.compile(r"строение|стр\.?"), "с"),
+    (re.compile(r"литера|литер|лит\.?"), ""),
+)
+
+
+def house_key(house: str) -> str:
+    """Канонический номер дома: «10 корпус 2» и «10К2» дают «10к2».
+
+    Литера пишется слитно: «5 литера А» — «5а».
+    """
+    key = house.casefold().replace("ё", "е")
+    for pattern, short in _HOUSE_PARTS:
+        key = pattern.sub(short, key)
+    return "".join(key.split())
+
+
+# --- разбор выгрузок ---------------------------------------------------
+
+
+def address_from_tags(tags: Dict[str, str],
+                      lat: float,
+                      lon: float,
+                      region: str = "",
+                      city: str = "") -> Optional[Dict]:
+    """Строка реестра из тегов OSM или None, если это не адрес дома."""
+    house = (tags.get("addr:housenumber") or "").strip()
+    street = (tags.get("addr:street") or tags.get("addr:place") or "").strip()
+    if not (house and street):
+        return None
+    return {
+        "region": (tags.get("addr:region") or tags.get("addr:state")
+                   or tags.get("addr:province") or region).strip(),
+        "city": (tags.get("addr:city") or tags.get("addr:town")
+                 or tags.get("addr:village") or city).strip(),
+        "street": street,
+        "house": house,
+        "house_key": house_key(house),
+        "postcode": (tags.get("addr:postcode") or "").strip() or None,
+        "latitude": float(lat),
+        "longitude": float(lon),
+    }
+
+
+def iter_osm_xml(stream: IO[bytes], region: str = "",
+                 city: str = "") -> Iterator[Dict]:
+    """Адреса из OSM XML; разобранные элементы сразу освобождаются."""
+    events = ElementTree.iterparse(stream, events=("start", "end"))
+    _event, root = next(events)
+    for event, element in events:
+        if event != "end" or element.tag not in ("node", "way", "relation"):
+            continue
+
+        tags = {
+            child.get("k"): child.get("v")
+            for child in element.iter("tag")
+        }
+        if element.tag == "node":
+            lat, lon = element.get("lat"), element.get("lon")
+        else:
+            center = element.find("center")
+            lat = center.get("lat") if center is not None else None
+            lon = center.get("lon") if center is not None else None
+
+        if lat is not None and lon is not None:
+            row = address_from_tags(tags, lat, lon, region, city)
+            if row is not None:
+                yield row
+        # без этого дерево документа росло бы до размера файла
+        root.clear()
+
+
+def _center(geometry: Dict) -> Optional[Tuple[float, float]]:
+    """(lat, lon) точки или середина описанного прямоугольника фигуры."""
+    kind = geometry.get("type")
+    coordinates = geometry.get("coordinates")
+    if not coordinates:
+        return None
+    if kind == "Point":
+        return coordinates[1], coordinates[0]
+
+    points: List = []
+    stack = [coordinates]
+    while stack:
+        item = stack.pop()
+        if item and isinstance(item[0], (int, float)):
+            points.append(item)
+        else:
+            stack.extend(item)
+    if not points:
+        return None
+    lons = [point[0] for point in points]
+    lats = [point[1] for point in points]
+    return (min(lats) + max(lats)) / 2, (min(lons) + max(lons)) / 2
+
+
+def iter_geojson_lines(stream: IO[str], region: str = "",
+                       city: str = "") -> Iterator[Dict]:
+    """Адреса из GeoJSON-объектов, по одному на строку."""
+    for line in stream:
+        # geojsonseq (RFC 8142) начинает запись с символа RS
+        line = line.strip().lstrip("\x1e")
+        if not line:
+            continue
+        try:
+            feature = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(feature, dict):
+            continue
+
+        point = _center(feature.get("geometry") or {})
+        if point is None:
+            continue
+        tags = feature.get("properties") or {}
+        if isinstance(tags.get("tags"), dict):
+            tags = tags["tags"]
+        row = address_from_tags(tags, point[0], point[1], region, city)
+        if row is not None:
+            yield row
+
+
+def detect_format(path: str) -> str:
+    name = path.lower()
+    for suffix in (".gz", ".bz2"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith((".osm", ".xml")):
+        return "xml"
+    if name.endswith((".geojsonseq", ".geojsonl", ".geojson", ".jsonl",
+                      ".ndjson")):
+        return "geojson"
+    raise ValueError(f"Не удалось определить формат файла {path!r}")
+
+
+def _open(path: str, binary: bool):
+    if path == "-":
+        return sys.stdin.buffer if binary else sys.stdin
+    mode = "rb" if binary else "rt"
+    encoding = None if binary else "utf-8"
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding=encoding)
+    if path.endswith(".bz2"):
+        return bz2.open(path, mode, encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+
+def iter_addresses(path: str, fmt: Optional[str] = None, region: str = "",
+                   city: str = "") -> Iterator[Dict]:
+    fmt = fmt or detect_format(path)
+    stream = _open(path, binary=fmt == "xml")
+    try:
+        if fmt == "xml":
+            yield from iter_osm_xml(stream, region, city)
+        else:
+            yield from iter_geojson_lines(stream, region, city)
+    finally:
+        if stream not in (sys.stdin, sys.stdin.buffer):
+            stream.close()
+
+
+# --- импорт ------------------------------------------------------------
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    chunks: int = 0
+    elapsed: float = 0.0
+
+    def format(self) -> str:
+        rate = self.rows / self.elapsed if self.elapsed else 0.0
+        return (
+            f"Импортировано адресов: {self.rows} за {self.elapsed:.1f} с "
+            f"({rate:.0f} адр./с)"
+        )
+
+
+_INSERT_SQL = """
+    INSERT OR IGNORE INTO osm_addresses
+        (region, city, street, house, house_key, postcode,
+         latitude, longitude)
+    VALUES (:region, :city, :street, :house, :house_key, :postcode,
+            :latitude, :longitude)
+"""
+
+
+def _chunks(rows: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk: List[Dict] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def import_addresses(rows: Iterable[Dict],
+                           replace: bool = False,
+                           chunk_rows: int = IMPORT_CHUNK_ROWS) -> ImportStats:
+    """Записывает адреса пачками и перестраивает полнотекстовый индекс."""
+    if not models.IS_SQLITE:
+        raise ValueError("Локальный реестр OSM поддерживается только в SQLite")
+    stats = ImportStats()
+    started = time.perf_counter()
+    if replace:
+        async with write_session() as session:
+            await session.execute(text("DELETE FROM osm_addresses"))
+            await session.commit()
+
+    for chunk in _chunks(rows, chunk_rows):
+        async with write_session() as session:
+            await session.execute(text(_INSERT_SQL), chunk)
+            await session.commit()
+        stats.rows += len(chunk)
+        stats.chunks += 1
+
+    async with write_session() as session:
+        await session.execute(text(
+            "INSERT INTO osm_addresses_fts(osm_addresses_fts) "
+            "VALUES ('rebuild')"))
+        await session.commit()
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+async def import_osm(path: str,
+                     fmt: Optional[str] = None,
+                     region: str = "",
+                     city: str = "",
+                     replace: bool = False) -> ImportStats:
+    """Импорт файла выгрузки OSM в локальный реестр адресов."""
+    return await import_addresses(
+        iter_addresses(path, fmt, region, city), replace=replace)
+
+
+# --- поиск -------------------------------------------------------------
+
+
+@dataclass
+class OfflineMatch:
+    full_address: str
+    latitude: float
+    longitude: float
+    components: Optional[Dict[str, Optional[str]]] = None
+
+
+@dataclass
+class QueryParts:
+    """Разбор адресной строки для поиска в реестре."""
+
+    house: Optional[str]
+    # типы улицы из запроса: «улица», «переулок»
+    street_types: List[str]
+    # названия улицы и населённого пункта
+    words: List[str]
+    # слова при «область», «край», «республика»
+    region_words: List[str]
+
+
+def parse_query(query: str) -> QueryParts:
+    """Номер дома (с корпусом, строением, литерой) и слова запроса.
+
+    Строка приводится к ключу кэша (Source.canonical): сокращения
+    раскрыты, «г», «д» и «Россия» выброшены. Номером дома считается
+    последнее похожее на него число — «улица 8 Марта 10» это дом 10.
+    """
+    tokens = canonical_key(query).split()
+    at = None
+    for index, token in enumerate(tokens):
+        previous = tokens[index - 1] if index else ""
+        if (_HOUSE_RE.match(token) and not _POSTCODE_RE.match(token)
+                and previous not in HOUSE_PART_WORDS
+                and previous not in UNIT_WORDS):
+            at = index
+
+    house = None
+    used = set()
+    if at is not None:
+        house, used = tokens[at], {at}
+        index = at + 1
+        while index < len(tokens):
+            token = tokens[index]
+            following = tokens[index + 1] if index + 1 < len(tokens) else ""
+            if _HOUSE_PART_RE.match(token):
+                house += token
+                used.add(index)
+                index += 1
+            elif token in HOUSE_PART_WORDS and _PART_VALUE_RE.match(following):
+                house += HOUSE_PART_WORDS[token] + following
+                used.update((index, index + 1))
+                index += 2
+            else:
+                break
+        house = house_key(house)
+
+    parts = QueryParts(house, [], [], [])
+    for index, token in enumerate(tokens):
+        previous = tokens[index - 1] if index else ""
+        following = tokens[index + 1] if index + 1 < len(tokens) else ""
+        if (index in used or token in UNIT_WORDS or previous in UNIT_WORDS
+                or token in REGION_TYPES or _POSTCODE_RE.match(token)):
+            continue
+        if token in STREET_TYPES:
+            parts.street_types.append(token)
+        elif (following in REGION_TYPES_BEFORE
+                or previous in REGION_TYPES_AFTER):
+            parts.region_words.append(token)
+        else:
+            parts.words.append(token)
+    return parts
+
+
+def _full_address(row) -> str:
+    street_house = f"{row.street} {row.house}"
+    parts = [row.region, row.city, street_house, row.postcode]
+    return ", ".join(part for part in parts if part)
+
+
+def _row_matches(row, parts: QueryParts) -> bool:
+    """Подходит ли дом реестра к разобранному запросу.
+
+    Все слова названия улицы должны быть в запросе, тип улицы — совпасть,
+    если указан. Остальные слова запроса должны найтись в городе или
+    регионе строки: «Пермь Ленина 10» не отвечается домом из Екатеринбурга.
+    """
+    street = canonical_key(row.street).split()
+    row_types = {word for word in street if word in STREET_TYPES}
+    row_names = [word for word in street if word not in STREET_TYPES]
+    if row_types and not set(parts.street_types) <= row_types:
+        return False
+    if not row_names or not set(row_names) <= set(parts.words):
+        return False
+
+    place = set(canonical_key(f"{row.city} {row.region}").split())
+    if any(word not in place for word in parts.words
+           if word not in row_names):
+        return False
+    # регион проверяется, только если он известен строке реестра
+    region = set(canonical_key(row.region or "").split())
+    return not region or all(word in region for word in parts.region_words)
+
+
+async def find_offline_address(query: str) -> Optional[OfflineMatch]:
+    """Дом из локального реестра или None.
+
+    Номер дома вместе с корпусом и строением должен совпасть точно,
+    улица, её тип, город и регион проверяются _row_matches(). Если
+    подходят дома на разных улицах или в разных городах, ответа нет:
+    лучше спросить Nominatim, чем закэшировать чужой адрес.
+    """
+    if async_session is None or not models.IS_SQLITE:
+        return None
+    parts = parse_query(query)
+    if parts.house is None or not parts.words:
+        return None
+
+    words_expr = " OR ".join(f'"{word}"' for word in parts.words)
+    match = f'house_key : "{parts.house}" AND street : ({words_expr})'
+    async with async_session() as session:
+        rows = (await session.execute(
+            text(
+                "SELECT o.region, o.city, o.street, o.house, o.postcode, "
+                "o.latitude, o.longitude "
+                "FROM osm_addresses_fts "
+                "JOIN osm_addresses AS o ON o.id = osm_addresses_fts.rowid "
+                "WHERE osm_addresses_fts MATCH :match AND o.house_key = :house "
+                "ORDER BY bm25(osm_addresses_fts, 10.0, 3.0, 1.0, 0.0) "
+                "LIMIT 50"
+            ),
+            {"match": match, "house": parts.house},
+        )).all()
+
+    matches = [row for row in rows if _row_matches(row, parts)]
+    places = {(row.region, row.city, row.street) for row in matches}
+    if len(places) != 1:
+        return None
+    row = matches[0]
+    return OfflineMatch(
+        _full_address(row), float(row.latitude), float(row.longitude),
+        components={
+            "region": row.region or None, "city": row.city or None,
+            "street": row.street, "house": row.house,
+            "postcode": row.postcode,
+        })
@@ -1,39 +1,430 @@
-from typing import Optional
+import math
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 
-from Source.database.models import async_session, Address
+from Source.canonical import canonical_key
+from Source.database.memory_cache import memory_cache
+from Source.database import models
+from Source.database.models import (Address, address_rtree, async_session,
+                                    upsert, utcnow, write_session)
+from Source.database.offline_index import parse_query
+from Source.database.write_behind import Hits, WriteBehindBuffer
+from Source.metrics import metrics
+from Source.utils import METERS_PER_DEGREE, distance_m, env_number
 
 try:
-    from sqlalchemy import select, insert # type: ignore
+    from sqlalchemy import (bindparam, case, func, or_,  # type: ignore
+                            select, text, update)
 except ModuleNotFoundError:
     select = None
 
 
+# Порог сходства (0..1) для нечёткого поиска в кэше: ответ берётся, если
+# сходство выше него; 0 — не искать.
+FUZZY_THRESHOLD: float = env_number("GEOCODER_FUZZY_THRESHOLD", 0.75)
+FUZZY_CANDIDATES = 20
+
+
+class CacheStats:
+    """Счётчик попаданий в кэш SQLite."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.fuzzy_hits = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def format(self) -> str:
+        return (
+            f"Кэш SQLite: попаданий {self.hits} из {self.lookups} "
+            f"({self.hit_rate:.1%}), нечётких совпадений {self.fuzzy_hits}"
+        )
+
+
+cache_stats = CacheStats()
+
+
+def cache_key(query: str) -> str:
+    """Ключ кэша: регистр, ё, пунктуация и сокращения не учитываются."""
+    return canonical_key(query)
+
+
+def coordinate_key(lat: float, lon: float, precision: int) -> str:
+    """Ключ кэша точки: координаты на сетке из precision знаков.
+
+    Точки, различающиеся дальше precision-го знака, получают один ключ.
+    canonical_key здесь не подходит: она разрезает числа по точке и
+    теряет знак.
+    """
+    # + 0.0 превращает -0.0 в 0.0, иначе у нуля было бы два ключа
+    return " ".join(
+        f"{round(value, precision) + 0.0:.{precision}f}"
+        for value in (lat, lon))
+
+
 async def _get_session():
     if async_session is None:
         return None
     return async_session()
 
 
-async def return_address_if_exist(full_address: str) -> Optional[Address]:
+async def return_address_if_exist(
+        query: str, key: Optional[str] = None) -> Optional[Address]:
+    """Ищет адрес по исходному запросу или по строке, нормализованной DaData.
+
+    Сначала проверяется кэш в памяти, затем SQLite; точное совпадение
+    исходного запроса приоритетнее. Каждое попадание увеличивает
+    hit_count найденной строки. key — готовый ключ (для координат),
+    по умолчанию cache_key(query).
+    """
+    key = key or cache_key(query)
+    remembered = memory_cache.get(key)
+    if remembered is not None:
+        metrics.count("cache_lookups", tier="memory", result="hit")
+        await _record_hit(remembered)
+        return remembered
+
+    buffered = write_buffer.get(key)
+    if buffered is not None:
+        metrics.count("cache_lookups", tier="write_buffer", result="hit")
+        cache_stats.hits += 1
+        address = Address(**buffered)
+        memory_cache.set(key, address)
+        await _record_hit(address)
+        return address
+
+    if async_session is None:
+        return None
+
     async with async_session() as session:
-        stmt = select(Address).where(Address.full_address == full_address)
+        stmt = (
+            select(Address)
+            .where(or_(Address.query_key == key,
+                       Address.normalized_key == key))
+            .order_by(case((Address.query_key == key, 0), else_=1))
+            .limit(1)
+        )
         result = await session.execute(stmt)
-        return result.scalar_one_or_none()
+        address = result.scalars().first()
+
+    metrics.count("cache_lookups", tier="sqlite",
+                  result="miss" if address is None else "hit")
+    if address is None:
+        cache_stats.misses += 1
+    else:
+        cache_stats.hits += 1
+        memory_cache.set(key, address)
+        await _record_hit(address)
+    return address
+
+
+# Окончания порядковых числительных: «3-я» в ключе — «3 я».
+_ORDINAL_ENDINGS = frozenset(("я", "й", "е", "ая", "ий", "ый", "ой", "го"))
+
+
+def _profile(key: str) -> Tuple[Optional[str], FrozenSet[str],
+                                Tuple[str, ...], str]:
+    """Номер дома с корпусом, типы улицы, числа и слова названий.
+
+    Числа в названиях («3-я Парковая», «8 Марта», «1 линия») отделяются
+    от слов, окончание порядкового числительного отбрасывается.
+    """
+    parts = parse_query(key)
+    numbers: List[str] = []
+    words: List[str] = []
+    after_number = False
+    for word in parts.words + parts.region_words:
+        if any(char.isdigit() for char in word):
+            numbers.append(word)
+            after_number = True
+            continue
+        if not (after_number and word in _ORDINAL_ENDINGS):
+            words.append(word)
+        after_number = False
+    return (parts.house, frozenset(parts.street_types),
+            tuple(sorted(numbers)), " ".join(sorted(words)))
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(first: str, second: str) -> float:
+    """Сходство двух запросов от 0 до 1.
+
+    Порядок слов и «г», «д» не учитываются. Номер дома вместе с
+    корпусом, строением и литерой и числа в названиях должны совпасть
+    точно, тип улицы — тоже, если он есть в обоих запросах; названия
+    сравниваются по триграммам.
+    """
+    house_a, types_a, numbers_a, words_a = _profile(first)
+    house_b, types_b, numbers_b, words_b = _profile(second)
+    if house_a != house_b or numbers_a != numbers_b:
+        return 0.0
+    if not (words_a and words_b):
+        return 0.0
+    if types_a and types_b and types_a != types_b:
+        return 0.0
+    if words_a == words_b:
+        return 1.0
+    trigrams_a, trigrams_b = _trigrams(words_a), _trigrams(words_b)
+    return len(trigrams_a & trigrams_b) / len(trigrams_a | trigrams_b)
+
+
+def _best_match(key: str, candidates, threshold: float):
+    best, best_score = None, threshold
+    for candidate in candidates:
+        for candidate_key in (candidate.query_key, candidate.normalized_key):
+            if not candidate_key:
+                continue
+            score = similarity(key, candidate_key)
+            # порог нужно превысить, а не только достичь
+            if score > best_score:
+                best, best_score = candidate, score
+    return best
+
+
+async def find_similar_address(
+        query: str, threshold: Optional[float] = None) -> Optional[Address]:
+    """Адрес из кэша для почти такого же запроса или None.
+
+    Кандидаты отбираются по триграммному индексу ключей кэша (и среди
+    ещё не записанных строк), затем сравниваются функцией similarity().
+    """
+    threshold = FUZZY_THRESHOLD if threshold is None else threshold
+    if async_session is None or threshold <= 0:
+        return None
+
+    key = cache_key(query)
+    terms = [word for word in parse_query(key).words if len(word) >= 3]
+    if not terms:
+        return None
+
+    async with async_session() as session:
+        candidates = await _fuzzy_candidates(session, key, terms)
+
+    candidates += [
+        Address(**row) for row in write_buffer.rows()
+        if any(term in row["query_key"] or term in (row["normalized_key"] or "")
+               for term in terms)
+    ]
+
+    best = _best_match(key, candidates, threshold)
+    metrics.count("cache_lookups", tier="fuzzy",
+                  result="miss" if best is None else "hit")
+    if best is not None:
+        cache_stats.fuzzy_hits += 1
+        await _record_hit(best)
+    return best
+
+
+def _trigram_candidates(key: str, terms: List[str]):
+    """Кандидаты в PostgreSQL без FTS5.
+
+    LIKE '%слово%' обслуживают триграммные GIN-индексы pg_trgm; первыми
+    идут ключи, ближайшие к запросу по similarity().
+    """
+    normalized = func.coalesce(Address.normalized_key, "")
+    return (
+        select(Address)
+        .where(or_(*(
+            column.contains(term)
+            for term in terms
+            for column in (Address.query_key, Address.normalized_key)
+        )))
+        .order_by(func.greatest(
+            func.similarity(Address.query_key, key),
+            func.similarity(normalized, key),
+        ).desc())
+        .limit(FUZZY_CANDIDATES)
+    )
+
+
+async def _fuzzy_candidates(session, key: str,
+                            terms: List[str]) -> List[Address]:
+    if not models.IS_SQLITE:
+        return list((await session.execute(
+            _trigram_candidates(key, terms))).scalars().all())
+
+    match = " OR ".join(f'"{term}"' for term in terms)
+    ids = (await session.execute(
+        text(
+            "SELECT rowid FROM addresses_fts "
+            "WHERE addresses_fts MATCH :match "
+            "ORDER BY bm25(addresses_fts) LIMIT :limit"
+        ),
+        {"match": match, "limit": FUZZY_CANDIDATES},
+    )).scalars().all()
+    if not ids:
+        return []
+    return list((await session.execute(
+        select(Address).where(Address.id.in_(ids))
+    )).scalars().all())
+
+
+async def _record_hit(address: Address) -> None:
+    if getattr(address, "query_key", None) and write_session is not None:
+        await write_buffer.hit(address.query_key, utcnow())
+
+
+def _upsert_addresses():
+    """INSERT строк кэша; известный query_key обновляется на месте."""
+    stmt = upsert(Address)
+    return stmt.on_conflict_do_update(
+        index_elements=["query_key"],
+        set_={
+            "full_address": stmt.excluded.full_address,
+            "latitude": stmt.excluded.latitude,
+            "longitude": stmt.excluded.longitude,
+            "normalized_key": func.coalesce(
+                stmt.excluded.normalized_key, Address.normalized_key),
+        },
+    )
+
+
+async def _write_rows(rows: List[Dict], hits: Hits) -> None:
+    """Записывает пачку строк и попаданий одной транзакцией.
+
+    Строка с уже известным query_key обновляется на месте (upsert), так
+    что повторный промах не создаёт дубликат.
+    """
+    with metrics.stage("db_flush"):
+        async with write_session() as session:
+            if rows:
+                await session.execute(_upsert_addresses(), rows)
+            if hits:
+                table = Address.__table__
+                await session.execute(
+                    update(table)
+                    .where(table.c.query_key == bindparam("key"))
+                    .values(
+                        hit_count=table.c.hit_count + bindparam("count"),
+                        last_hit_at=bindparam("at"),
+                    ),
+                    [
+                        {"key": key, "count": count, "at": at}
+                        for key, (count, at) in hits.items()
+                    ],
+                )
+            await session.commit()
+
+
+# Новые строки кэша копятся в памяти и пишутся пачками: один fsync
+# на GEOCODER_WRITE_BATCH_ROWS строк или на GEOCODER_WRITE_BATCH_MS мс.
+write_buffer = WriteBehindBuffer(
+    _write_rows,
+    flush_rows=int(env_number("GEOCODER_WRITE_BATCH_ROWS", 100)),
+    flush_interval=env_number("GEOCODER_WRITE_BATCH_MS", 200) / 1000,
+    max_rows=int(env_number("GEOCODER_WRITE_BUFFER_MAX", 10000)),
+)
 
 
 async def add_new_address(input_query: str,
                           full_address: str,
                           lat: str,
-                          lon: str) -> None:
-    """Сохраняем только нормализованный адрес и координаты.
+                          lon: str,
+                          normalized_query: Optional[str] = None,
+                          query_key: Optional[str] = None) -> None:
+    """Сохраняет результат под ключом исходного запроса.
 
-    input_query оставляем в сигнатуре для совместимости, но в БД не пишем.
+    Строка попадает в буфер отложенной записи и сразу видна при поиске.
+    Если запрос уже есть в кэше, строка обновляется, а не дублируется.
+    query_key — готовый ключ вместо cache_key(input_query).
     """
-    async with async_session() as session:
-        stmt = insert(Address).values(
-            full_address=full_address,
-            latitude=lat,
-            longitude=lon,
+    if write_session is None:
+        return
+
+    values = dict(
+        input_query=input_query,
+        query_key=query_key or cache_key(input_query),
+        normalized_key=(
+            cache_key(normalized_query) if normalized_query else None),
+        full_address=full_address,
+        latitude=float(lat),
+        longitude=float(lon),
+        hit_count=0,
+        created_at=utcnow(),
+    )
+    await write_buffer.add(values)
+
+    address = Address(**values)
+    memory_cache.set(values["query_key"], address)
+    if values["normalized_key"]:
+        memory_cache.set(values["normalized_key"], address)
+
+
+# Буферы других таблиц (отрицательный кэш) сбрасываются вместе с этим.
+_buffers: List[WriteBehindBuffer] = [write_buffer]
+
+
+def register_buffer(buffer: WriteBehindBuffer) -> WriteBehindBuffer:
+    """Добавляет буфер к тем, что сохраняет flush_pending_writes()."""
+    _buffers.append(buffer)
+    return buffer
+
+
+async def flush_pending_writes() -> None:
+    """Сохраняет всё, что ещё лежит в буферах (вызывать перед выходом)."""
+    for buffer in _buffers:
+        await buffer.flush()
+
+
+async def find_nearest_address(lat: float,
+                               lon: float,
+                               radius_m: float) -> Optional[Address]:
+    """Ближайший адрес из кэша не дальше radius_m метров от точки.
+
+    Кандидаты отбираются в описанном квадрате (в SQLite по R*Tree, в
+    PostgreSQL по индексу координат), точное расстояние считается уже
+    для них.
+    """
+    if async_session is None or radius_m <= 0:
+        return None
+
+    d_lat = radius_m / METERS_PER_DEGREE
+    d_lon = radius_m / (
+        METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    if models.IS_SQLITE:
+        stmt = (
+            select(Address)
+            .join(address_rtree, address_rtree.c.id == Address.id)
+            .where(
+                address_rtree.c.max_lat >= lat - d_lat,
+                address_rtree.c.min_lat <= lat + d_lat,
+                address_rtree.c.max_lon >= lon - d_lon,
+                address_rtree.c.min_lon <= lon + d_lon,
+            )
+        )
+    else:
+        stmt = select(Address).where(
+            Address.latitude.between(lat - d_lat, lat + d_lat),
+            Address.longitude.between(lon - d_lon, lon + d_lon),
         )
-        await session.execute(stmt)
-        await session.commit()
+    async with async_session() as session:
+        candidates = (await session.execute(stmt.limit(64))).scalars().all()
+
+    # ещё не записанные строки тоже участвуют в поиске
+    candidates = list(candidates) + [
+        Address(**row) for row in write_buffer.rows()
+        if abs(row["latitude"] - lat) <= d_lat
+        and abs(row["longitude"] - lon) <= d_lon
+    ]
+
+    best, best_distance = None, radius_m
+    for candidate in candidates:
+        distance = distance_m(
+            lat, lon, candidate.latitude, candidate.longitude)
+        if distance <= best_distance:
+            best, best_distance = candidate, distance
+    metrics.count("cache_lookups", tier="nearby",
+                  result="miss" if best is None else "hit")
+    if best is not None:
+        await _record_hit(best)
+    return best
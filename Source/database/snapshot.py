@@ -0,0 +1,229 @@
+"""Снимок кэша адресов для прогрева нового узла.
+
+Файл — JSON по строкам, сжатый gzip. Первая строка — заголовок:
+
+    {"format": "geocoder-cache", "version": 1, "key_version": 1,
+     "columns": ["input_query", ...], "exported_at": "..."}
+
+дальше по массиву значений на строку в порядке columns. Выгрузка идёт
+порциями по id, поэтому память не зависит от размера кэша.
+
+Загрузка выполняется одной транзакцией: триггеры R*Tree и FTS и
+индексы снимаются, строки вставляются пачками, затем индексы строятся
+заново за один проход. Уже известные узлу запросы не перезаписываются.
+
+Снимки нужны только узлам с SQLite: узлы с общей базой PostgreSQL
+видят кэш друг друга и так.
+"""
+
+import gzip
+import json
+import time
+from dataclasses import dataclass
+from typing import IO, Dict, Iterator, List, Tuple
+
+from Source.canonical import canonical_key
+from Source.database import models
+from Source.database.requests import flush_pending_writes
+
+try:
+    from sqlalchemy import text  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover
+    text = None
+
+SNAPSHOT_FORMAT = "geocoder-cache"
+SNAPSHOT_VERSION = 1
+
+COLUMNS = (
+    "input_query", "query_key", "normalized_key", "full_address",
+    "latitude", "longitude", "hit_count", "created_at", "last_hit_at",
+)
+
+# Уровень 9 (по умолчанию у gzip) вдвое медленнее при почти том же размере.
+COMPRESS_LEVEL = 6
+EXPORT_CHUNK_ROWS = 10000
+IMPORT_CHUNK_ROWS = 20000
+
+
+@dataclass
+class SnapshotStats:
+    action: str
+    rows: int = 0
+    read: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+
+    def format(self) -> str:
+        rate = self.rows / self.elapsed if self.elapsed else 0.0
+        skipped = f", пропущено {self.skipped}" if self.skipped else ""
+        return (
+            f"{self.action} адресов: {self.rows}{skipped} "
+            f"за {self.elapsed:.1f} с ({rate:.0f} адр./с)"
+        )
+
+
+def _require_sqlite() -> None:
+    if not models.IS_SQLITE:
+        raise ValueError("Снимки кэша поддерживаются только для базы SQLite")
+
+
+async def export_cache(path: str) -> SnapshotStats:
+    """Выгружает кэш адресов в сжатый файл снимка."""
+    _require_sqlite()
+    stats = SnapshotStats("Выгружено")
+    started = time.perf_counter()
+    await flush_pending_writes()
+
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "key_version": models.KEY_VERSION,
+        "columns": list(COLUMNS),
+        "exported_at": models.utcnow().isoformat(sep=" "),
+    }
+    # text() без типов отдаёт значения как есть: даты уходят в файл той
+    # же строкой, какой лежат в SQLite, без разбора в datetime и обратно
+    query = text(
+        f"SELECT id, {', '.join(COLUMNS)} FROM addresses "
+        "WHERE id > :last_id ORDER BY id LIMIT :limit")
+    # json.dumps с параметрами на каждый вызов собирает новый кодировщик
+    encode = json.JSONEncoder(
+        ensure_ascii=False, separators=(",", ":")).encode
+    with gzip.open(path, "wt", encoding="utf-8",
+                   compresslevel=COMPRESS_LEVEL) as out:
+        out.write(json.dumps(header, ensure_ascii=False) + "\n")
+        last_id = 0
+        while True:
+            async with models.async_session() as session:
+                rows = (await session.execute(
+                    query, {"last_id": last_id, "limit": EXPORT_CHUNK_ROWS}
+                )).all()
+            if not rows:
+                break
+            out.write("\n".join(encode(tuple(row)[1:]) for row in rows))
+            out.write("\n")
+            stats.rows += len(rows)
+            last_id = rows[-1][0]
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def read_header(stream: IO[str]) -> Dict:
+    """Заголовок снимка; ValueError, если файл не снимок или слишком новый."""
+    try:
+        header = json.loads(stream.readline())
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError("Файл не является снимком кэша геокодера")
+    version = header.get("version")
+    if not isinstance(version, int) or version > SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Снимок версии {version} не поддерживается "
+            f"(поддерживается до {SNAPSHOT_VERSION})")
+    return header
+
+
+def iter_rows(stream: IO[str], header: Dict,
+              stats: SnapshotStats) -> Iterator[Tuple]:
+    """Строки снимка в порядке COLUMNS; битые строки пропускаются."""
+    names: List[str] = header.get("columns") or list(COLUMNS)
+    positions = [names.index(name) if name in names else None
+                 for name in COLUMNS]
+    same_order = positions == list(range(len(COLUMNS)))
+    rekey = header.get("key_version", 0) < models.KEY_VERSION
+    width = len(names)
+    for line in stream:
+        stats.read += 1
+        try:
+            values = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(values, list) or len(values) != width:
+            continue
+        if not same_order:
+            values = [None if index is None else values[index]
+                      for index in positions]
+        (input_query, query_key, normalized_key, full_address,
+         latitude, longitude, hit_count, created_at, last_hit_at) = values
+        if not (full_address and isinstance(latitude, (int, float))
+                and isinstance(longitude, (int, float))):
+            continue
+        if rekey:
+            # снимок со старого узла: ключи строились прежней нормализацией
+            query_key = query_key and canonical_key(query_key)
+            normalized_key = normalized_key and canonical_key(normalized_key)
+        yield (input_query, query_key, normalized_key, full_address,
+               latitude, longitude, hit_count or 0, created_at, last_hit_at)
+
+
+def _chunks(rows: Iterator[Tuple], size: int) -> Iterator[List[Tuple]]:
+    chunk: List[Tuple] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _load(connection, rows: Iterator[Tuple], replace: bool,
+          chunk_rows: int) -> Tuple[int, int]:
+    """Вставляет строки; возвращает (строк было, строк стало)."""
+    count = text("SELECT count(*) FROM addresses")
+    before = 0 if replace else connection.execute(count).scalar()
+    # в пустую таблицу можно грузить совсем без индексов
+    bulk = replace or before == 0
+    models.drop_address_indexes(connection, keep_unique=not bulk)
+    if replace:
+        connection.execute(text("DELETE FROM addresses"))
+
+    # мимо компилятора SQLAlchemy: executemany драйвера на кортежах
+    insert_sql = (
+        f"INSERT OR IGNORE INTO addresses ({', '.join(COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(COLUMNS))})")
+    for chunk in _chunks(rows, chunk_rows):
+        connection.exec_driver_sql(insert_sql, chunk)
+
+    if bulk:
+        # уникального индекса не было — повторы ключей убираются здесь
+        connection.execute(text(
+            """
+            DELETE FROM addresses
+            WHERE query_key IS NOT NULL AND id NOT IN (
+                SELECT min(id) FROM addresses
+                WHERE query_key IS NOT NULL GROUP BY query_key
+            )
+            """
+        ))
+    models.rebuild_address_indexes(connection)
+    return before, connection.execute(count).scalar()
+
+
+async def import_cache(path: str,
+                       replace: bool = False,
+                       chunk_rows: int = IMPORT_CHUNK_ROWS) -> SnapshotStats:
+    """Загружает снимок в кэш этого узла одной транзакцией.
+
+    replace=True сначала очищает кэш. Иначе строки с уже известным
+    query_key пропускаются.
+    """
+    _require_sqlite()
+    stats = SnapshotStats("Загружено")
+    started = time.perf_counter()
+    await flush_pending_writes()
+
+    with gzip.open(path, "rt", encoding="utf-8") as stream:
+        header = read_header(stream)
+        rows = iter_rows(stream, header, stats)
+        async with models.engine.begin() as connection:
+            before, after = await connection.run_sync(
+                _load, rows, replace, chunk_rows)
+
+    # пропущены битые строки и запросы, которые узел уже знал
+    stats.rows = after - before
+    stats.skipped = stats.read - stats.rows
+    stats.elapsed = time.perf_counter() - started
+    return stats
@@ -0,0 +1,158 @@
+"""Отложенная запись новых строк кэша пачками (group commit)."""
+
+import asyncio
+from typing import (Any, Awaitable, Callable, Dict, Iterator, List, Optional,
+                    Tuple)
+
+Row = Dict
+# query_key -> (сколько попаданий накоплено, время последнего)
+Hits = Dict[str, Tuple[int, Any]]
+Writer = Callable[[List[Row], Hits], Awaitable[None]]
+
+
+class WriteBehindBuffer:
+    """Копит строки и попадания в кэш и записывает их одной транзакцией.
+
+    Сброс происходит, когда набирается flush_rows изменений или проходит
+    flush_interval секунд с первого несохранённого; попадания при
+    чтении пишутся только в фоне. Если в буфере
+    max_rows строк, add() ждёт окончания записи. Пока строка не
+    сохранена, её можно найти через get(); новая строка с тем же
+    query_key заменяет несохранённую.
+    """
+
+    def __init__(self,
+                 writer: Writer,
+                 flush_rows: int = 100,
+                 flush_interval: float = 0.2,
+                 max_rows: int = 10000,
+                 label: str = "адреса") -> None:
+        self._writer = writer
+        self.label = label
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.max_rows = max(self.flush_rows, max_rows)
+        self._pending: Dict[str, Row] = {}
+        self._in_flight: Dict[str, Row] = {}
+        self._by_normalized: Dict[str, str] = {}
+        self._hits: Hits = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._background: Optional[asyncio.Future] = None
+        self._lock: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Lock]] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._in_flight)
+
+    @property
+    def _changes(self) -> int:
+        return len(self._pending) + len(self._hits)
+
+    def get(self, key: str) -> Optional[Row]:
+        """Несохранённая строка по query_key или normalized_key."""
+        for rows in (self._pending, self._in_flight):
+            row = rows.get(key)
+            if row is not None:
+                return row
+        query_key = self._by_normalized.get(key)
+        if query_key is not None:
+            return self._pending.get(query_key) or self._in_flight.get(
+                query_key)
+        return None
+
+    def rows(self) -> Iterator[Row]:
+        yield from list(self._in_flight.values())
+        yield from list(self._pending.values())
+
+    async def add(self, row: Row) -> None:
+        if len(self) >= self.max_rows:
+            await self.flush()
+
+        query_key = row["query_key"]
+        # новый результат для того же ключа заменяет несохранённый
+        self._pending[query_key] = row
+        if row.get("normalized_key"):
+            self._by_normalized[row["normalized_key"]] = query_key
+        await self._schedule()
+
+    async def hit(self, query_key: str, at: Any) -> None:
+        """Учитывает попадание в кэш по строке с этим query_key.
+
+        Вызывается на пути чтения, поэтому запись не ждёт и не бросает
+        исключений: пачка сохраняется в фоне.
+        """
+        count, _last = self._hits.get(query_key, (0, None))
+        self._hits[query_key] = (count + 1, at)
+        await self._schedule(wait=False)
+
+    async def _schedule(self, wait: bool = True) -> None:
+        loop = asyncio.get_running_loop()
+        if self._changes >= self.flush_rows:
+            if wait:
+                await self.flush()
+                return
+            if not self._flushing_in_background(loop):
+                self._flush_in_background()
+                return
+        if self._timer is None or self._timer_loop is not loop:
+            # таймер прошлого (уже закрытого) loop не сработает
+            self._timer = loop.call_later(
+                self.flush_interval, self._flush_in_background)
+            self._timer_loop = loop
+
+    def _flushing_in_background(self, loop) -> bool:
+        task = self._background
+        return (task is not None and not task.done()
+                and task.get_loop() is loop)
+
+    def _flush_in_background(self) -> None:
+        self._timer = None
+        self._background = asyncio.ensure_future(self._safe_flush())
+
+    async def _safe_flush(self) -> None:
+        try:
+            await self.flush()
+        except Exception as exc:  # noqa: BLE001
+            print(f"[БД] Не удалось сохранить {self.label}: {exc}")
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock[0] is not loop:
+            self._lock = (loop, asyncio.Lock())
+        return self._lock[1]
+
+    async def flush(self) -> None:
+        """Записывает всё накопленное одной транзакцией."""
+        async with self._get_lock():
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._changes:
+                return
+
+            self._in_flight, self._pending = self._pending, {}
+            hits, self._hits = self._hits, {}
+            try:
+                await self._writer(list(self._in_flight.values()), hits)
+            except BaseException:
+                # вернём изменения в буфер, чтобы не потерять их при отмене;
+                # добавленное во время записи новее
+                self._in_flight.update(self._pending)
+                self._pending = self._in_flight
+                for key, (count, at) in self._hits.items():
+                    old_count, _old_at = hits.get(key, (0, None))
+                    hits[key] = (old_count + count, at)
+                self._hits = hits
+                raise
+            else:
+                self.flushes += 1
+                self.rows_written += len(self._in_flight)
+                for row in self._in_flight.values():
+                    normalized = row.get("normalized_key")
+                    if (normalized and self._by_normalized.get(normalized)
+                            == row["query_key"]):
+                        del self._by_normalized[normalized]
+            finally:
+                self._in_flight = {}
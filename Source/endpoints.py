@@ -0,0 +1,202 @@
+"""Несколько экземпляров одного внешнего сервиса (зеркала Nominatim).
+
+Для каждого экземпляра запоминаются задержки последних ответов и доля
+ошибок. Запрос уходит туда, где ожидаемая задержка с поправкой на
+ошибки и уже идущие запросы меньше всего; экземпляр без статистики
+опрашивается первым, а каждый EXPLORE_EVERY-й запрос идёт на давно не
+использованный — так упавшее зеркало получает шанс вернуться.
+
+Если ответа нет дольше p95 (GEOCODER_HEDGE_QUANTILE) обычной задержки
+выбранного экземпляра, тот же запрос отправляется на следующий по
+качеству (hedged request); берётся первый успешный ответ, второй
+запрос отменяется.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import (Awaitable, Callable, Deque, Iterable, List, Optional,
+                    Set, TypeVar)
+
+from Source.metrics import metrics
+from Source.utils import NOMINATIM_URLS, env_number
+
+T = TypeVar("T")
+
+# Сколько последних запросов учитывается в задержке и доле ошибок.
+WINDOW = 100
+# Сглаживание средней задержки: вес нового ответа.
+EWMA_ALPHA = 0.2
+# Задержка экземпляра, который ещё ни разу не ответил успешно, с.
+UNKNOWN_LATENCY = 1.0
+EXPLORE_EVERY = 20
+
+# Порог дублирующего запроса: квантиль задержек выбранного экземпляра
+# (0 — не дублировать), но не меньше HEDGE_MIN_MS. Пока ответов меньше
+# HEDGE_MIN_SAMPLES, порог — HEDGE_DEFAULT_MS.
+HEDGE_QUANTILE: float = env_number("GEOCODER_HEDGE_QUANTILE", 0.95)
+HEDGE_MIN_MS: float = env_number("GEOCODER_HEDGE_MIN_MS", 20.0)
+HEDGE_DEFAULT_MS: float = env_number("GEOCODER_HEDGE_DEFAULT_MS", 1000.0)
+HEDGE_MIN_SAMPLES = 10
+
+
+def _succeeded(response) -> bool:
+    # httpx.Response; 4xx — ответ по существу, его не перепрашиваем
+    return getattr(response, "status_code", 500) < 500 and (
+        getattr(response, "status_code", 500) != 429)
+
+
+class Endpoint:
+    """Экземпляр сервиса и статистика его ответов."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip("/")
+        self.latencies: Deque[float] = deque(maxlen=WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=WINDOW)
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.last_used = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def score(self) -> float:
+        """Ожидаемая задержка с поправкой на ошибки и очередь."""
+        if not self.outcomes and not self.in_flight:
+            return 0.0
+        latency = UNKNOWN_LATENCY if self.latency is None else self.latency
+        return latency * (1 + self.in_flight) / max(0.05, 1 - self.error_rate)
+
+    def record(self, elapsed: float, ok: bool) -> None:
+        self.outcomes.append(ok)
+        if not ok:
+            # быстрый отказ не делает экземпляр быстрым
+            self.errors += 1
+            return
+        self.latencies.append(elapsed)
+        self.latency = elapsed if self.latency is None else (
+            EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.latency)
+
+    def format(self) -> str:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        timing = (f"p50 {p50 * 1000:.0f} мс, p95 {p95 * 1000:.0f} мс"
+                  if p50 is not None else "ответов нет")
+        return (f"{self.url}: {self.requests} запр., {timing}, "
+                f"ошибок {self.error_rate:.0%}, дублей {self.hedges}")
+
+
+class EndpointPool:
+    """Выбор экземпляра сервиса и дублирование медленных запросов."""
+
+    def __init__(self, name: str, urls: Iterable[str]) -> None:
+        self.name = name
+        self.endpoints: List[Endpoint] = [Endpoint(url) for url in urls]
+        self._counter = itertools.count(1)
+
+    def configure(self, urls: Iterable[str]) -> None:
+        """Заменяет список экземпляров; статистика начинается заново."""
+        self.endpoints = [Endpoint(url) for url in urls]
+
+    def choose(self, exclude: Iterable[Endpoint] = ()) -> Optional[Endpoint]:
+        skip: Set[int] = {id(endpoint) for endpoint in exclude}
+        candidates = [e for e in self.endpoints if id(e) not in skip]
+        if not candidates:
+            return None
+        if len(candidates) > 1 and next(self._counter) % EXPLORE_EVERY == 0:
+            return min(candidates, key=lambda e: e.last_used)
+        return min(candidates, key=lambda e: e.score())
+
+    def hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        """Через сколько секунд дублировать запрос; None — не дублировать."""
+        if HEDGE_QUANTILE <= 0 or len(self.endpoints) < 2:
+            return None
+        if len(endpoint.latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_MS / 1000
+        return max(HEDGE_MIN_MS / 1000, endpoint.quantile(HEDGE_QUANTILE))
+
+    async def _timed(self, endpoint: Endpoint,
+                     send: Callable[[Endpoint], Awaitable[T]],
+                     censor_on_cancel: bool):
+        started = time.monotonic()
+        endpoint.requests += 1
+        endpoint.in_flight += 1
+        endpoint.last_used = started
+        try:
+            response = await send(endpoint)
+        except asyncio.CancelledError:
+            # основной запрос отменён после порога: он не быстрее этого
+            if censor_on_cancel:
+                endpoint.record(time.monotonic() - started, ok=True)
+            raise
+        except Exception:
+            endpoint.record(time.monotonic() - started, ok=False)
+            raise
+        finally:
+            endpoint.in_flight -= 1
+        endpoint.record(time.monotonic() - started, _succeeded(response))
+        return response
+
+    async def request(self,
+                      send: Callable[[Endpoint], Awaitable[T]],
+                      may_hedge: Callable[[], bool] = lambda: True) -> T:
+        """Выполняет send(endpoint) на лучшем экземпляре.
+
+        Если ответа нет дольше порога и may_hedge() разрешает (например,
+        есть свободный токен частоты), тот же запрос уходит на другой
+        экземпляр. Возвращается первый успешный ответ; если неудачны
+        оба, — ответ или исключение основного запроса.
+        """
+        primary = self.choose()
+        if primary is None:
+            raise RuntimeError(f"Не задано ни одного адреса {self.name}")
+        first = asyncio.ensure_future(self._timed(primary, send, True))
+        delay = self.hedge_delay(primary)
+        if delay is None:
+            return await first
+
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        backup = None if done else self.choose(exclude=[primary])
+        if backup is None or not may_hedge():
+            return await first
+
+        backup.hedges += 1
+        metrics.count("upstream_hedges", service=self.name.lower())
+        second = asyncio.ensure_future(self._timed(backup, send, False))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and _succeeded(task.result()):
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        # оба неудачны: поведение как без дублирования
+        return first.result()
+
+    def format(self) -> str:
+        lines = [f"Экземпляры {self.name}:"]
+        lines.extend(f"    {endpoint.format()}" for endpoint in self.endpoints)
+        return "\n".join(lines)
+
+
+nominatim_endpoints = EndpointPool("Nominatim", NOMINATIM_URLS)
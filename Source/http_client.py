@@ -0,0 +1,119 @@
+"""Общий асинхронный HTTP-клиент с пулом keep-alive соединений.
+
+Один клиент на event loop переиспользуется всеми обращениями к внешним
+сервисам. Параметры пула и таймауты берутся из переменных окружения
+GEOCODER_HTTP_* и могут быть переопределены через configure().
+"""
+
+import asyncio
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+from Source.utils import env_number
+
+try:
+    import httpx
+except ModuleNotFoundError:  # pragma: no cover
+    httpx = None
+
+
+@dataclass
+class HttpSettings:
+    timeout: float = 10.0
+    connect_timeout: float = 5.0
+    max_connections: int = 32
+    max_keepalive_connections: int = 16
+    keepalive_expiry: float = 30.0
+    per_host_limit: int = 8
+
+    @classmethod
+    def from_env(cls) -> "HttpSettings":
+        defaults = cls()
+        return cls(
+            timeout=env_number(
+                "GEOCODER_HTTP_TIMEOUT", defaults.timeout),
+            connect_timeout=env_number(
+                "GEOCODER_HTTP_CONNECT_TIMEOUT", defaults.connect_timeout),
+            max_connections=int(env_number(
+                "GEOCODER_HTTP_MAX_CONNECTIONS", defaults.max_connections)),
+            max_keepalive_connections=int(env_number(
+                "GEOCODER_HTTP_MAX_KEEPALIVE",
+                defaults.max_keepalive_connections)),
+            keepalive_expiry=env_number(
+                "GEOCODER_HTTP_KEEPALIVE_EXPIRY", defaults.keepalive_expiry),
+            per_host_limit=int(env_number(
+                "GEOCODER_HTTP_PER_HOST_LIMIT", defaults.per_host_limit)),
+        )
+
+
+settings = HttpSettings.from_env()
+
+_client = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def configure(**overrides: Any) -> None:
+    """Меняет настройки; новый клиент создастся при следующем запросе."""
+    global settings, _client, _client_loop
+    settings = replace(settings, **overrides)
+    _client = None
+    _client_loop = None
+    _host_limits.clear()
+
+
+def get_client():
+    """Возвращает клиент текущего event loop, создавая его при нужде."""
+    global _client, _client_loop
+    if httpx is None:
+        raise RuntimeError("Библиотека httpx не установлена")
+
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.timeout, connect=settings.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_keepalive_connections,
+                keepalive_expiry=settings.keepalive_expiry,
+            ),
+        )
+        _client_loop = loop
+        _host_limits.clear()
+    return _client
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    semaphore = _host_limits.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, settings.per_host_limit))
+        _host_limits[host] = semaphore
+    return semaphore
+
+
+async def get(url: str,
+              params: Optional[Dict[str, Any]] = None,
+              headers: Optional[Dict[str, str]] = None):
+    client = get_client()
+    async with _host_limit(url):
+        return await client.get(url, params=params, headers=headers)
+
+
+async def post(url: str,
+               json: Any = None,
+               headers: Optional[Dict[str, str]] = None):
+    client = get_client()
+    async with _host_limit(url):
+        return await client.post(url, json=json, headers=headers)
+
+
+async def close() -> None:
+    """Закрывает соединения пула (вызывать при завершении работы)."""
+    global _client, _client_loop
+    client, _client, _client_loop = _client, None, None
+    _host_limits.clear()
+    if client is not None and not client.is_closed:
+        await client.aclose()
@@ -0,0 +1,272 @@
+"""Метрики конвейера: время этапов, счётчики и выгрузка для Prometheus.
+
+    with metrics.stage("nominatim"):
+        ...
+    metrics.count("cache_lookups", tier="memory", result="hit")
+    metrics.error("dadata", exc)
+
+Каждый этап пишет время выполнения в гистограмму
+geocoder_stage_seconds{stage=...}. Исключение, вылетевшее из этапа,
+учитывается в geocoder_errors_total. Если GEOCODER_METRICS=0, все
+вызовы ничего не делают.
+"""
+
+import bisect
+import os
+import time
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Этапы обработки запроса в порядке прохождения.
+STAGES = (
+    "query",              # весь handle_free_query
+    "sanitize",
+    "parse_coordinates",
+    "cache_lookup",       # кэш в памяти, буфер записи и SQLite
+    "fuzzy_lookup",       # нечёткий поиск по триграммам ключей
+    "normalize",          # DaData вместе с ожиданием очереди
+    "offline_lookup",     # локальный реестр OSM
+    "nominatim_wait",     # ожидание разрешения планировщика
+    "nominatim",          # сам HTTP-запрос
+    "parse_output",       # разбор ответа, включая db_write
+    "db_write",           # постановка строки в буфер записи
+    "db_flush",           # транзакция с пачкой строк
+)
+
+COUNTERS = {
+    "cache_lookups": "Обращения к кэшу по уровням и исходу",
+    "upstream_responses": "Ответы внешних сервисов по коду",
+    "errors": "Ошибки по этапам и типам исключений",
+    "results": "Результаты запросов по статусам",
+    "negative_hits": "Ответы отрицательного кэша без обращения к сервисам",
+    "upstream_hedges": "Дублирующие запросы к другому экземпляру сервиса",
+}
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Накопительная гистограмма с фиксированными границами корзин."""
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= rank:
+                if index < len(self.bounds):
+                    return self.bounds[index]
+                break
+        return self.bounds[-1] if self.bounds else 0.0
+
+    def merge(self, counts: Sequence[int], total: float, count: int) -> None:
+        """Добавляет наблюдения гистограммы с теми же границами."""
+        if len(counts) != len(self.counts):
+            raise ValueError("Границы корзин гистограмм не совпадают")
+        self.counts = [mine + theirs
+                       for mine, theirs in zip(self.counts, counts)]
+        self.total += total
+        self.count += count
+
+
+class _Stage:
+    __slots__ = ("_metrics", "_name", "_started")
+
+    def __init__(self, metrics: "Metrics", name: str) -> None:
+        self._metrics = metrics
+        self._name = name
+        self._started = 0.0
+
+    def __enter__(self) -> "_Stage":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, _tb) -> None:
+        self._metrics.observe(self._name, time.perf_counter() - self._started)
+        if exc is not None and isinstance(exc, Exception):
+            self._metrics.error(self._name, exc)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoStage":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        return None
+
+
+_NO_STAGE = _NoStage()
+
+
+class Metrics:
+    """Реестр гистограмм этапов и счётчиков с метками."""
+
+    def __init__(self, enabled: bool = True,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, Dict[LabelSet, float]] = {}
+
+    def stage(self, name: str):
+        """Контекстный менеджер, измеряющий время этапа."""
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = self.stages[name] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def count(self, name: str, amount: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def error(self, stage: str, exc: BaseException) -> None:
+        self.count("errors", stage=stage, type=type(exc).__name__)
+
+    def value(self, name: str, **labels: str) -> float:
+        return self.counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def snapshot(self) -> Dict:
+        """Состояние реестра в простых типах (для передачи между процессами)."""
+        return {
+            "stages": {
+                name: (list(histogram.counts), histogram.total,
+                       histogram.count)
+                for name, histogram in self.stages.items()
+            },
+            "counters": {
+                name: dict(series) for name, series in self.counters.items()
+            },
+        }
+
+    def merge(self, snapshot: Dict) -> None:
+        """Добавляет к реестру снимок snapshot() другого процесса."""
+        if not self.enabled:
+            return
+        for name, (counts, total, count) in snapshot["stages"].items():
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = Histogram(self.buckets)
+            histogram.merge(counts, total, count)
+        for name, series in snapshot["counters"].items():
+            mine = self.counters.setdefault(name, {})
+            for key, value in series.items():
+                mine[key] = mine.get(key, 0) + value
+
+    def reset(self) -> None:
+        self.stages.clear()
+        self.counters.clear()
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus (version 0.0.4)."""
+        lines: List[str] = [
+            "# HELP geocoder_stage_seconds Время этапов обработки запроса",
+            "# TYPE geocoder_stage_seconds histogram",
+        ]
+        for name in _ordered_stages(self.stages):
+            histogram = self.stages[name]
+            stage = _labels((("stage", name),))
+            cumulative = 0
+            for bound, bucket in zip(
+                    histogram.bounds + (float("inf"),), histogram.counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"geocoder_stage_seconds_bucket"
+                    f"{_labels((('stage', name), ('le', le)))} {cumulative}")
+            lines.append(
+                f"geocoder_stage_seconds_sum{stage} {histogram.total!r}")
+            lines.append(
+                f"geocoder_stage_seconds_count{stage} {histogram.count}")
+
+        for name in sorted(set(COUNTERS) | set(self.counters)):
+            metric = f"geocoder_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(self.counters.get(name, {}).items()):
+                lines.append(f"{metric}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self) -> str:
+        """Сводка для --stats: время этапов и ненулевые счётчики."""
+        if not self.enabled:
+            return "Метрики отключены (GEOCODER_METRICS=0)"
+        lines = ["Этапы (вызовов, среднее, p50 / p95 / p99 — оценка по корзинам):"]
+        for name in _ordered_stages(self.stages):
+            histogram = self.stages[name]
+            lines.append(
+                f"    {name}: {histogram.count}, "
+                f"{histogram.total / histogram.count * 1000:.1f} мс, "
+                f"≤{histogram.quantile(0.5) * 1000:g} / "
+                f"≤{histogram.quantile(0.95) * 1000:g} / "
+                f"≤{histogram.quantile(0.99) * 1000:g} мс"
+            )
+        if not self.stages:
+            lines.append("    нет данных")
+        for name in sorted(self.counters):
+            series = self.counters[name]
+            parts = ", ".join(
+                f"{','.join(value for _key, value in labels)}={_number(count)}"
+                for labels, count in sorted(series.items())
+            )
+            lines.append(f"{COUNTERS.get(name, name)}: {parts}")
+        return "\n".join(lines)
+
+
+def _ordered_stages(stages: Dict[str, Histogram]) -> List[str]:
+    known = [name for name in STAGES if name in stages]
+    return known + sorted(set(stages) - set(STAGES))
+
+
+def _escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels)
+    return "{" + inner + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _enabled_from_env(name: str = "GEOCODER_METRICS") -> bool:
+    return os.getenv(name, "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+metrics = Metrics(enabled=_enabled_from_env())
@@ -0,0 +1,92 @@
+"""Вывод результатов в JSON Lines: один объект на строку.
+
+Схема постоянна — поля есть в каждой строке, даже если значение null:
+
+    {"query": ..., "status": ..., "source": "cache" | "upstream" | ...,
+     "full_address": ..., "latitude": ..., "longitude": ...,
+     "components": {"region": ..., "city": ..., "street": ...,
+                    "house": ..., "postcode": ...},
+     "latency_ms": ...}
+
+Если во входной записи пакета был id, он идёт первым полем. Строки
+копятся в памяти и пишутся в поток пачками; если установлен orjson,
+JSON собирается им.
+"""
+
+import json
+from contextvars import ContextVar
+from typing import IO, Dict, List, Optional
+
+from Source.result import COMPONENTS, GeocodeResult
+from Source.utils import env_number
+
+try:
+    import orjson  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover
+    orjson = None
+
+# Сколько строк копить перед записью в поток.
+OUTPUT_BUFFER_LINES = int(env_number("GEOCODER_OUTPUT_BUFFER_LINES", 1000))
+
+# Человекочитаемый вывод конвейера: JSON с отступами и «Полный адрес: …».
+# В режиме JSON Lines он не нужен — результат печатает JsonlWriter.
+human_output: ContextVar[bool] = ContextVar("human_output", default=True)
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def dumps(payload) -> str:
+    """Компактный JSON без экранирования кириллицы."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode("utf-8")
+        except TypeError:
+            # orjson не берёт целые длиннее 64 бит и нестроковые ключи
+            pass
+    return _encode(payload)
+
+
+def result_record(result: GeocodeResult,
+                  record: Optional[Dict] = None) -> Dict:
+    """Строка вывода для результата; record — входная запись пакета."""
+    payload: Dict = {}
+    if record and "id" in record:
+        payload["id"] = record["id"]
+    query = result.query
+    if record and isinstance(record.get("query"), str):
+        query = record["query"]
+    components = result.components or {}
+    payload.update(
+        query=query,
+        status=result.status,
+        source=result.source,
+        full_address=result.full_address,
+        latitude=result.latitude,
+        longitude=result.longitude,
+        components={name: components.get(name) for name in COMPONENTS},
+        latency_ms=(None if result.latency_ms is None
+                    else round(result.latency_ms, 3)),
+    )
+    return payload
+
+
+class JsonlWriter:
+    """Пишет результаты в поток пачками по buffer_lines строк."""
+
+    def __init__(self, stream: IO[str],
+                 buffer_lines: Optional[int] = None) -> None:
+        self.stream = stream
+        self.buffer_lines = max(1, buffer_lines or OUTPUT_BUFFER_LINES)
+        self._lines: List[str] = []
+
+    def write(self, result: GeocodeResult,
+              record: Optional[Dict] = None) -> None:
+        self._lines.append(dumps(result_record(result, record)))
+        if len(self._lines) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._lines:
+            self.stream.write("\n".join(self._lines) + "\n")
+            self._lines.clear()
+        self.stream.flush()
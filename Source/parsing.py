@@ -1,11 +1,22 @@
+import asyncio
+import dataclasses
 import os
 import json
 import re
+import time
 from typing import Dict, Optional, Tuple
 
 from Source import response
-from Source.database.requests import add_new_address
-from Source.utils import build_address_from_components
+from Source.database.negative_cache import remember_negative
+from Source.database.requests import add_new_address, cache_key
+from Source.metrics import metrics
+from Source.output import human_output
+from Source.result import (STATUS_ERROR, STATUS_INVALID, STATUS_NOT_FOUND,
+                           STATUS_OUTSIDE_RUSSIA, STATUS_UPSTREAM,
+                           GeocodeResult)
+from Source.scheduler import dadata_scheduler
+from Source.singleflight import SingleFlight
+from Source.utils import build_address_from_components, env_number
 
 
 def _load_env(path: str = ".env") -> None:
@@ -34,6 +45,10 @@ _load_env()
 
 CYRILLIC_RE = re.compile(r"[А-Яа-яЁё]")
 
+# Сколько запросов к DaData выполняется одновременно и сколько ждём ответ.
+DADATA_CONCURRENCY = int(env_number("DADATA_CONCURRENCY", 8))
+DADATA_TIMEOUT = env_number("DADATA_TIMEOUT", 5.0)
+
 try:
     from dadata import Dadata
 except ModuleNotFoundError:  # pragma: no cover
@@ -49,27 +64,70 @@ def _make_dadata_client():
         # Нет токена/секрета или не установлена библиотека — просто не используем DaData
         return None
 
-    return Dadata(token, secret)
+    return Dadata(token, secret, timeout=DADATA_TIMEOUT)
 
 
 _client = _make_dadata_client()
+# Одновременные одинаковые запросы нормализуются одним обращением к DaData.
+normalize_flight = SingleFlight()
+_dadata_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+
+def _dadata_semaphore() -> asyncio.Semaphore:
+    """Ограничитель одновременных запросов к DaData для текущего loop."""
+    global _dadata_slots
+    loop = asyncio.get_running_loop()
+    if _dadata_slots is None or _dadata_slots[0] is not loop:
+        _dadata_slots = (loop, asyncio.Semaphore(max(1, DADATA_CONCURRENCY)))
+    return _dadata_slots[1]
+
+
+def _release_slot(slots: asyncio.Semaphore, call: asyncio.Future) -> None:
+    """Освобождает место, когда поток с запросом к DaData завершился."""
+    slots.release()
+    if not call.cancelled():
+        # ошибку запроса, который уже никто не ждёт, не показываем
+        call.exception()
 
 
 def _contains_cyrillic(text: str) -> bool:
     return bool(CYRILLIC_RE.search(text))
 
 
-def _clean_with_dadata(address: str) -> Optional[Dict]:
-    """Обёртка над Dadata.clean: возвращает словарь или None при ошибке."""
+async def _clean_with_dadata(address: str) -> Optional[Dict]:
+    """Обёртка над Dadata.clean: возвращает словарь или None при ошибке.
+
+    Синхронный клиент вызывается в пуле потоков, поэтому event loop
+    не блокируется и другие запросы обрабатываются параллельно.
+    Поток нельзя прервать: после таймаута он ещё занимает место в
+    DADATA_CONCURRENCY, пока DaData не ответит.
+    """
     if _client is None:
         # Нормализация отключена — нет токена/библиотеки
         return None
 
     try:
-        return _client.clean("address", address)
+        await dadata_scheduler.acquire()
+        slots = _dadata_semaphore()
+        await slots.acquire()
+        call = asyncio.ensure_future(
+            asyncio.to_thread(_client.clean, "address", address))
+        call.add_done_callback(lambda done: _release_slot(slots, done))
+        cleaned = await asyncio.wait_for(asyncio.shield(call), DADATA_TIMEOUT)
+    except asyncio.TimeoutError as exc:
+        metrics.count("upstream_responses", service="dadata", code="timeout")
+        metrics.error("normalize", exc)
+        print(f"[Dadata] Нет ответа за {DADATA_TIMEOUT:g} с")
+        return None
     except Exception as exc:  # noqa: BLE001
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+        metrics.count("upstream_responses", service="dadata",
+                      code=str(code or "exception"))
+        metrics.error("normalize", exc)
         print(f"[Dadata] Не удалось нормализовать адрес: {exc}")
         return None
+    metrics.count("upstream_responses", service="dadata", code="200")
+    return cleaned
 
 
 
@@ -95,12 +153,21 @@ def _build_normalized_string(cleaned: Dict) -> Optional[str]:
     return " ".join(pieces)
 
 
-def _normalize_free_text(free_text: str) -> Optional[str]:
+async def _normalize_free_text(free_text: str) -> Optional[str]:
+    return await normalize_flight.do(
+        cache_key(free_text), lambda: _normalize_once(free_text))
+
+
+async def _normalize_once(free_text: str) -> Optional[str]:
     raw = f"{free_text} Россия"
-    cleaned = _clean_with_dadata(raw)
+    cleaned = await _clean_with_dadata(raw)
     if not cleaned:
         return None
-    return _build_normalized_string(cleaned)
+    normalized = _build_normalized_string(cleaned)
+    if normalized is None:
+        # DaData ответила, но адреса в строке нет — спрашивать снова незачем
+        await remember_negative(free_text, STATUS_INVALID)
+    return normalized
 
 
 def sanitize_input(text: str) -> Optional[str]:
@@ -128,18 +195,32 @@ def _try_parse_coordinates(text: str) -> Optional[Tuple[float, float]]:
     return lat, lon
 
 
-async def handle_free_query(free_text: str) -> None:
-    raw = sanitize_input(free_text)
+async def handle_free_query(free_text: str) -> Optional[GeocodeResult]:
+    """Геокодирует строку в свободной форме: адрес или координаты."""
+    started = time.perf_counter()
+    with metrics.stage("query"):
+        result = await _handle_free_query(free_text)
+    metrics.count("results", status=result.status if result else "none")
+    if result is None:
+        return None
+    # один результат может достаться нескольким запросам (SingleFlight)
+    return dataclasses.replace(
+        result, latency_ms=(time.perf_counter() - started) * 1000)
+
+
+async def _handle_free_query(free_text: str) -> Optional[GeocodeResult]:
+    with metrics.stage("sanitize"):
+        raw = sanitize_input(free_text)
     if not raw:
         print("Пустой запрос. Введите адрес или координаты.")
-        return
+        return GeocodeResult(free_text, STATUS_INVALID)
 
     # сначала координаты
-    coords = _try_parse_coordinates(raw)
+    with metrics.stage("parse_coordinates"):
+        coords = _try_parse_coordinates(raw)
     if coords is not None:
         lat, lon = coords
-        await response.send_request(f"{lat} {lon}")
-        return
+        return await response.reverse_geocode(lat, lon)
 
     # не кирилица – некорректно
     if not _contains_cyrillic(raw):
@@ -148,7 +229,7 @@ async def handle_free_query(free_text: str) -> None:
             "Введите адрес на русском языке "
             "или две координаты через пробел/запятую."
             )
-        return
+        return GeocodeResult(raw, STATUS_INVALID)
 
     # только одно слово или меньше 5 символов
     words = [w for w in re.split(r"[,\s]+", raw) if w]
@@ -157,24 +238,43 @@ async def handle_free_query(free_text: str) -> None:
             "Слишком короткий адрес. "
             "Уточните, например: 'Город, улица дом'."
             )
-        return
+        return GeocodeResult(raw, STATUS_INVALID)
+
+    cached = await response.find_cached(raw)
+    if cached is not None:
+        return cached
+
+    failed = await response.find_known_failure(raw)
+    if failed is not None:
+        return failed
+
+    similar = await response.find_similar(raw)
+    if similar is not None:
+        return similar
 
-    normalized = _normalize_free_text(raw)
+    with metrics.stage("normalize"):
+        normalized = await _normalize_free_text(raw)
+    if not normalized and response.OFFLINE_MODE != response.OFFLINE_OFF:
+        # без DaData реестр всё равно найдёт дом по исходной строке
+        return await response.send_request(raw, raw)
     if not normalized:
         print(
             "Не удалось распознать адрес. "
             "Попробуйте формат: 'Город, улица дом'."
             )
-        return
+        return GeocodeResult(raw, STATUS_INVALID)
 
-    await response.send_request(normalized)
+    return await response.send_request(normalized, raw)
 
 
 async def parse_output_address(
-        input_address: str, output_address: Dict) -> None:
+        input_address: str,
+        output_address: Dict,
+        normalized_query: Optional[str] = None,
+        query_key: Optional[str] = None) -> GeocodeResult:
     if not output_address:
         print("Пустой ответ от сервера геокодирования")
-        return
+        return GeocodeResult(input_address, STATUS_ERROR)
 
     address_meta = output_address.get("address") or {}
     latitude = output_address.get("lat")
@@ -204,7 +304,7 @@ async def parse_output_address(
 
     if not all((latitude, longitude)):
         print("Ответ сервиса не содержит координат")
-        return
+        return GeocodeResult(input_address, STATUS_NOT_FOUND)
 
     country = (address_meta.get("country") or "").lower()
     full_without_coords_parts = [
@@ -213,19 +313,25 @@ async def parse_output_address(
 
     if country and "россия" not in country:
         print("Адрес находится вне пределов России")
-        return
+        await remember_negative(input_address, STATUS_OUTSIDE_RUSSIA, query_key)
+        return GeocodeResult(input_address, STATUS_OUTSIDE_RUSSIA,
+                             source=STATUS_UPSTREAM)
     if not country and (
         "россия" not in (
             output_address.get("display_name")
             or "")
             ):
         print("Адрес находится вне пределов России")
-        return
+        await remember_negative(input_address, STATUS_OUTSIDE_RUSSIA, query_key)
+        return GeocodeResult(input_address, STATUS_OUTSIDE_RUSSIA,
+                             source=STATUS_UPSTREAM)
 
     # Сохранение в БД
     try:
-        await add_new_address(
-            input_address, full_without_coords, latitude, longitude)
+        with metrics.stage("db_write"):
+            await add_new_address(
+                input_address, full_without_coords, latitude, longitude,
+                normalized_query=normalized_query, query_key=query_key)
     except Exception as exc:
         print(f"[БД] Не удалось сохранить адрес: {exc}")
 
@@ -234,4 +340,16 @@ async def parse_output_address(
     )
     formatted = ", ".join(formatted_parts)
 
-    print(f"Полный адрес: {formatted}")
+    if human_output.get():
+        print(f"Полный адрес: {formatted}")
+    return GeocodeResult(
+        input_address,
+        STATUS_UPSTREAM,
+        full_without_coords,
+        float(latitude),
+        float(longitude),
+        components={
+            "region": region, "city": city, "street": street,
+            "house": house, "postcode": postcode,
+        },
+    )
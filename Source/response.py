@@ -1,17 +1,67 @@
 import json
-from typing import Optional
+import os
+from typing import Dict, Optional, Union
 
-import requests
+from Source import http_client, parsing
+from Source.database.requests import (add_new_address, cache_key,
+                                      coordinate_key, find_nearest_address,
+                                      find_similar_address,
+                                      return_address_if_exist)
+from Source.database.negative_cache import find_negative, remember_negative
+from Source.database.offline_index import find_offline_address
+from Source.endpoints import Endpoint, nominatim_endpoints
+from Source.metrics import metrics
+from Source.output import human_output
+from Source.result import (STATUS_CACHE, STATUS_ERROR, STATUS_INVALID,
+                           STATUS_NOT_FOUND, STATUS_OFFLINE,
+                           STATUS_OUTSIDE_RUSSIA, STATUS_UPSTREAM,
+                           GeocodeResult)
+from Source.scheduler import nominatim_scheduler
+from Source.singleflight import SingleFlight
+from Source.utils import (DEFAULT_HEADERS, NOMINATIM_REVERSE_PATH,
+                          NOMINATIM_SEARCH_PATH, env_number)
 
-from Source import parsing
-from Source.database.requests import return_address_if_exist
-from Source.utils import DEFAULT_HEADERS, NOMINATIM_URL
+# В каком радиусе (м) точка из кэша считается ответом на запрос координат.
+REVERSE_RADIUS_M: float = env_number("GEOCODER_REVERSE_RADIUS_M", 30.0)
+# До скольких знаков округляются координаты в ключе кэша: 5 знаков —
+# около метра, точки внутри одной клетки сетки делят одну запись.
+COORD_PRECISION = int(env_number("GEOCODER_COORD_PRECISION", 5))
+
+# Локальный реестр OSM: "" — не используется, "first" — сначала реестр,
+# затем сеть, "only" — в сеть не ходить совсем.
+OFFLINE_OFF = ""
+OFFLINE_FIRST = "first"
+OFFLINE_ONLY = "only"
+
+
+def _offline_mode_from_env() -> str:
+    value = os.getenv("GEOCODER_OFFLINE", "").strip().lower()
+    if value in ("only", "strict"):
+        return OFFLINE_ONLY
+    if value in ("1", "first", "on", "true", "yes"):
+        return OFFLINE_FIRST
+    return OFFLINE_OFF
+
+
+OFFLINE_MODE: str = _offline_mode_from_env()
+
+# Одновременные запросы одного и того же адреса идут в сеть один раз.
+upstream_flight = SingleFlight()
+
+NEGATIVE_MESSAGES = {
+    STATUS_NOT_FOUND: "По заданному запросу ничего не найдено",
+    STATUS_INVALID: "Не удалось распознать адрес. "
+                    "Попробуйте формат: 'Город, улица дом'.",
+    STATUS_OUTSIDE_RUSSIA: "Адрес находится вне пределов России",
+}
 
 
 def _print_json_result(
         query: str, full_address: str, latitude: float, longitude: float
         ) -> None:
     """JSON результат"""
+    if not human_output.get():
+        return
     payload = {
         "query": query,
         "latitude": float(latitude),
@@ -21,15 +71,185 @@ def _print_json_result(
     print(json.dumps(payload, ensure_ascii=False, indent=4))
 
 
-async def send_request(address: str) -> None:
-    cached = await return_address_if_exist(address)
+async def find_cached(
+        query: str, key: Optional[str] = None) -> Optional[GeocodeResult]:
+    """Ответ из кэша SQLite или None, если запроса там нет."""
+    try:
+        with metrics.stage("cache_lookup"):
+            cached = await return_address_if_exist(query, key)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[БД] Не удалось прочитать кэш: {exc}")
+        return None
+
+    if cached is None:
+        return None
+
+    _print_json_result(
+        query,
+        cached.full_address,
+        cached.latitude,
+        cached.longitude)
+    return GeocodeResult(
+        query,
+        STATUS_CACHE,
+        cached.full_address,
+        float(cached.latitude),
+        float(cached.longitude),
+    )
+
+
+async def find_known_failure(
+        query: str, key: Optional[str] = None) -> Optional[GeocodeResult]:
+    """Прежний отрицательный ответ на этот запрос или None."""
+    try:
+        with metrics.stage("cache_lookup"):
+            reason = await find_negative(query, key)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[БД] Не удалось прочитать кэш: {exc}")
+        return None
+
+    if reason is None:
+        return None
+    print(f"{NEGATIVE_MESSAGES[reason]} (запомненный ответ)")
+    return GeocodeResult(query, reason, source=STATUS_CACHE)
+
+
+async def find_similar(query: str) -> Optional[GeocodeResult]:
+    """Ответ из кэша для почти совпадающего запроса.
+
+    Найденный вариант запоминается под этим запросом, так что в
+    следующий раз он найдётся точным поиском.
+    """
+    try:
+        with metrics.stage("fuzzy_lookup"):
+            similar = await find_similar_address(query)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[БД] Не удалось прочитать кэш: {exc}")
+        return None
+
+    if similar is None:
+        return None
+
+    result = GeocodeResult(
+        query,
+        STATUS_CACHE,
+        similar.full_address,
+        float(similar.latitude),
+        float(similar.longitude),
+    )
+    await _remember_query(query, result, similar.normalized_key)
+    _print_json_result(
+        query, result.full_address, result.latitude, result.longitude)
+    return result
+
+
+async def find_nearby(lat: float, lon: float) -> Optional[GeocodeResult]:
+    """Ближайший к точке адрес из кэша в пределах REVERSE_RADIUS_M."""
+    try:
+        with metrics.stage("cache_lookup"):
+            nearest = await find_nearest_address(lat, lon, REVERSE_RADIUS_M)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[БД] Не удалось прочитать кэш: {exc}")
+        return None
+
+    if nearest is None:
+        return None
+
+    query = f"{lat} {lon}"
+    _print_json_result(
+        query,
+        nearest.full_address,
+        nearest.latitude,
+        nearest.longitude)
+    return GeocodeResult(
+        query,
+        STATUS_CACHE,
+        nearest.full_address,
+        float(nearest.latitude),
+        float(nearest.longitude),
+    )
+
+
+async def _remember_query(
+        input_query: str,
+        result: GeocodeResult,
+        normalized: Optional[str]) -> None:
+    """Запоминает ещё один исходный запрос для уже известного адреса."""
+    try:
+        await add_new_address(
+            input_query,
+            result.full_address,
+            result.latitude,
+            result.longitude,
+            normalized_query=normalized,
+        )
+    except Exception as exc:  # noqa: BLE001
+        print(f"[БД] Не удалось сохранить адрес: {exc}")
+
+
+async def find_offline(
+        address: str, input_query: Optional[str] = None
+        ) -> Optional[GeocodeResult]:
+    """Ответ из локального реестра OSM; найденное сохраняется в кэш."""
+    query = input_query or address
+    candidates = [address] if address == query else [address, query]
+    try:
+        with metrics.stage("offline_lookup"):
+            for candidate in candidates:
+                match = await find_offline_address(candidate)
+                if match is not None:
+                    break
+    except Exception as exc:  # noqa: BLE001
+        print(f"[БД] Не удалось прочитать локальный реестр: {exc}")
+        return None
+
+    metrics.count("cache_lookups", tier="offline",
+                  result="miss" if match is None else "hit")
+    if match is None:
+        return None
+
+    try:
+        await add_new_address(
+            query, match.full_address, match.latitude, match.longitude,
+            normalized_query=address if input_query else None)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[БД] Не удалось сохранить адрес: {exc}")
+    _print_json_result(
+        query, match.full_address, match.latitude, match.longitude)
+    return GeocodeResult(
+        query, STATUS_OFFLINE, match.full_address,
+        match.latitude, match.longitude, components=match.components)
+
+
+async def send_request(
+        address: str, input_query: Optional[str] = None) -> GeocodeResult:
+    """Геокодирует address: кэш, локальный реестр (если включён), Nominatim.
+
+    input_query — исходный запрос пользователя, если address получен
+    нормализацией; результат сохраняется под ним, чтобы повтор того же
+    запроса обслуживался из кэша без обращения к сети. Одновременные
+    одинаковые вызовы разделяют один результат.
+    """
+    key = (cache_key(address), cache_key(input_query or ""))
+    return await upstream_flight.do(
+        key, lambda: _send_request(address, input_query))
+
+
+async def _send_request(
+        address: str, input_query: Optional[str]) -> GeocodeResult:
+    cached = await find_cached(address)
     if cached is not None:
-        _print_json_result(
-            address,
-            cached.full_address,
-            cached.latitude,
-            cached.longitude)
-        return
+        if input_query:
+            await _remember_query(input_query, cached, address)
+        return cached
+
+    if OFFLINE_MODE != OFFLINE_OFF:
+        offline = await find_offline(address, input_query)
+        if offline is not None:
+            return offline
+        if OFFLINE_MODE == OFFLINE_ONLY:
+            print("Адрес не найден в локальном реестре")
+            return GeocodeResult(input_query or address, STATUS_NOT_FOUND)
 
     params = {
         "q": address,
@@ -38,31 +258,111 @@ async def send_request(address: str) -> None:
         "accept-language": "ru",
         "addressdetails": 1,
     }
+    payload = await _fetch_nominatim(NOMINATIM_SEARCH_PATH, params, address)
+    if isinstance(payload, GeocodeResult):
+        return payload
 
-    try:
-        response = requests.get(
-            NOMINATIM_URL,
+    if not payload:
+        print("По заданному запросу ничего не найдено")
+        await remember_negative(input_query or address, STATUS_NOT_FOUND)
+        return GeocodeResult(address, STATUS_NOT_FOUND, source=STATUS_UPSTREAM)
+
+    with metrics.stage("parse_output"):
+        if input_query:
+            return await parsing.parse_output_address(
+                input_query, payload[0], normalized_query=address)
+        return await parsing.parse_output_address(address, payload[0])
+
+
+async def reverse_geocode(lat: float, lon: float) -> GeocodeResult:
+    """Адрес точки: кэш по округлённым координатам, соседи, /reverse.
+
+    Точки, совпадающие до COORD_PRECISION знаков, делят одну запись
+    кэша и один запрос к Nominatim.
+    """
+    query = f"{lat} {lon}"
+    key = coordinate_key(lat, lon, COORD_PRECISION)
+    cached = await find_cached(query, key)
+    if cached is not None:
+        return cached
+
+    failed = await find_known_failure(query, key)
+    if failed is not None:
+        return failed
+
+    nearby = await find_nearby(lat, lon)
+    if nearby is not None:
+        return nearby
+
+    if OFFLINE_MODE == OFFLINE_ONLY:
+        print("Точка не найдена в кэше, а обращения к сети отключены")
+        return GeocodeResult(query, STATUS_NOT_FOUND)
+
+    return await upstream_flight.do(
+        ("reverse", key), lambda: _send_reverse(query, key))
+
+
+async def _send_reverse(query: str, key: str) -> GeocodeResult:
+    snapped_lat, snapped_lon = key.split()
+    params = {
+        "lat": snapped_lat,
+        "lon": snapped_lon,
+        "format": "json",
+        "zoom": 18,
+        "accept-language": "ru",
+        "addressdetails": 1,
+    }
+    payload = await _fetch_nominatim(NOMINATIM_REVERSE_PATH, params, query)
+    if isinstance(payload, GeocodeResult):
+        return payload
+
+    # на пустом месте /reverse отвечает {"error": "Unable to geocode"}
+    if not isinstance(payload, dict) or not payload or "error" in payload:
+        print("По заданным координатам ничего не найдено")
+        await remember_negative(query, STATUS_NOT_FOUND, key)
+        return GeocodeResult(query, STATUS_NOT_FOUND, source=STATUS_UPSTREAM)
+
+    with metrics.stage("parse_output"):
+        return await parsing.parse_output_address(
+            query, payload, query_key=key)
+
+
+async def _fetch_nominatim(
+        path: str, params: Dict, query: str) -> Union[object, GeocodeResult]:
+    """Разобранный JSON ответа Nominatim или GeocodeResult с ошибкой.
+
+    Экземпляр Nominatim выбирает nominatim_endpoints; дублирующий запрос
+    к другому экземпляру отправляется, только если для него сразу есть
+    токен частоты.
+    """
+    def send(endpoint: Endpoint):
+        return http_client.get(
+            endpoint.url + path,
             params=params,
-            headers=DEFAULT_HEADERS,
-            timeout=10)
+            headers=DEFAULT_HEADERS)
+
+    try:
+        with metrics.stage("nominatim_wait"):
+            await nominatim_scheduler.acquire()
+        with metrics.stage("nominatim"):
+            response = await nominatim_endpoints.request(
+                send, may_hedge=nominatim_scheduler.try_acquire)
     except Exception as exc:
+        metrics.count("upstream_responses", service="nominatim",
+                      code="exception")
         print(f"Ошибка при обращении к сервису геокодирования: {exc}")
-        return
+        return GeocodeResult(query, STATUS_ERROR)
 
-    if not response.ok:
+    metrics.count("upstream_responses", service="nominatim",
+                  code=str(response.status_code))
+    if not response.is_success:
         print(
             f"Сервис геокодирования вернул ошибку: HTTP {response.status_code}"
             )
-        return
+        return GeocodeResult(query, STATUS_ERROR)
 
     try:
-        payload = response.json()
+        return response.json()
     except ValueError:
         print("Не удалось разобрать ответ сервера как JSON")
-        return
-
-    if not payload:
-        print("По заданному запросу ничего не найдено")
-        return
-
-    await parsing.parse_output_address(address, payload[0])
+        return GeocodeResult(query, STATUS_ERROR)
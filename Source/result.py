@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+STATUS_CACHE = "cache"
+STATUS_UPSTREAM = "upstream"
+STATUS_OFFLINE = "offline"
+STATUS_NOT_FOUND = "not_found"
+STATUS_OUTSIDE_RUSSIA = "outside_russia"
+STATUS_INVALID = "invalid"
+STATUS_ERROR = "error"
+
+STATUSES = (
+    STATUS_CACHE,
+    STATUS_UPSTREAM,
+    STATUS_OFFLINE,
+    STATUS_NOT_FOUND,
+    STATUS_OUTSIDE_RUSSIA,
+    STATUS_INVALID,
+    STATUS_ERROR,
+)
+
+
+# Части адреса в ответе: region, city, street, house, postcode.
+COMPONENTS = ("region", "city", "street", "house", "postcode")
+
+
+@dataclass
+class GeocodeResult:
+    """Итог обработки одного запроса.
+
+    source — откуда ответ: cache, upstream или offline; None, если
+    ответа не было (некорректный ввод, ошибка сети). components —
+    части адреса, если они известны (в кэше хранится только строка).
+    latency_ms заполняет parsing.handle_free_query.
+    """
+
+    query: str
+    status: str
+    full_address: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    components: Optional[Dict[str, Optional[str]]] = None
+    source: Optional[str] = None
+    latency_ms: Optional[float] = None
+
+    def __post_init__(self) -> None:
+        if self.source is None and self.found:
+            self.source = self.status
+
+    @property
+    def found(self) -> bool:
+        return self.status in (STATUS_CACHE, STATUS_UPSTREAM, STATUS_OFFLINE)
+
@@ -0,0 +1,192 @@
+"""Планировщик обращений к внешним сервисам с ограничением частоты.
+
+Каждый сервис получает свой UpstreamScheduler: корзина токенов задаёт
+среднюю частоту и допустимый всплеск, а очередь с приоритетами пускает
+интерактивные запросы раньше пакетных.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from Source.utils import env_number
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+LANE_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BATCH: "batch",
+}
+
+# Приоритет запросов текущей задачи; пакетный режим выставляет PRIORITY_BATCH.
+current_priority: ContextVar[int] = ContextVar(
+    "upstream_priority", default=PRIORITY_INTERACTIVE)
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше burst в запасе.
+
+    rate<=0 означает отсутствие ограничения.
+    """
+
+    def __init__(self,
+                 rate: float,
+                 burst: float = 1,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = max(0.0, now - self._updated)
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def take(self) -> float:
+        """Забирает токен и возвращает 0 или сколько секунд до следующего."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class SharedTokenBucket(TokenBucket):
+    """Корзина токенов, общая для нескольких процессов.
+
+    Запас и время пополнения лежат в разделяемой памяти, поэтому
+    рабочие процессы пакетного режима вместе не превышают rate.
+    time.monotonic — общий для всех процессов системный счётчик.
+    Передаётся в процесс аргументом при создании, не через очередь.
+    """
+
+    def __init__(self, rate: float, burst: float = 1, context=None) -> None:
+        if context is None:
+            import multiprocessing as context
+        super().__init__(rate, burst)
+        self._state = context.Array("d", [self._tokens, self._updated])
+
+    def take(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._state.get_lock():
+            self._tokens, self._updated = self._state[0], self._state[1]
+            delay = super().take()
+            self._state[0], self._state[1] = self._tokens, self._updated
+        return delay
+
+
+class UpstreamScheduler:
+    """Выдаёт разрешения на запросы к одному внешнему сервису."""
+
+    def __init__(self, name: str, rate: float, burst: float = 1) -> None:
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.granted: Counter = Counter()
+        self.wait_total: Counter = Counter()
+        self.wait_max: Dict[str, float] = {}
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _p, _s, fut in self._waiters if not fut.done())
+
+    def configure(self,
+                  rate: Optional[float] = None,
+                  burst: Optional[float] = None) -> None:
+        self.bucket = TokenBucket(
+            self.bucket.rate if rate is None else rate,
+            self.bucket.burst if burst is None else burst,
+        )
+
+    async def acquire(self, priority: Optional[int] = None) -> None:
+        """Ждёт своей очереди и токена."""
+        if priority is None:
+            priority = current_priority.get()
+
+        started = time.monotonic()
+        if not self._waiters and self.bucket.take() == 0:
+            self._record(priority, started)
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        if (self._dispatcher is None or self._dispatcher.done()
+                or self._dispatcher.get_loop() is not loop):
+            self._dispatcher = loop.create_task(self._dispatch())
+
+        await future
+        self._record(priority, started)
+
+    def try_acquire(self, priority: Optional[int] = None) -> bool:
+        """Берёт токен, только если он есть сейчас и очереди нет."""
+        if priority is None:
+            priority = current_priority.get()
+        if self._waiters or self.bucket.take() > 0:
+            return False
+        self._record(priority, time.monotonic())
+        return True
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = self.bucket.take()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    def _record(self, priority: int, started: float) -> None:
+        lane = LANE_NAMES.get(priority, str(priority))
+        waited = time.monotonic() - started
+        self.granted[lane] += 1
+        self.wait_total[lane] += waited
+        self.wait_max[lane] = max(self.wait_max.get(lane, 0.0), waited)
+
+    def format(self) -> str:
+        parts = []
+        for lane in sorted(self.granted):
+            count = self.granted[lane]
+            parts.append(
+                f"{lane}: {count} запр., ожидание в среднем "
+                f"{self.wait_total[lane] / count * 1000:.0f} мс, "
+                f"максимум {self.wait_max[lane] * 1000:.0f} мс"
+            )
+        lanes = "; ".join(parts) or "запросов не было"
+        return (
+            f"Очередь {self.name}: {lanes}; "
+            f"наибольшая длина очереди {self.max_queue_depth}"
+        )
+
+
+# Публичный Nominatim разрешает около одного запроса в секунду.
+nominatim_scheduler = UpstreamScheduler(
+    "Nominatim",
+    rate=env_number("GEOCODER_NOMINATIM_RATE", 1.0),
+    burst=env_number("GEOCODER_NOMINATIM_BURST", 1.0),
+)
+dadata_scheduler = UpstreamScheduler(
+    "DaData",
+    rate=env_number("DADATA_RATE", 10.0),
+    burst=env_number("DADATA_BURST", 10.0),
+)
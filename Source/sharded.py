@@ -0,0 +1,263 @@
+"""Пакетный режим на нескольких процессах.
+
+Главный процесс читает вход и раздаёт записи рабочим процессам по
+хешу ключа кэша: одинаковые запросы всегда попадают в один процесс,
+и его кэш в памяти, SingleFlight и буфер записи остаются полезны.
+Каждый процесс гонит свою долю через parsing.handle_free_query со
+своими соединениями (HTTP, SQLite), а частоту запросов к Nominatim и
+DaData делит со всеми через SharedTokenBucket. Готовые строки JSON
+Lines собираются главным процессом в один выходной поток.
+"""
+
+import asyncio
+import multiprocessing
+import queue
+import sys
+import threading
+import traceback
+import zlib
+from contextlib import redirect_stdout
+from typing import IO, Dict, List, Tuple
+
+from Source import batch
+from Source.database.requests import cache_key
+from Source.metrics import metrics
+from Source.scheduler import (SharedTokenBucket, dadata_scheduler,
+                              nominatim_scheduler)
+
+# Записи уходят рабочим и возвращаются пачками: одна пересылка между
+# процессами на пачку, а не на запрос.
+INPUT_CHUNK = 256
+OUTPUT_CHUNK = 256
+# Сколько пачек может ждать рабочий; дальше чтение входа приостанавливается.
+INBOX_CHUNKS = 4
+# Как часто рабочий отдаёт неполную пачку результатов, с.
+OUTPUT_INTERVAL = 0.2
+
+_DONE = "done"
+
+
+def shard_for(record: batch.Record, seq: int, workers: int) -> int:
+    """Номер рабочего процесса для записи."""
+    query = record.get("query")
+    if not isinstance(query, str):
+        return seq % workers
+    # crc32, а не hash(): у str он свой в каждом процессе
+    return zlib.crc32(cache_key(query).encode("utf-8")) % workers
+
+
+class ShardedStats(batch.BatchStats):
+    """Счётчики прогона плюс сводки кэшей каждого рабочего процесса."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.worker_reports: Dict[int, List[str]] = {}
+
+    def format_report(self) -> str:
+        lines = [super().format_report()]
+        for index in sorted(self.worker_reports):
+            lines.append(f"Процесс {index}:")
+            lines.extend(f"    {line}" for line in self.worker_reports[index])
+        return "\n".join(lines)
+
+
+# --- рабочий процесс ----------------------------------------------------
+
+
+def _worker(index: int, inbox, outbox, buckets: Dict[str, SharedTokenBucket],
+            concurrency: int) -> None:
+    nominatim_scheduler.bucket = buckets["nominatim"]
+    dadata_scheduler.bucket = buckets["dadata"]
+    report: List[str] = []
+    error = None
+    try:
+        with redirect_stdout(sys.stderr):
+            report = asyncio.run(_work(inbox, outbox, concurrency))
+    except BaseException:  # noqa: BLE001
+        # доля этого процесса не обработана: главный прервёт прогон
+        error = traceback.format_exc()
+    finally:
+        # время этапов и счётчики процесса сводятся в главном (--stats)
+        outbox.put((_DONE, index, report, error, metrics.snapshot()))
+
+
+async def _work(inbox, outbox, concurrency: int) -> List[str]:
+    from Source import http_client
+    from Source.database.memory_cache import memory_cache
+    from Source.database.negative_cache import negative_stats
+    from Source.database.requests import cache_stats, flush_pending_writes
+    from Source.endpoints import nominatim_endpoints
+    from Source.output import human_output
+
+    human_output.set(False)
+    loop = asyncio.get_running_loop()
+    sequence: Dict[int, int] = {}
+    pending: List[Tuple[int, str, str]] = []
+
+    async def records():
+        while True:
+            chunk = await loop.run_in_executor(None, inbox.get)
+            if chunk is None:
+                return
+            for seq, record in chunk:
+                sequence[id(record)] = seq
+                yield record
+
+    def send() -> None:
+        if pending:
+            outbox.put(list(pending))
+            pending.clear()
+
+    async def send_periodically() -> None:
+        while True:
+            await asyncio.sleep(OUTPUT_INTERVAL)
+            send()
+
+    sender = asyncio.create_task(send_periodically())
+    try:
+        async for record, result in batch.geocode_stream(
+                records(), concurrency, ordered=False):
+            pending.append((sequence.pop(id(record)), result.status,
+                            batch.format_result_line(record, result)))
+            if len(pending) >= OUTPUT_CHUNK:
+                send()
+    finally:
+        sender.cancel()
+        send()
+        await flush_pending_writes()
+        await http_client.close()
+    return [memory_cache.format(), cache_stats.format(),
+            negative_stats.format(), nominatim_endpoints.format()]
+
+
+# --- главный процесс ----------------------------------------------------
+
+
+def _feed(input_stream: IO[str], inboxes: List, failed: threading.Event) -> None:
+    """Читает вход и раскладывает записи по очередям рабочих."""
+    workers = len(inboxes)
+    chunks: List[List] = [[] for _ in range(workers)]
+    try:
+        for seq, record in enumerate(batch._read_records(input_stream)):
+            if failed.is_set():
+                return
+            shard = shard_for(record, seq, workers)
+            chunks[shard].append((seq, record))
+            if len(chunks[shard]) >= INPUT_CHUNK:
+                _put(inboxes[shard], chunks[shard], failed)
+                chunks[shard] = []
+        for shard, chunk in enumerate(chunks):
+            if chunk:
+                _put(inboxes[shard], chunk, failed)
+    finally:
+        for inbox in inboxes:
+            _put(inbox, None, failed)
+
+
+def _put(inbox, item, failed: threading.Event) -> None:
+    # если рабочий упал, его очередь никто не разберёт
+    while not failed.is_set():
+        try:
+            inbox.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def run_sharded(
+        input_stream: IO[str],
+        output_stream: IO[str],
+        workers: int,
+        concurrency: int = batch.DEFAULT_CONCURRENCY,
+        ordered: bool = True,
+        ) -> ShardedStats:
+    """Как batch.run_batch, но запросы делятся между workers процессами.
+
+    concurrency — одновременных запросов в каждом процессе. При
+    ordered=True результаты идут в порядке входа: главный процесс
+    придерживает строки, пока не придут все предыдущие.
+    """
+    from Source.output import OUTPUT_BUFFER_LINES
+
+    context = multiprocessing.get_context("spawn")
+    buckets = {
+        "nominatim": SharedTokenBucket(
+            nominatim_scheduler.bucket.rate, nominatim_scheduler.bucket.burst,
+            context),
+        "dadata": SharedTokenBucket(
+            dadata_scheduler.bucket.rate, dadata_scheduler.bucket.burst,
+            context),
+    }
+    inboxes = [context.Queue(maxsize=INBOX_CHUNKS) for _ in range(workers)]
+    outbox = context.Queue()
+    processes = [
+        context.Process(
+            target=_worker, args=(index, inboxes[index], outbox, buckets,
+                                  concurrency),
+            daemon=True)
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    failed = threading.Event()
+    feeder = threading.Thread(
+        target=_feed, args=(input_stream, inboxes, failed), daemon=True)
+    feeder.start()
+
+    stats = ShardedStats()
+    held: Dict[int, str] = {}
+    next_seq = 0
+    lines: List[str] = []
+    running = set(range(workers))
+    try:
+        while running:
+            try:
+                message = outbox.get(timeout=1.0)
+            except queue.Empty:
+                dead = [index for index in running
+                        if not processes[index].is_alive()]
+                if dead:
+                    raise RuntimeError(
+                        f"Рабочий процесс {dead[0]} завершился без результатов")
+                continue
+            if message[0] == _DONE:
+                _, index, report, error, snapshot = message
+                metrics.merge(snapshot)
+                if error is not None:
+                    raise RuntimeError(
+                        f"Рабочий процесс {index} завершился с ошибкой:\n"
+                        f"{error}")
+                running.discard(index)
+                stats.worker_reports[index] = report
+                continue
+            for seq, status, line in message:
+                stats.count(status)
+                if not ordered:
+                    lines.append(line)
+                    continue
+                held[seq] = line
+            while next_seq in held:
+                lines.append(held.pop(next_seq))
+                next_seq += 1
+            if len(lines) >= OUTPUT_BUFFER_LINES:
+                output_stream.write("\n".join(lines) + "\n")
+                lines.clear()
+        if held:
+            # строки после пропуска не пишем: вывод разошёлся бы со входом
+            raise RuntimeError(
+                f"Нет результата для записи {next_seq} входного потока")
+    except BaseException:
+        failed.set()
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        if lines:
+            output_stream.write("\n".join(lines) + "\n")
+        output_stream.flush()
+        for process in processes:
+            process.join()
+    feeder.join()
+    stats.finish()
+    return stats
@@ -0,0 +1,60 @@
+"""Объединение одновременных одинаковых запросов в один вызов."""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # Ошибку получит лидер; без ожидающих не нужен лишний warning.
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """Пока вызов с ключом key выполняется, повторные вызовы ждут его.
+
+    Все ожидающие получают тот же результат или то же исключение.
+    Если лидер отменён, первый из ожидающих выполняет вызов сам.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        self._calls[key] = future
+        self.executed += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
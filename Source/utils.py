@@ -1,11 +1,50 @@
+import math
+import os
 from typing import Dict, Iterable, List, Optional
 
-NOMINATIM_URL: str = "https://nominatim.openstreetmap.org/search"
+# Базовые адреса Nominatim через запятую: публичный сервис или свои
+# зеркала; между ними выбирает Source.endpoints.
+NOMINATIM_URLS: List[str] = [
+    url.strip().rstrip("/")
+    for url in os.getenv(
+        "GEOCODER_NOMINATIM_URLS",
+        "https://nominatim.openstreetmap.org").split(",")
+    if url.strip()
+]
+NOMINATIM_SEARCH_PATH = "/search"
+NOMINATIM_REVERSE_PATH = "/reverse"
 DEFAULT_HEADERS = {
     "User-Agent": "CustomRussianGeocoder/1.0 (educational project)",
 }
 
 
+def env_number(name: str, default: float) -> float:
+    """Число из переменной окружения или default, если оно не задано."""
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу между двумя точками, в метрах."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
 def _first_non_empty(
         mapping: Dict[str, str],
         keys: Iterable[str]) -> Optional[str]:
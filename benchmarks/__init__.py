@@ -0,0 +1 @@
+"""Нагрузочные замеры конвейера геокодирования."""
@@ -0,0 +1,61 @@
+"""Микрозамер построения ключа кэша.
+
+    python -m benchmarks.canonical_bench --number 100000
+
+Печатает время одного вызова canonical_key в микросекундах для
+нескольких типичных запросов и прежней нормализации (casefold и
+схлопывание пробелов) для сравнения.
+"""
+
+import argparse
+import sys
+import timeit
+from typing import Dict, List, Optional
+
+from Source.canonical import canonical_key
+
+SAMPLES = (
+    "Екатеринбург, ул. Белинского, д.86",
+    "г. Санкт-Петербург, пр-т Невский, д. 28, корп. 1",
+    "ЕКБ улица Ленина 5",
+    "Москва, Тверская улица, 7",
+    "Свердловская обл., г. Екатеринбург, ул. Малышева, 51, кв. 12",
+)
+
+
+def _casefold_key(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+def measure(number: int, repeat: int = 5) -> List[Dict]:
+    """Лучшее из repeat время вызова на каждом образце, в микросекундах."""
+    results = []
+    for sample in SAMPLES:
+        row = {"query": sample, "key": canonical_key(sample)}
+        for name, function in (("canonical", canonical_key),
+                               ("casefold", _casefold_key)):
+            best = min(timeit.repeat(
+                lambda: function(sample), number=number, repeat=repeat))
+            row[f"{name}_us"] = best / number * 1e6
+        results.append(row)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.canonical_bench",
+        description="Время построения ключа кэша на один запрос.")
+    parser.add_argument("--number", type=int, default=100_000,
+                        help="вызовов в одном замере")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for row in measure(args.number, args.repeat):
+        print(f"{row['canonical_us']:6.2f} мкс "
+              f"(casefold {row['casefold_us']:.2f})  "
+              f"{row['query']!r} -> {row['key']!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""Локальные заглушки Nominatim и DaData для замеров.
+
+Один HTTP-сервер отвечает на
+    GET  /search?q=...             — как Nominatim
+    GET  /reverse?lat=...&lon=...  — как Nominatim
+    POST /api/v1/clean/address     — как «Стандартизация» DaData
+
+Задержка и доля ошибок (HTTP 503) настраиваются отдельно для
+Nominatim и DaData. Ответы детерминированы: один и тот же запрос
+всегда даёт одну и ту же точку.
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+HOUSE_RE = re.compile(r"^(?P<street>.*?)\s+(?P<house>\d+\S*)$")
+
+
+def _point(text: str) -> Tuple[float, float]:
+    """Точка внутри России, зависящая только от текста."""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    a = int.from_bytes(digest[:4], "big") / 2 ** 32
+    b = int.from_bytes(digest[4:], "big") / 2 ** 32
+    return round(45 + a * 20, 7), round(30 + b * 100, 7)
+
+
+def _address_parts(text: str) -> Dict[str, str]:
+    city, _, rest = text.partition(",")
+    parts = {"city": city.strip(), "country": "Россия", "country_code": "ru"}
+    match = HOUSE_RE.match(rest.strip())
+    if match:
+        parts["road"] = match.group("street")
+        parts["house_number"] = match.group("house")
+    elif rest.strip():
+        parts["road"] = rest.strip()
+    return parts
+
+
+class FakeUpstream:
+    """Заглушка внешних сервисов в отдельном потоке.
+
+    Считает обращения к каждому сервису; контекстный менеджер.
+    """
+
+    def __init__(self,
+                 nominatim_latency: float = 0.0,
+                 dadata_latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 seed: int = 0) -> None:
+        self.nominatim_latency = nominatim_latency
+        self.dadata_latency = dadata_latency
+        self.error_rate = error_rate
+        self.calls: Dict[str, int] = {"search": 0, "reverse": 0, "clean": 0}
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        # сервер должен принимать соединения быстрее, чем растёт очередь
+        self._server.request_queue_size = 1024
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True,
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _fail(self, kind: str) -> bool:
+        with self._lock:
+            self.calls[kind] += 1
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+    def search(self, params: Dict[str, str]) -> Tuple[int, object]:
+        time.sleep(self.nominatim_latency)
+        if self._fail("search"):
+            return 503, {"error": "overloaded"}
+        query = params.get("q", "")
+        lat, lon = _point(query)
+        address = _address_parts(query)
+        return 200, [{
+            "lat": str(lat),
+            "lon": str(lon),
+            "display_name": f"{query}, Россия",
+            "address": address,
+        }]
+
+    def reverse(self, params: Dict[str, str]) -> Tuple[int, object]:
+        time.sleep(self.nominatim_latency)
+        if self._fail("reverse"):
+            return 503, {"error": "overloaded"}
+        lat, lon = params.get("lat", "0"), params.get("lon", "0")
+        return 200, {
+            "lat": lat,
+            "lon": lon,
+            "display_name": f"Точка {lat} {lon}, Россия",
+            "address": {"city": "Бенчград", "country": "Россия"},
+        }
+
+    def clean(self, body: List[str]) -> Tuple[int, object]:
+        time.sleep(self.dadata_latency)
+        if self._fail("clean"):
+            return 503, {"error": "overloaded"}
+        text = body[0] if body else ""
+        text = text.rsplit(" Россия", 1)[0]
+        parts = _address_parts(text)
+        return 200, [{
+            "result": text,
+            "city": parts.get("city"),
+            "street": parts.get("road"),
+            "house": parts.get("house_number"),
+            "country": "Россия",
+        }]
+
+    def _make_handler(self):
+        fake = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_args):
+                return None
+
+            def _reply(self, status: int, payload: object) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                params = {
+                    key: values[0]
+                    for key, values in parse_qs(parts.query).items()
+                }
+                if parts.path == "/search":
+                    self._reply(*fake.search(params))
+                elif parts.path == "/reverse":
+                    self._reply(*fake.reverse(params))
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b"[]"
+                if urlsplit(self.path).path.endswith("/clean/address"):
+                    try:
+                        body: Optional[list] = json.loads(raw)
+                    except ValueError:
+                        body = None
+                    if isinstance(body, list):
+                        self._reply(*fake.clean(body))
+                        return
+                    self._reply(400, {"error": "bad body"})
+                else:
+                    self._reply(404, {"error": "not found"})
+
+        return _Handler
+
+    def __enter__(self) -> "FakeUpstream":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
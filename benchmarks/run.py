@@ -0,0 +1,325 @@
+"""Сквозной замер конвейера геокодирования на локальных заглушках.
+
+    python -m benchmarks.run --requests 2000 --unique 500 \
+        --concurrency 1,8,32,128 --modes direct,batch,http \
+        --nominatim-latency-ms 50 --dadata-latency-ms 20 --error-rate 0.01 \
+        --output bench.json
+
+Режимы:
+    direct — parsing.handle_free_query напрямую;
+    batch  — batch.geocode_stream (как --batch);
+    http   — GET /search к http_server.GeocoderServer.
+
+Для каждого режима и уровня параллельности печатается QPS, p50/p95/p99
+задержки, доля ответов из кэша и пиковый RSS процесса; всё вместе
+сохраняется в JSON, чтобы сравнивать прогоны между собой.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from typing import Dict, List, Optional, Sequence
+
+from benchmarks.fakes import FakeUpstream
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+MODES = ("direct", "batch", "http")
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга; 0 для пустой выборки."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[min(int(rank), len(ordered)) - 1]
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт КиБ, macOS — байты
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def make_workload(tag: str, requests: int, unique: int,
+                  coords_share: float, seed: int) -> List[str]:
+    """Запросы с повторами: unique разных адресов на requests обращений.
+
+    Точки, как и адреса, зависят от tag: у прогонов с разными tag кэш
+    координат тоже не пересекается.
+    """
+    rng = random.Random(f"{seed}:{tag}")
+    addresses = [
+        f"Бенчград {tag}, улица Тестовая {n}" for n in range(unique)]
+    points = [
+        f"{rng.uniform(45, 65):.5f} {rng.uniform(30, 130):.5f}"
+        for _ in range(max(1, int(unique * coords_share)))
+    ]
+    return [
+        rng.choice(points) if rng.random() < coords_share
+        else rng.choice(addresses)
+        for _ in range(requests)
+    ]
+
+
+def _summary(mode: str, concurrency: int, latencies: List[float],
+             statuses: Counter, elapsed: float,
+             upstream: FakeUpstream, calls_before: Dict[str, int]) -> Dict:
+    total = len(latencies)
+    found = statuses.get("cache", 0) + statuses.get("upstream", 0)
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": total,
+        "elapsed_s": round(elapsed, 4),
+        "qps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(max(latencies, default=0.0) * 1000, 3),
+            "mean": round(sum(latencies) / total * 1000, 3) if total else 0.0,
+        },
+        "statuses": dict(statuses),
+        "cache_hit_ratio": round(statuses.get("cache", 0) / total, 4)
+        if total else 0.0,
+        "found_ratio": round(found / total, 4) if total else 0.0,
+        "upstream_calls": {
+            kind: count - calls_before.get(kind, 0)
+            for kind, count in upstream.calls.items()
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def _run_direct(queries: List[str], concurrency: int):
+    from Source import parsing
+
+    slots = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def one(query: str) -> None:
+        async with slots:
+            started = time.perf_counter()
+            result = await parsing.handle_free_query(query)
+            latencies.append(time.perf_counter() - started)
+            statuses[result.status if result else "error"] += 1
+
+    await asyncio.gather(*(one(query) for query in queries))
+    return latencies, statuses
+
+
+async def _run_batch(queries: List[str], concurrency: int):
+    from Source import batch, parsing
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def timed(query: str):
+        started = time.perf_counter()
+        try:
+            return await parsing.handle_free_query(query)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    records = ({"query": query} for query in queries)
+    async for _record, result in batch.geocode_stream(
+            records, concurrency, ordered=True, handler=timed):
+        statuses[result.status] += 1
+    return latencies, statuses
+
+
+async def _run_http(queries: List[str], concurrency: int):
+    import httpx
+    from http_server import GeocoderServer
+
+    server = GeocoderServer(concurrency)
+    listener = await server.start("127.0.0.1", 0)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+
+    try:
+        async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{server.port}",
+                limits=limits, timeout=60) as client:
+
+            async def one(query: str) -> None:
+                async with slots:
+                    started = time.perf_counter()
+                    try:
+                        reply = await client.get("/search", params={"q": query})
+                        status = reply.json().get("status", "error")
+                    except (httpx.HTTPError, ValueError):
+                        status = "error"
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] += 1
+
+            await asyncio.gather(*(one(query) for query in queries))
+    finally:
+        listener.close()
+        await listener.wait_closed()
+    return latencies, statuses
+
+
+RUNNERS = {"direct": _run_direct, "batch": _run_batch, "http": _run_http}
+
+
+def _fake_dadata_client(base_url: str):
+    """Клиент DaData, который ходит в заглушку вместо cleaner.dadata.ru."""
+    from dadata.sync import CleanClient
+
+    class BenchCleanClient(CleanClient):
+        BASE_URL = base_url
+
+    return BenchCleanClient("bench-token", "bench-secret")
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict:
+    """Все прогоны по очереди; модули Source подключаются здесь."""
+    from Source import http_client, parsing
+    from Source.database import models
+    from Source.database.requests import flush_pending_writes
+    from Source.endpoints import nominatim_endpoints
+    from Source.scheduler import dadata_scheduler, nominatim_scheduler
+
+    await models.init_db()
+    runs = []
+    saved = (nominatim_endpoints.endpoints, parsing._client,
+             nominatim_scheduler.bucket, dadata_scheduler.bucket)
+    with FakeUpstream(args.nominatim_latency_ms / 1000,
+                      args.dadata_latency_ms / 1000,
+                      args.error_rate, args.seed) as upstream:
+        nominatim_endpoints.configure([upstream.url])
+        parsing._client = _fake_dadata_client(f"{upstream.url}/api/v1/")
+        nominatim_scheduler.configure(rate=args.nominatim_rate)
+        dadata_scheduler.configure(rate=args.dadata_rate)
+        stamp = f"{int(time.time()):x}"
+        try:
+            for mode in args.modes:
+                for concurrency in args.concurrency:
+                    # у каждого прогона свои адреса, поэтому кэш холодный
+                    queries = make_workload(
+                        f"{stamp}{mode[0]}{concurrency}", args.requests,
+                        args.unique, args.coords_share, args.seed)
+                    calls_before = dict(upstream.calls)
+                    started = time.perf_counter()
+                    with redirect_stdout(io.StringIO()):
+                        latencies, statuses = await RUNNERS[mode](
+                            queries, concurrency)
+                    elapsed = time.perf_counter() - started
+                    await flush_pending_writes()
+
+                    summary = _summary(mode, concurrency, latencies, statuses,
+                                       elapsed, upstream, calls_before)
+                    runs.append(summary)
+                    print(format_summary(summary), file=sys.stderr)
+        finally:
+            nominatim_endpoints.endpoints, parsing._client = saved[:2]
+            nominatim_scheduler.bucket, dadata_scheduler.bucket = saved[2:]
+            await http_client.close()
+            for engine in (models.engine, models.read_engine):
+                if engine is not None:
+                    await engine.dispose()
+
+    return {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: value for key, value in vars(args).items()
+            if key != "output"
+        },
+        "runs": runs,
+    }
+
+
+def format_summary(run: Dict) -> str:
+    latency = run["latency_ms"]
+    rss = run["peak_rss_mb"]
+    rss_text = f"RSS {rss:.0f} МБ" if rss is not None else "RSS н/д"
+    return (
+        f"{run['mode']:>6} c={run['concurrency']:<4} "
+        f"{run['qps']:>9.1f} запр./с  "
+        f"p50 {latency['p50']:.1f} p95 {latency['p95']:.1f} "
+        f"p99 {latency['p99']:.1f} мс  "
+        f"кэш {run['cache_hit_ratio']:.1%}  {rss_text}"
+    )
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def _mode_list(value: str) -> List[str]:
+    modes = [part.strip() for part in value.split(",") if part.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"неизвестные режимы: {', '.join(sorted(unknown))}")
+    return modes
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Замер конвейера геокодирования на локальных заглушках.")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="запросов в одном прогоне")
+    parser.add_argument("--unique", type=int, default=500,
+                        help="разных адресов среди них (остальное — повторы)")
+    parser.add_argument("--coords-share", type=float, default=0.1,
+                        help="доля запросов-координат")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32],
+                        help="уровни параллельности через запятую")
+    parser.add_argument("--modes", type=_mode_list, default=list(MODES),
+                        help="режимы через запятую: direct,batch,http")
+    parser.add_argument("--nominatim-latency-ms", type=float, default=50.0)
+    parser.add_argument("--dadata-latency-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="доля ответов заглушек с HTTP 503")
+    parser.add_argument("--nominatim-rate", type=float, default=0.0,
+                        help="ограничение частоты Nominatim (0 — без него)")
+    parser.add_argument("--dadata-rate", type=float, default=0.0,
+                        help="ограничение частоты DaData (0 — без него)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", default="bench.json",
+                        help="куда сохранить результаты в JSON")
+    parser.add_argument("--db", default=None,
+                        help="файл SQLite (по умолчанию — временный)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        # путь к базе читается при импорте Source.database.models
+        os.environ["GEOCODER_DB_PATH"] = args.db or os.path.join(
+            tmp, "bench.sqlite3")
+        report = asyncio.run(run_benchmark(args))
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(report, out, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
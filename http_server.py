@@ -0,0 +1,427 @@
+"""HTTP-сервис геокодирования на asyncio.
+
+    GET  /search?q=...             — адрес или координаты в свободной форме
+    GET  /reverse?lat=...&lon=...  — адрес по координатам
+    POST /batch                    — NDJSON на входе и на выходе, потоково
+    GET  /health                   — проверка живости
+    GET  /metrics                  — метрики в текстовом формате Prometheus
+
+Соединения держатся открытыми (HTTP/1.1 keep-alive). Процесс использует
+один движок БД и один пул HTTP-соединений к внешним сервисам.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from contextlib import redirect_stdout, suppress
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from Source import batch, http_client, parsing
+from Source.database.models import init_db
+from Source.database.requests import flush_pending_writes
+from Source.metrics import metrics
+from Source.output import dumps, human_output, result_record
+from Source.result import (STATUS_CACHE, STATUS_ERROR, STATUS_INVALID,
+                           STATUS_NOT_FOUND, STATUS_OFFLINE,
+                           STATUS_OUTSIDE_RUSSIA, STATUS_UPSTREAM,
+                           GeocodeResult)
+from Source.utils import env_number
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_CONCURRENCY = int(env_number("GEOCODER_SERVER_CONCURRENCY", 64))
+KEEP_ALIVE_TIMEOUT = env_number("GEOCODER_SERVER_KEEPALIVE", 15.0)
+MAX_HEADER_BYTES = 16 * 1024
+# Предел одного блока chunked-тела и одной строки NDJSON в /batch: тело
+# читается потоком, и без них клиент мог бы занять сколько угодно памяти.
+MAX_CHUNK_BYTES = 1024 * 1024
+MAX_LINE_BYTES = 64 * 1024
+MAX_BATCH_CONCURRENCY = 256
+
+HTTP_STATUS_BY_RESULT = {
+    STATUS_CACHE: 200,
+    STATUS_UPSTREAM: 200,
+    STATUS_OFFLINE: 200,
+    STATUS_NOT_FOUND: 404,
+    STATUS_OUTSIDE_RUSSIA: 404,
+    STATUS_INVALID: 400,
+    STATUS_ERROR: 502,
+}
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    502: "Bad Gateway",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self,
+                 method: str,
+                 target: str,
+                 version: str,
+                 headers: Dict[str, str],
+                 reader: asyncio.StreamReader) -> None:
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.params = {
+            key: values[0]
+            for key, values in parse_qs(parts.query).items()
+        }
+        self.version = version
+        self.headers = headers
+        self._reader = reader
+        self.body_consumed = not (
+            "content-length" in headers
+            or "chunked" in headers.get("transfer-encoding", "").lower()
+        )
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    async def _body_chunks(self) -> AsyncIterator[bytes]:
+        if "chunked" in self.headers.get("transfer-encoding", "").lower():
+            while True:
+                try:
+                    # ValueError и от слишком длинной строки (limit потока)
+                    size_line = await self._reader.readline()
+                    size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                except ValueError:
+                    raise HttpError(400, "Некорректный размер блока")
+                if size < 0:
+                    raise HttpError(400, "Некорректный размер блока")
+                if size > MAX_CHUNK_BYTES:
+                    raise HttpError(413, "Слишком большой блок")
+                if size == 0:
+                    # пропускаем trailer-заголовки до пустой строки
+                    while (await self._reader.readline()).strip():
+                        pass
+                    break
+                yield await self._reader.readexactly(size)
+                await self._reader.readexactly(2)
+        else:
+            remaining = int(self.headers.get("content-length") or 0)
+            while remaining > 0:
+                chunk = await self._reader.read(min(remaining, 64 * 1024))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(chunk)
+                yield chunk
+        self.body_consumed = True
+
+    async def body_lines(self) -> AsyncIterator[str]:
+        """Строки тела запроса по мере их поступления."""
+        buffer = b""
+        async for chunk in self._body_chunks():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8", errors="replace")
+            if len(buffer) > MAX_LINE_BYTES:
+                raise HttpError(413, "Слишком длинная строка")
+        if buffer:
+            yield buffer.decode("utf-8", errors="replace")
+
+    async def discard_body(self) -> None:
+        async for _chunk in self._body_chunks():
+            pass
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Читает заголовки очередного запроса; None — клиент ушёл."""
+    try:
+        head = await asyncio.wait_for(
+            reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+            ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, "Слишком большие заголовки")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Некорректная строка запроса")
+
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    try:
+        if int(headers.get("content-length", "0")) < 0:
+            raise ValueError
+    except ValueError:
+        raise HttpError(400, "Некорректный Content-Length")
+    return Request(method.upper(), target, version.strip(), headers, reader)
+
+
+def _json_bytes(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+class GeocoderServer:
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY) -> None:
+        self.concurrency = max(1, concurrency)
+        self._limiter: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = DEFAULT_HOST,
+                    port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        self._limiter = asyncio.Semaphore(self.concurrency)
+        self._server = await asyncio.start_server(
+            self._handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        return self._server
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def geocode(self, query: str) -> GeocodeResult:
+        """Обрабатывает запрос, не превышая общий лимит параллельности."""
+        async with self._limiter:
+            try:
+                result = await parsing.handle_free_query(query)
+            except Exception as exc:  # noqa: BLE001
+                print(f"[HTTP] Ошибка при обработке запроса {query!r}: {exc}")
+                result = None
+        return result or GeocodeResult(query, STATUS_ERROR)
+
+    async def _handle_connection(self,
+                                 reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as exc:
+                    await self._send_json(
+                        writer, exc.status, {"error": exc.message}, False)
+                    break
+                if request is None:
+                    break
+
+                try:
+                    keep_alive = await self._dispatch(request, writer)
+                except HttpError as exc:
+                    # тело не разобрать: ответить и закрыть соединение
+                    await self._send_json(
+                        writer, exc.status, {"error": exc.message}, False)
+                    break
+                if not (keep_alive and request.body_consumed):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with suppress(Exception):
+                await writer.wait_closed()
+
+    async def _dispatch(self, request: Request,
+                        writer: asyncio.StreamWriter) -> bool:
+        keep_alive = request.keep_alive
+        routes = {
+            "/health": ("GET", self._health),
+            "/metrics": ("GET", self._metrics),
+            "/search": ("GET", self._search),
+            "/reverse": ("GET", self._reverse),
+            "/batch": ("POST", self._batch),
+        }
+        route = routes.get(request.path)
+        if route is None:
+            await request.discard_body()
+            await self._send_json(
+                writer, 404, {"error": "Неизвестный адрес"}, keep_alive)
+            return keep_alive
+
+        method, handler = route
+        if request.method != method:
+            await request.discard_body()
+            await self._send_json(
+                writer, 405, {"error": f"Ожидается {method}"}, keep_alive)
+            return keep_alive
+
+        return await handler(request, writer)
+
+    async def _health(self, request: Request,
+                      writer: asyncio.StreamWriter) -> bool:
+        await request.discard_body()
+        await self._send_json(
+            writer, 200, {"status": "ok"}, request.keep_alive)
+        return request.keep_alive
+
+    async def _metrics(self, request: Request,
+                       writer: asyncio.StreamWriter) -> bool:
+        await request.discard_body()
+        body = metrics.render_prometheus().encode("utf-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            + f"Content-Length: {len(body)}\r\n".encode("latin-1")
+            + self._connection_header(request.keep_alive)
+            + b"\r\n"
+            + body
+        )
+        await writer.drain()
+        return request.keep_alive
+
+    async def _search(self, request: Request,
+                      writer: asyncio.StreamWriter) -> bool:
+        await request.discard_body()
+        query = request.params.get("q", "")
+        result = await self.geocode(query)
+        await self._send_result(writer, result, request.keep_alive)
+        return request.keep_alive
+
+    async def _reverse(self, request: Request,
+                       writer: asyncio.StreamWriter) -> bool:
+        await request.discard_body()
+        try:
+            lat = float(request.params["lat"])
+            lon = float(request.params["lon"])
+        except (KeyError, ValueError):
+            result = GeocodeResult(
+                f"{request.params.get('lat', '')} "
+                f"{request.params.get('lon', '')}".strip(),
+                STATUS_INVALID,
+            )
+        else:
+            result = await self.geocode(f"{lat} {lon}")
+        await self._send_result(writer, result, request.keep_alive)
+        return request.keep_alive
+
+    async def _batch(self, request: Request,
+                     writer: asyncio.StreamWriter) -> bool:
+        """NDJSON-поток: результаты отдаются, пока тело ещё читается."""
+        try:
+            concurrency = int(request.params.get(
+                "concurrency", batch.DEFAULT_CONCURRENCY))
+        except ValueError:
+            concurrency = batch.DEFAULT_CONCURRENCY
+        concurrency = min(max(1, concurrency), MAX_BATCH_CONCURRENCY)
+        ordered = request.params.get("ordered", "1") not in ("0", "false")
+
+        async def records():
+            async for line in request.body_lines():
+                line = line.strip()
+                if line:
+                    yield batch.parse_record(line)
+
+        keep_alive = request.keep_alive
+        started = False
+
+        def start() -> None:
+            # заголовки уходят с первым результатом: ошибка в начале тела
+            # ещё может получить свой код ответа
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: application/x-ndjson; charset=utf-8\r\n"
+                b"Transfer-Encoding: chunked\r\n"
+                + self._connection_header(keep_alive)
+                + b"\r\n"
+            )
+
+        try:
+            async for record, result in batch.geocode_stream(
+                    records(), concurrency, ordered, handler=self.geocode):
+                if not started:
+                    start()
+                    started = True
+                self._write_chunk(
+                    writer, batch.format_result_line(record, result))
+                await writer.drain()
+        except HttpError as exc:
+            if not started:
+                raise
+            # заголовки уже отправлены: ошибка — последней строкой потока
+            self._write_chunk(writer, dumps({"error": exc.message}))
+            keep_alive = False
+        if not started:
+            start()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, line: str) -> None:
+        data = (line + "\n").encode("utf-8")
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    @staticmethod
+    def _connection_header(keep_alive: bool) -> bytes:
+        return b"Connection: keep-alive\r\n" if keep_alive else (
+            b"Connection: close\r\n")
+
+    async def _send_result(self, writer: asyncio.StreamWriter,
+                           result: GeocodeResult, keep_alive: bool) -> None:
+        status = HTTP_STATUS_BY_RESULT.get(result.status, 502)
+        await self._send_json(writer, status, result_record(result), keep_alive)
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int,
+                         payload, keep_alive: bool) -> None:
+        body = _json_bytes(payload)
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n".encode("latin-1")
+            + self._connection_header(keep_alive)
+            + b"\r\n"
+            + body
+        )
+        await writer.drain()
+
+
+async def serve(host: str, port: int, concurrency: int) -> None:
+    # ответы уходят клиентам; JSON с отступами в журнале не нужен
+    human_output.set(False)
+    await init_db()
+    server = GeocoderServer(concurrency)
+    listener = await server.start(host, port)
+    print(f"Геокодер слушает http://{host}:{server.port}", file=sys.stderr)
+    try:
+        # Сообщения конвейера — это журнал, а не ответ клиенту.
+        with redirect_stdout(sys.stderr):
+            async with listener:
+                await listener.serve_forever()
+    finally:
+        await flush_pending_writes()
+        await http_client.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="HTTP-сервис российского геокодера.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help="сколько запросов геокодируется одновременно",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.concurrency))
+    except KeyboardInterrupt:
+        pass
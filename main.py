@@ -1,30 +1,114 @@
+import argparse
 import asyncio
+import hashlib
+import importlib
 import os
+import re
 import subprocess
 import sys
-from typing import Optional
+from typing import List, Optional
 
-from Source import parsing
-from Source.database.models import init_db
+from Source.database.memory_cache import memory_cache
+from Source.endpoints import nominatim_endpoints
+from Source.metrics import metrics
+from Source.scheduler import dadata_scheduler, nominatim_scheduler
+
+# Тяжёлые модули (SQLAlchemy, httpx, dadata) подключаются только там, где
+# они нужны: справка и выход из программы обходятся без них.
+_LAZY_MODULES = {
+    "batch": "Source.batch",
+    "http_client": "Source.http_client",
+    "parsing": "Source.parsing",
+    "response": "Source.response",
+}
+
+# Команды, которым не нужны ни база, ни сеть.
+HELP_COMMANDS = ("--help", "-h")
+EXIT_COMMANDS = ("exit", "выход")
+LOCAL_COMMANDS = HELP_COMMANDS + EXIT_COMMANDS
+
+STAMP_NAME = ".requirements.stamp"
+_REQUIREMENT_NAME_RE = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+def __getattr__(name: str):
+    module = _LAZY_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return importlib.import_module(module)
+
+
+def _requirements_digest(content: bytes) -> str:
+    """Ключ отметки: файл зависимостей и интерпретатор, для которого он проверен."""
+    digest = hashlib.sha256(content)
+    digest.update(sys.executable.encode("utf-8", "replace"))
+    digest.update(sys.version.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _missing_requirements(content: bytes) -> List[str]:
+    """Пакеты из файла зависимостей, которых нет в окружении.
+
+    Смотрятся только метаданные установленных пакетов, сами пакеты
+    не импортируются.
+    """
+    from importlib import metadata
+
+    missing = []
+    for line in content.decode("utf-8", "replace").splitlines():
+        line = line.split("#", 1)[0]
+        match = _REQUIREMENT_NAME_RE.match(line)
+        if match is None or line.lstrip().startswith("-"):
+            continue
+        try:
+            metadata.distribution(match.group(1))
+        except metadata.PackageNotFoundError:
+            missing.append(match.group(1))
+    return missing
 
 
 def ensure_dependencies_installed(
-        requirements_file: Optional[str] = "requirements.txt") -> None:
+        requirements_file: Optional[str] = "requirements.txt",
+        stamp_file: Optional[str] = None) -> None:
+    """Доустанавливает зависимости, если их нет.
+
+    Результат проверки запоминается в отметке рядом с файлом
+    зависимостей; пока файл и интерпретатор те же, запуск обходится
+    чтением двух маленьких файлов. pip вызывается, только если
+    какого-то пакета действительно нет.
+    """
     if not requirements_file:
         return
 
     if not os.path.exists(requirements_file):
         return
 
+    if stamp_file is None:
+        stamp_file = os.path.join(
+            os.path.dirname(requirements_file), STAMP_NAME)
+
     try:
-        with open(os.devnull, "wb") as devnull:
-            subprocess.check_call(
-                [sys.executable,
-                    "-m", "pip", "install", "-r",
-                    requirements_file],
-                stdout=devnull,
-                stderr=devnull,
-            )
+        with open(requirements_file, "rb") as requirements:
+            content = requirements.read()
+        digest = _requirements_digest(content)
+        try:
+            with open(stamp_file, "r", encoding="ascii") as stamp:
+                if stamp.read().strip() == digest:
+                    return
+        except OSError:
+            pass
+
+        if _missing_requirements(content):
+            with open(os.devnull, "wb") as devnull:
+                subprocess.check_call(
+                    [sys.executable,
+                        "-m", "pip", "install", "-r",
+                        requirements_file],
+                    stdout=devnull,
+                    stderr=devnull,
+                )
+        with open(stamp_file, "w", encoding="ascii") as stamp:
+            stamp.write(digest + "\n")
     except Exception:
         return
 
@@ -45,13 +129,230 @@ def show_help() -> None:
 Специальные команды:
     --help      — показать эту справку
     --examples  — показать примеры запросов
+    --batch ФАЙЛ — пакетная обработка JSONL (подробнее: --batch --help)
+    --stats     — в конце вывести в stderr время этапов и счётчики
+    --jsonl     — результаты одной строкой JSON на запрос; без запроса
+                  в аргументах запросы читаются из stdin по одному на строку
+    --import-osm ФАЙЛ — загрузить выгрузку адресов OSM в локальный реестр
+    --export-cache ФАЙЛ — выгрузить кэш адресов в снимок (.jsonl.gz)
+    --import-cache ФАЙЛ — загрузить снимок кэша с другого узла
     exit / выход — завершить работу
 """
     )
 
 
+def build_batch_parser() -> argparse.ArgumentParser:
+    from Source.batch import DEFAULT_CONCURRENCY
+
+    parser = argparse.ArgumentParser(
+        prog="main.py --batch",
+        description="Пакетное геокодирование запросов из JSONL-файла.",
+    )
+    parser.add_argument(
+        "input",
+        help="JSONL-файл: строки вида {\"query\": \"...\"} ('-' — stdin)",
+    )
+    parser.add_argument(
+        "-o", "--output", default="-",
+        help="куда писать JSONL-результаты ('-' — stdout)",
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help="сколько запросов обрабатывать одновременно",
+    )
+    parser.add_argument(
+        "--unordered", action="store_true",
+        help="выводить результаты по мере готовности, а не в порядке входа",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1,
+        help="сколько процессов делят работу (одинаковые запросы попадают "
+             "в один процесс; --concurrency — на каждый процесс)",
+    )
+    return parser
+
+
+def build_import_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="main.py --import-osm",
+        description="Импорт выгрузки адресов OSM в локальный реестр "
+                    "для работы без Nominatim (GEOCODER_OFFLINE).",
+    )
+    parser.add_argument(
+        "input",
+        help="OSM XML или GeoJSON по строкам, можно .gz/.bz2 ('-' — stdin)",
+    )
+    parser.add_argument(
+        "--format", choices=("xml", "geojson"), default=None,
+        help="формат файла (по умолчанию — по расширению)",
+    )
+    parser.add_argument(
+        "--region", default="",
+        help="регион для адресов, у которых он не указан",
+    )
+    parser.add_argument(
+        "--city", default="",
+        help="город для адресов, у которых он не указан",
+    )
+    parser.add_argument(
+        "--replace", action="store_true",
+        help="удалить ранее импортированные адреса",
+    )
+    return parser
+
+
+def build_cache_export_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="main.py --export-cache",
+        description="Выгрузка кэша адресов в снимок для прогрева другого узла.",
+    )
+    parser.add_argument("output", help="файл снимка (JSONL, сжатый gzip)")
+    return parser
+
+
+def build_cache_import_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="main.py --import-cache",
+        description="Загрузка снимка кэша адресов, выгруженного --export-cache.",
+    )
+    parser.add_argument("input", help="файл снимка")
+    parser.add_argument(
+        "--replace", action="store_true",
+        help="очистить кэш перед загрузкой (иначе известные запросы "
+             "остаются как есть)",
+    )
+    return parser
+
+
+async def export_cache_mode(argv: List[str]) -> None:
+    from Source.database.snapshot import export_cache
+
+    args = build_cache_export_parser().parse_args(argv)
+    try:
+        stats = await export_cache(args.output)
+    except (OSError, ValueError) as exc:
+        print(f"Не удалось выгрузить снимок: {exc}", file=sys.stderr)
+        return
+    print(stats.format(), file=sys.stderr)
+
+
+async def import_cache_mode(argv: List[str]) -> None:
+    from Source.database.snapshot import import_cache
+
+    args = build_cache_import_parser().parse_args(argv)
+    try:
+        stats = await import_cache(args.input, replace=args.replace)
+    except (OSError, EOFError, ValueError) as exc:
+        print(f"Не удалось загрузить снимок: {exc}", file=sys.stderr)
+        return
+    print(stats.format(), file=sys.stderr)
+
+
+async def import_mode(argv: List[str]) -> None:
+    from Source.database.offline_index import import_osm
+
+    args = build_import_parser().parse_args(argv)
+    if args.input == "-" and args.format is None:
+        build_import_parser().error("для stdin укажите --format")
+    try:
+        stats = await import_osm(
+            args.input, fmt=args.format, region=args.region, city=args.city,
+            replace=args.replace)
+    except ValueError as exc:
+        print(f"Не удалось импортировать реестр: {exc}", file=sys.stderr)
+        return
+    print(stats.format(), file=sys.stderr)
+
+
+async def batch_mode(argv: List[str]) -> None:
+    from Source import batch, parsing, response
+    from Source.database.negative_cache import negative_stats
+    from Source.database.requests import cache_stats
+
+    args = build_batch_parser().parse_args(argv)
+
+    input_stream = (
+        sys.stdin if args.input == "-"
+        else open(args.input, "r", encoding="utf-8")
+    )
+    output_stream = (
+        sys.stdout if args.output == "-"
+        else open(args.output, "w", encoding="utf-8")
+    )
+    try:
+        if args.workers > 1:
+            from Source.sharded import run_sharded
+
+            stats = await asyncio.to_thread(
+                run_sharded,
+                input_stream,
+                output_stream,
+                args.workers,
+                concurrency=args.concurrency,
+                ordered=not args.unordered,
+            )
+        else:
+            stats = await batch.run_batch(
+                input_stream,
+                output_stream,
+                concurrency=args.concurrency,
+                ordered=not args.unordered,
+            )
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+
+    print(stats.format_report(), file=sys.stderr)
+    if args.workers > 1:
+        # кэши и очереди — свои в каждом процессе, их сводка уже в отчёте
+        return
+    print(memory_cache.format(), file=sys.stderr)
+    print(cache_stats.format(), file=sys.stderr)
+    print(negative_stats.format(), file=sys.stderr)
+    print(
+        "Объединено одинаковых запросов: "
+        f"Nominatim {response.upstream_flight.coalesced}, "
+        f"DaData {parsing.normalize_flight.coalesced}",
+        file=sys.stderr,
+    )
+    print(nominatim_scheduler.format(), file=sys.stderr)
+    print(nominatim_endpoints.format(), file=sys.stderr)
+    print(dadata_scheduler.format(), file=sys.stderr)
+
+
+async def jsonl_mode(args: List[str]) -> None:
+    """Результаты в JSON Lines на stdout, сообщения конвейера — в stderr."""
+    from contextlib import redirect_stdout
+
+    from Source import parsing
+    from Source.output import JsonlWriter, human_output
+    from Source.result import STATUS_ERROR, GeocodeResult
+
+    if args:
+        queries = iter([" ".join(args)])
+    else:
+        queries = (line.strip() for line in sys.stdin)
+    # в терминале ответ нужен сразу, в конвейере — пачками
+    writer = JsonlWriter(sys.stdout, 1 if sys.stdin.isatty() else None)
+    quiet = human_output.set(False)
+    try:
+        with redirect_stdout(sys.stderr):
+            for query in queries:
+                if not query:
+                    continue
+                result = await parsing.handle_free_query(query)
+                writer.write(result or GeocodeResult(query, STATUS_ERROR))
+    finally:
+        human_output.reset(quiet)
+        writer.flush()
+
+
 async def handle_query(query: str) -> None:
     """Обрабатывает одну строку запроса: адрес или координаты."""
+    from Source import parsing
+
     await parsing.handle_free_query(query)
 
 
@@ -81,17 +382,43 @@ async def interactive_mode() -> None:
         print("\nЗавершение работы.")
 
 
-async def main() -> None:
-    await init_db()
+async def run_command(args: List[str]) -> None:
+    if "--stats" in args:
+        try:
+            await run_command([arg for arg in args if arg != "--stats"])
+        finally:
+            print(metrics.format_summary(), file=sys.stderr)
+        return
+
+    if "--jsonl" in args:
+        rest = [arg for arg in args if arg != "--jsonl"]
+        if rest and rest[0] == "--batch":
+            # пакетный режим и так пишет JSON Lines
+            await batch_mode(rest[1:])
+        else:
+            await jsonl_mode(rest)
+        return
+    if args and args[0] == "--batch":
+        await batch_mode(args[1:])
+        return
+    if args and args[0] == "--import-osm":
+        await import_mode(args[1:])
+        return
+    if args and args[0] == "--export-cache":
+        await export_cache_mode(args[1:])
+        return
+    if args and args[0] == "--import-cache":
+        await import_cache_mode(args[1:])
+        return
 
-    if len(sys.argv) > 1:
-        arg = " ".join(sys.argv[1:]).strip()
+    if args:
+        arg = " ".join(args).strip()
         lower = arg.lower()
 
-        if lower in ("--help", "-h"):
+        if lower in HELP_COMMANDS:
             show_help()
             return
-        if lower in ("exit", "выход"):
+        if lower in EXIT_COMMANDS:
             print("Завершение работы.")
             return
 
@@ -101,6 +428,38 @@ async def main() -> None:
     await interactive_mode()
 
 
+async def init_db() -> None:
+    from Source.database import models
+
+    await models.init_db()
+
+
+async def shutdown() -> None:
+    """Освобождает общие ресурсы процесса перед выходом."""
+    from Source import http_client
+    from Source.database.requests import flush_pending_writes
+
+    try:
+        await flush_pending_writes()
+    except Exception as exc:  # noqa: BLE001
+        print(f"[БД] Не удалось сохранить адреса: {exc}")
+    await http_client.close()
+
+
+async def main() -> None:
+    args = sys.argv[1:]
+    if " ".join(args).strip().lower() in LOCAL_COMMANDS:
+        await run_command(args)
+        return
+
+    await init_db()
+
+    try:
+        await run_command(args)
+    finally:
+        await shutdown()
+
+
 if __name__ == "__main__":
     try:
         ensure_dependencies_installed()
@@ -0,0 +1,91 @@
+# tests/stand_in.py
+"""Локальный HTTP-сервер-заглушка для тестов сетевого слоя."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+Handler = Callable[[str, Dict[str, str]], Tuple[int, object]]
+
+
+class StandInServer:
+    """Отвечает JSON-ом, который возвращает handler(path, params).
+
+    Считает запросы, соединения и пиковое число одновременных запросов.
+    """
+
+    def __init__(self, handler: Handler, delay: float = 0.0) -> None:
+        self.handler = handler
+        self.delay = delay
+        self.requests = 0
+        self.connections = set()
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True,
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        stand_in = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_args):
+                return None
+
+            def _respond(self):
+                parts = urlsplit(self.path)
+                params = {
+                    key: values[0]
+                    for key, values in parse_qs(parts.query).items()
+                }
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    params["body"] = self.rfile.read(length).decode("utf-8")
+
+                with stand_in._lock:
+                    stand_in.requests += 1
+                    stand_in.connections.add(self.client_address)
+                    stand_in.active += 1
+                    stand_in.peak = max(stand_in.peak, stand_in.active)
+                try:
+                    if stand_in.delay:
+                        time.sleep(stand_in.delay)
+                    status, payload = stand_in.handler(parts.path, params)
+                finally:
+                    with stand_in._lock:
+                        stand_in.active -= 1
+
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _respond
+            do_POST = _respond
+
+        return _Handler
+
+    def __enter__(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,61 @@
+# tests/temp_db.py
+"""Временная база SQLite на время одного тестового модуля.
+
+Тесты не должны писать в db.sqlite3 рабочего каталога: строки с
+настоящими координатами потом отдавались бы пользователям из кэша.
+
+    _db = TempDatabase()
+
+    def setUpModule():
+        _db.start()
+
+    def tearDownModule():
+        _db.stop()
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from Source.database import models
+from Source.database.memory_cache import memory_cache
+from Source.database.negative_cache import _memory as negative_memory
+from Source.database.requests import flush_pending_writes
+
+
+class TempDatabase:
+    """Переключает models на файл во временном каталоге и обратно."""
+
+    def __init__(self) -> None:
+        self.path: Optional[str] = None
+        self._directory: Optional[str] = None
+        self._saved_url: Optional[str] = None
+        self._saved_env: Optional[str] = None
+
+    def start(self) -> None:
+        self._directory = tempfile.mkdtemp(prefix="geocoder-test-")
+        self.path = os.path.join(self._directory, "db.sqlite3")
+        self._saved_url = models.DB_URL
+        self._saved_env = os.environ.get("GEOCODER_DB_PATH")
+        # дочерние процессы (пакетный режим на нескольких процессах)
+        # берут путь из окружения
+        os.environ["GEOCODER_DB_PATH"] = self.path
+        asyncio.run(self._switch(f"sqlite+aiosqlite:///{self.path}"))
+        asyncio.run(models.init_db())
+
+    def stop(self) -> None:
+        asyncio.run(self._switch(self._saved_url))
+        if self._saved_env is None:
+            os.environ.pop("GEOCODER_DB_PATH", None)
+        else:
+            os.environ["GEOCODER_DB_PATH"] = self._saved_env
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    @staticmethod
+    async def _switch(url: str) -> None:
+        await flush_pending_writes()
+        await models.use_database(url)
+        memory_cache.clear()
+        negative_memory.clear()
@@ -0,0 +1,95 @@
+# tests/test_batch.py
+
+import asyncio
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from Source import batch
+from Source.result import (STATUS_CACHE, STATUS_INVALID, STATUS_UPSTREAM,
+                           GeocodeResult)
+
+
+class TestBatch(unittest.TestCase):
+    def test_parse_record_variants(self):
+        self.assertEqual(batch.parse_record('"Москва, Тверская 10"'),
+                         {"query": "Москва, Тверская 10"})
+        self.assertEqual(batch.parse_record('{"id": 1, "query": "q"}'),
+                         {"id": 1, "query": "q"})
+        self.assertIsNone(batch.parse_record("не json")["query"])
+
+    def test_run_batch_ordered_with_stats(self):
+        async def fake_handle_free_query(text):
+            # первый запрос самый медленный — порядок всё равно сохраняется
+            await asyncio.sleep(0.03 if text == "a" else 0)
+            status = STATUS_CACHE if text == "b" else STATUS_UPSTREAM
+            return GeocodeResult(text, status, "Адрес", 1.0, 2.0)
+
+        source = io.StringIO(
+            '{"id": 1, "query": "a"}\n'
+            '"b"\n'
+            '\n'
+            '"c"\n'
+            'мусор\n'
+        )
+        out = io.StringIO()
+
+        async def run():
+            with patch("Source.batch.parsing.handle_free_query",
+                       fake_handle_free_query):
+                return await batch.run_batch(source, out, concurrency=2)
+
+        stats = asyncio.run(run())
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+
+        self.assertEqual([line["query"] for line in lines],
+                         ["a", "b", "c", ""])
+        self.assertEqual(lines[0]["id"], 1)
+        self.assertEqual(lines[3]["status"], STATUS_INVALID)
+        self.assertEqual(stats.total, 4)
+        self.assertEqual(stats.by_status[STATUS_UPSTREAM], 2)
+        self.assertEqual(stats.by_status[STATUS_CACHE], 1)
+        self.assertEqual(stats.by_status[STATUS_INVALID], 1)
+        self.assertIn("cache: 1", stats.format_report())
+
+    def test_geocode_stream_respects_concurrency(self):
+        state = {"active": 0, "peak": 0}
+
+        async def fake_handle_free_query(text):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.001)
+            state["active"] -= 1
+            return GeocodeResult(text, STATUS_UPSTREAM)
+
+        records = ({"query": str(i)} for i in range(50))
+
+        async def run():
+            with patch("Source.batch.parsing.handle_free_query",
+                       fake_handle_free_query):
+                return [
+                    result.query async for _record, result
+                    in batch.geocode_stream(records, 3, ordered=False)
+                ]
+
+        queries = asyncio.run(run())
+        self.assertEqual(sorted(queries, key=int),
+                         [str(i) for i in range(50)])
+        self.assertLessEqual(state["peak"], 3)
+
+    def test_failed_query_reported_as_error(self):
+        async def boom(_text):
+            raise RuntimeError("упало")
+
+        async def run():
+            with patch("Source.batch.parsing.handle_free_query", boom):
+                return await batch.run_batch(
+                    io.StringIO('"Москва, Тверская 10"\n'), io.StringIO())
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats.by_status["error"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# tests/test_benchmarks.py
+
+import asyncio
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+
+from benchmarks import run as bench
+from benchmarks.fakes import FakeUpstream
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+class TestPercentile(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(bench.percentile(values, 50), 50)
+        self.assertEqual(bench.percentile(values, 95), 95)
+        self.assertEqual(bench.percentile(values, 99), 99)
+        self.assertEqual(bench.percentile([7], 99), 7)
+        self.assertEqual(bench.percentile([], 50), 0.0)
+
+    def test_workload_repeats_queries(self):
+        queries = bench.make_workload("t", 200, 20, 0.0, seed=3)
+        self.assertEqual(len(queries), 200)
+        self.assertLessEqual(len(set(queries)), 20)
+
+    def test_runs_get_their_own_points(self):
+        first = bench.make_workload("a", 50, 10, 1.0, seed=3)
+        second = bench.make_workload("b", 50, 10, 1.0, seed=3)
+        self.assertEqual(first, bench.make_workload("a", 50, 10, 1.0, seed=3))
+        self.assertFalse(set(first) & set(second))
+
+
+class TestFakeUpstream(unittest.TestCase):
+    def test_errors_follow_error_rate(self):
+        with FakeUpstream(error_rate=1.0) as upstream:
+            status, _payload = upstream.search({"q": "Город, улица 1"})
+        self.assertEqual(status, 503)
+        self.assertEqual(upstream.errors, 1)
+
+    def test_search_is_deterministic(self):
+        with FakeUpstream() as upstream:
+            first = upstream.search({"q": "Город, улица Ленина 5"})[1][0]
+            second = upstream.search({"q": "Город, улица Ленина 5"})[1][0]
+        self.assertEqual(first, second)
+        self.assertEqual(first["address"]["house_number"], "5")
+        self.assertEqual(first["address"]["road"], "улица Ленина")
+
+
+class TestBenchmarkRun(unittest.TestCase):
+    def test_all_modes_produce_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "bench.json")
+            args = bench.build_parser().parse_args([
+                "--requests", "30", "--unique", "10",
+                "--concurrency", "1,4",
+                "--nominatim-latency-ms", "0", "--dadata-latency-ms", "0",
+                "-o", output,
+            ])
+            with redirect_stderr(io.StringIO()):
+                report = asyncio.run(bench.run_benchmark(args))
+            json.dumps(report)
+
+        self.assertEqual(
+            [(run["mode"], run["concurrency"]) for run in report["runs"]],
+            [("direct", 1), ("direct", 4), ("batch", 1), ("batch", 4),
+             ("http", 1), ("http", 4)],
+        )
+        for run in report["runs"]:
+            self.assertEqual(run["requests"], 30)
+            self.assertGreater(run["qps"], 0)
+            self.assertGreater(run["cache_hit_ratio"], 0)
+            self.assertEqual(run["statuses"].get("error", 0), 0)
+            self.assertLessEqual(
+                run["latency_ms"]["p50"], run["latency_ms"]["p99"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+# tests/test_canonical.py
+
+import unittest
+
+from benchmarks import canonical_bench
+from Source.canonical import canonical_key
+from Source.database.requests import cache_key
+
+
+class TestCanonicalKey(unittest.TestCase):
+    def test_variants_share_one_key(self):
+        variants = (
+            "Екатеринбург, ул. Белинского, д.86",
+            "г екатеринбург ул белинского 86",
+            "ЕКБ, улица Белинского, дом 86",
+            "  Екатеринбург  ул.Белинского д. 86 ",
+        )
+        keys = {canonical_key(variant) for variant in variants}
+        self.assertEqual(keys, {"екатеринбург улица белинского 86"})
+
+    def test_yo_dashes_and_abbreviations(self):
+        self.assertEqual(canonical_key("Щёлковское ш."), "щелковское шоссе")
+        self.assertEqual(canonical_key("СПб, пр-т Невский 28"),
+                         canonical_key("Санкт–Петербург проспект Невский 28"))
+        self.assertEqual(canonical_key("Россия, Москва"), "москва")
+
+    def test_street_type_is_kept(self):
+        self.assertNotEqual(canonical_key("Москва, ул. Мира 1"),
+                            canonical_key("Москва, пр-т Мира 1"))
+
+    def test_idempotent(self):
+        key = canonical_key("г. Санкт-Петербург, б-р Новаторов, д. 3/1")
+        self.assertEqual(canonical_key(key), key)
+        self.assertIn("3/1", key)
+
+    def test_cache_key_uses_canonical_form(self):
+        self.assertEqual(cache_key("Пермь, ул. Ленина, д. 1"),
+                         canonical_key("пермь улица ленина 1"))
+
+    def test_costs_microseconds(self):
+        results = canonical_bench.measure(number=2000, repeat=3)
+        self.assertEqual(len(results), len(canonical_bench.SAMPLES))
+        # запас на медленные машины CI: на деле единицы микросекунд
+        for row in results:
+            self.assertLess(row["canonical_us"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,26 @@
 # tests/test_database.py
 
 import asyncio
+import os
+import tempfile
 import unittest
-import uuid
+
+from sqlalchemy import create_engine, select, text
 
 from Source.database import models
+from Source.database.memory_cache import memory_cache
 from Source.database import requests as db_requests
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
 
 
 class TestDatabase(unittest.TestCase):
@@ -60,7 +75,7 @@ class TestDatabaseExtra(unittest.TestCase):
         async def run():
             await models.init_db()
 
-            query = "тестовый запрос " + str(uuid.uuid4())
+            query = "тестовый запрос туда и обратно"
 
             await db_requests.add_new_address(
                 query,
@@ -93,5 +108,187 @@ class TestDatabaseExtra(unittest.TestCase):
         asyncio.run(run())
 
 
+class TestQueryKeyedCache(unittest.TestCase):
+    def setUp(self):
+        self._saved_size = memory_cache.max_entries
+        memory_cache.configure(max_entries=0)
+
+    def tearDown(self):
+        memory_cache.configure(max_entries=self._saved_size)
+
+    def test_lookup_by_normalized_key_and_case(self):
+        async def run():
+            await models.init_db()
+
+            await db_requests.add_new_address(
+                "Екб, Белинского 86",
+                "Свердловская область, Екатеринбург, улица Белинского 86",
+                56.82,
+                60.61,
+                normalized_query="Белинского 86 Екатеринбург",
+            )
+
+            by_query = await db_requests.return_address_if_exist(
+                "  ЕКБ,  белинского 86 ")
+            by_normalized = await db_requests.return_address_if_exist(
+                "Белинского 86 Екатеринбург")
+            self.assertIsNotNone(by_query)
+            self.assertIsNotNone(by_normalized)
+            self.assertEqual(by_query.id, by_normalized.id)
+
+        asyncio.run(run())
+
+    def test_repeated_insert_does_not_duplicate(self):
+        async def run():
+            await models.init_db()
+
+            query = "повтор"
+            for _ in range(3):
+                await db_requests.add_new_address(query, "Адрес", 1.0, 2.0)
+            return await db_requests.return_address_if_exist(query)
+
+        self.assertIsNotNone(asyncio.run(run()))
+
+    def test_hit_rate_counter(self):
+        async def run():
+            await models.init_db()
+
+            stats = db_requests.cache_stats
+            hits, misses = stats.hits, stats.misses
+            query = "счётчик"
+            await db_requests.return_address_if_exist(query)
+            await db_requests.add_new_address(query, "Адрес", 1.0, 2.0)
+            await db_requests.return_address_if_exist(query)
+            self.assertEqual(stats.hits - hits, 1)
+            self.assertEqual(stats.misses - misses, 1)
+            self.assertGreater(stats.hit_rate, 0)
+            self.assertIn("Кэш SQLite", stats.format())
+
+        asyncio.run(run())
+
+
+class TestUpsertAndHitCounters(unittest.TestCase):
+    def setUp(self):
+        self._saved_size = memory_cache.max_entries
+        memory_cache.configure(max_entries=0)
+
+    def tearDown(self):
+        memory_cache.configure(max_entries=self._saved_size)
+
+    async def _stored(self, query):
+        await db_requests.flush_pending_writes()
+        async with models.async_session() as session:
+            return (await session.execute(
+                select(models.Address).where(
+                    models.Address.query_key == db_requests.cache_key(query))
+            )).scalars().all()
+
+    def test_repeated_write_updates_single_row(self):
+        async def run():
+            await models.init_db()
+            query = "апсерт"
+            await db_requests.add_new_address(query, "Старый адрес", 1.0, 2.0)
+            await db_requests.flush_pending_writes()
+            await db_requests.add_new_address(
+                query, "Новый адрес", 3.0, 4.0, normalized_query="норм")
+            return await self._stored(query)
+
+        rows = asyncio.run(run())
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].full_address, "Новый адрес")
+        self.assertAlmostEqual(rows[0].latitude, 3.0)
+        self.assertEqual(rows[0].normalized_key, "норм")
+        self.assertIsNotNone(rows[0].created_at)
+
+    def test_hits_are_counted(self):
+        async def run():
+            await models.init_db()
+            query = "попадания"
+            await db_requests.add_new_address(query, "Адрес", 1.0, 2.0)
+            before = await self._stored(query)
+            for _ in range(3):
+                await db_requests.return_address_if_exist(query)
+            return before, await self._stored(query)
+
+        (before,), (after,) = asyncio.run(run())
+        self.assertEqual(before.hit_count, 0)
+        self.assertIsNone(before.last_hit_at)
+        self.assertEqual(after.hit_count, 3)
+        self.assertIsNotNone(after.last_hit_at)
+
+
+class TestDuplicateMigration(unittest.TestCase):
+    def test_old_duplicates_are_collapsed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'old.db')}")
+            with engine.begin() as connection:
+                connection.execute(text(
+                    "CREATE TABLE addresses ("
+                    "id INTEGER PRIMARY KEY, full_address VARCHAR NOT NULL, "
+                    "latitude VARCHAR NOT NULL, longitude VARCHAR NOT NULL)"
+                ))
+                connection.execute(text(
+                    "INSERT INTO addresses VALUES "
+                    "(1, 'Адрес', '56.1', '60.1'), "
+                    "(2, 'Адрес', '56.1', '60.1'), "
+                    "(3, 'Адрес', '56.1', '60.1'), "
+                    "(4, 'Другой адрес', '56.2', '60.2')"
+                ))
+
+            with engine.begin() as connection:
+                models._migrate_addresses(connection)
+
+            with engine.connect() as connection:
+                rows = connection.execute(text(
+                    "SELECT id, hit_count, created_at IS NOT NULL "
+                    "FROM addresses ORDER BY id"
+                )).all()
+                in_rtree = connection.execute(text(
+                    "SELECT count(*) FROM addresses_rtree")).scalar()
+            engine.dispose()
+
+        self.assertEqual([tuple(row) for row in rows],
+                         [(1, 0, 1), (4, 0, 1)])
+        self.assertEqual(in_rtree, 2)
+
+
+class TestCanonicalKeyMigration(unittest.TestCase):
+    def test_old_keys_are_recomputed_and_merged(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'old.db')}")
+            with engine.begin() as connection:
+                models.Base.metadata.create_all(connection)
+                connection.execute(text(
+                    "INSERT INTO addresses (id, full_address, latitude, "
+                    "longitude, query_key, normalized_key, hit_count) VALUES "
+                    "(1, 'А', 56.1, 60.1, 'екатеринбург, ул. ленина, 5', "
+                    "'г екатеринбург, ул ленина, д 5', 2), "
+                    "(2, 'А', 56.1, 60.1, 'екатеринбург улица ленина 5', "
+                    "NULL, 3), "
+                    "(3, 'Б', 56.2, 60.2, 'пермь', NULL, 0)"
+                ))
+
+            with engine.begin() as connection:
+                models._migrate_addresses(connection)
+                # повторный запуск ничего не меняет
+                models._migrate_addresses(connection)
+
+            with engine.connect() as connection:
+                rows = connection.execute(text(
+                    "SELECT id, query_key, normalized_key, hit_count "
+                    "FROM addresses ORDER BY id"
+                )).all()
+                version = connection.execute(
+                    text("PRAGMA user_version")).scalar()
+            engine.dispose()
+
+        self.assertEqual([tuple(row) for row in rows], [
+            (1, "екатеринбург улица ленина 5",
+             "екатеринбург улица ленина 5", 5),
+            (3, "пермь", None, 0),
+        ])
+        self.assertEqual(version, models.KEY_VERSION)
+
+
 if __name__ == "__main__":
     unittest.main()
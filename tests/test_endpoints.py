@@ -0,0 +1,164 @@
+# tests/test_endpoints.py
+
+import asyncio
+import io
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from Source import endpoints, http_client, response
+from Source.endpoints import Endpoint, EndpointPool
+from Source.scheduler import UpstreamScheduler, nominatim_scheduler
+from tests.stand_in import StandInServer
+
+
+def _found(_path, params):
+    return 200, [{
+        "lat": "56.8", "lon": "60.6",
+        "address": {"city": "Екатеринбург", "road": "улица Ленина",
+                    "house_number": "5", "country": "Россия"},
+    }]
+
+
+def _broken(_path, _params):
+    return 500, {"error": "down"}
+
+
+async def _send(endpoint):
+    return await http_client.get(endpoint.url + "/search", params={"q": "x"})
+
+
+def _run(pool, count, **kwargs):
+    async def run():
+        try:
+            return [await pool.request(_send, **kwargs) for _ in range(count)]
+        finally:
+            await http_client.close()
+    return asyncio.run(run())
+
+
+class TestEndpointStats(unittest.TestCase):
+    def test_hedge_delay_follows_p95(self):
+        pool = EndpointPool("test", ["http://a", "http://b"])
+        endpoint = pool.endpoints[0]
+        with patch.object(endpoints, "HEDGE_DEFAULT_MS", 700), \
+             patch.object(endpoints, "HEDGE_MIN_MS", 20):
+            self.assertEqual(pool.hedge_delay(endpoint), 0.7)
+            for n in range(100):
+                endpoint.record(0.1 if n < 90 else 0.5, ok=True)
+            self.assertEqual(pool.hedge_delay(endpoint), 0.5)
+            with patch.object(endpoints, "HEDGE_QUANTILE", 0):
+                self.assertIsNone(pool.hedge_delay(endpoint))
+        self.assertIsNone(EndpointPool("test", ["http://a"]).hedge_delay(
+            endpoint))
+
+    def test_errors_do_not_count_as_latency(self):
+        endpoint = Endpoint("http://a/")
+        endpoint.record(0.2, ok=True)
+        endpoint.record(0.001, ok=False)
+        self.assertEqual(endpoint.url, "http://a")
+        self.assertEqual(endpoint.latency, 0.2)
+        self.assertEqual(endpoint.error_rate, 0.5)
+        self.assertAlmostEqual(endpoint.score(), 0.4)
+
+    def test_try_acquire_respects_rate(self):
+        scheduler = UpstreamScheduler("test", rate=0.01, burst=1)
+        self.assertTrue(scheduler.try_acquire())
+        self.assertFalse(scheduler.try_acquire())
+        self.assertEqual(sum(scheduler.granted.values()), 1)
+
+
+class TestRoutingAgainstStandIns(unittest.TestCase):
+    def test_requests_go_to_the_fastest_endpoint(self):
+        with StandInServer(_found, delay=0.15) as slow, \
+             StandInServer(_found, delay=0.01) as fast, \
+             StandInServer(_found, delay=0.06) as medium, \
+             patch.object(endpoints, "HEDGE_QUANTILE", 0):
+            pool = EndpointPool("test", [slow.url, fast.url, medium.url])
+            _run(pool, 20)
+
+        # по разу на пробу каждого и один исследовательский запрос
+        self.assertGreaterEqual(fast.requests, 16)
+        self.assertLessEqual(slow.requests, 2)
+        self.assertIn("p95", pool.format())
+
+    def test_failing_endpoint_is_avoided(self):
+        with StandInServer(_broken) as broken, \
+             StandInServer(_found, delay=0.05) as healthy, \
+             patch.object(endpoints, "HEDGE_QUANTILE", 0):
+            pool = EndpointPool("test", [broken.url, healthy.url])
+            responses = _run(pool, 10)
+
+        self.assertEqual(broken.requests, 1)
+        self.assertEqual(responses[0].status_code, 500)
+        self.assertTrue(all(r.is_success for r in responses[1:]))
+        self.assertEqual(pool.endpoints[0].error_rate, 1.0)
+
+    def test_slow_request_is_hedged(self):
+        with StandInServer(_found, delay=0.8) as stuck, \
+             StandInServer(_found, delay=0.01) as fast, \
+             patch.object(endpoints, "HEDGE_DEFAULT_MS", 50):
+            pool = EndpointPool("test", [stuck.url, fast.url])
+            started = time.monotonic()
+            first, = _run(pool, 1)
+            elapsed = time.monotonic() - started
+
+        self.assertTrue(first.is_success)
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(fast.requests, 1)
+        self.assertEqual(pool.endpoints[1].hedges, 1)
+        # отменённый основной запрос учтён как медленный
+        self.assertGreaterEqual(pool.endpoints[0].latency, 0.05)
+
+    def test_no_hedge_without_free_token(self):
+        with StandInServer(_found, delay=0.2) as slow, \
+             StandInServer(_found) as fast, \
+             patch.object(endpoints, "HEDGE_DEFAULT_MS", 20):
+            pool = EndpointPool("test", [slow.url, fast.url])
+            _run(pool, 1, may_hedge=lambda: False)
+
+        self.assertEqual((slow.requests, fast.requests), (1, 0))
+
+
+class TestSendRequestUsesEndpoints(unittest.TestCase):
+    def setUp(self):
+        self._saved_bucket = nominatim_scheduler.bucket
+        nominatim_scheduler.configure(rate=0)
+
+    def tearDown(self):
+        nominatim_scheduler.bucket = self._saved_bucket
+
+    def test_hedged_answer_reaches_parser(self):
+        parsed = {}
+
+        async def no_cache(_query, _key=None):
+            return None
+
+        async def fake_parse(_address, output):
+            parsed["output"] = output
+
+        async def run():
+            try:
+                with patch("Source.response.return_address_if_exist",
+                           no_cache), \
+                     patch("Source.response.parsing.parse_output_address",
+                           fake_parse), \
+                     redirect_stdout(io.StringIO()):
+                    await response.send_request("Екатеринбург, Ленина 5")
+            finally:
+                await http_client.close()
+
+        with StandInServer(_found, delay=0.8) as stuck, \
+             StandInServer(_found, delay=0.01) as fast, \
+             patch.object(endpoints, "HEDGE_DEFAULT_MS", 50), \
+             patch.object(endpoints.nominatim_endpoints, "endpoints",
+                          [Endpoint(stuck.url), Endpoint(fast.url)]):
+            asyncio.run(run())
+
+        self.assertEqual(parsed["output"]["lat"], "56.8")
+        self.assertEqual(fast.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
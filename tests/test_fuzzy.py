@@ -0,0 +1,167 @@
+# tests/test_fuzzy.py
+
+import asyncio
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from Source import parsing
+from Source.database import models
+from Source.database import requests as db_requests
+from Source.database.memory_cache import memory_cache
+from Source.result import STATUS_CACHE
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+class TestSimilarity(unittest.TestCase):
+    def test_punctuation_stopwords_and_order_are_ignored(self):
+        self.assertEqual(db_requests.similarity(
+            "екатеринбург белинского 86",
+            "екатеринбург, ул. белинского, д.86"), 1.0)
+        self.assertEqual(db_requests.similarity(
+            "белинского 86 екатеринбург",
+            "г. Екатеринбург, улица Белинского, дом 86"), 1.0)
+
+    def test_typo_is_close_but_other_city_is_not(self):
+        typo = db_requests.similarity(
+            "екатеринбург белинского 86", "екатеринбург белинскго 86")
+        other_city = db_requests.similarity(
+            "екатеринбург белинского 86", "пермь белинского 86")
+        self.assertGreater(typo, 0.75)
+        self.assertLess(other_city, 0.75)
+
+    def test_house_number_must_match(self):
+        self.assertEqual(db_requests.similarity(
+            "екатеринбург белинского 86", "екатеринбург белинского 88"), 0.0)
+        self.assertEqual(db_requests.similarity(
+            "москва мира 5", "москва мира 5 корпус 2"), 0.0)
+        self.assertEqual(db_requests.similarity(
+            "москва мира 5 к1", "москва мира 5 корпус 2"), 0.0)
+        self.assertEqual(db_requests.similarity(
+            "москва мира 5 стр 1", "москва мира 5 строение 1"), 1.0)
+
+    def test_numbers_in_street_names_must_match(self):
+        self.assertEqual(db_requests.similarity(
+            "москва 3-я парковая улица 5", "москва 13-я парковая улица 5"),
+            0.0)
+        self.assertEqual(db_requests.similarity(
+            "санкт-петербург садовая 10", "санкт-петербург садовая 1 линия 10"),
+            0.0)
+        self.assertEqual(db_requests.similarity(
+            "улица 8 марта 10", "улица 9 марта 10"), 0.0)
+        self.assertEqual(db_requests.similarity(
+            "москва 3-я парковая улица 5", "москва 3 парковая улица 5"), 1.0)
+
+    def test_score_must_exceed_threshold(self):
+        with patch.object(db_requests, "similarity", lambda *_: 0.75):
+            self.assertIsNone(db_requests._best_match(
+                "ключ", [models.Address(query_key="другой")], 0.75))
+
+    def test_street_type_must_match(self):
+        self.assertEqual(db_requests.similarity(
+            "москва ленинский проспект 10", "москва ленинский переулок 10"),
+            0.0)
+        self.assertEqual(db_requests.similarity(
+            "екатеринбург улица ленина 5", "екатеринбург проспект ленина 5"),
+            0.0)
+        self.assertEqual(db_requests.similarity(
+            "екатеринбург пр-т ленина 5", "екатеринбург проспект ленина 5"),
+            1.0)
+
+
+class TestFuzzyLookup(unittest.TestCase):
+    def setUp(self):
+        self._saved_size = memory_cache.max_entries
+        memory_cache.configure(max_entries=0)
+        self.city = "Екатеринбург"
+
+    def tearDown(self):
+        memory_cache.configure(max_entries=self._saved_size)
+
+    def _store(self, flush=True):
+        async def run():
+            await models.init_db()
+            await db_requests.add_new_address(
+                f"{self.city} улица Белинского 86", "Адрес", 56.8, 60.6)
+            if flush:
+                await db_requests.flush_pending_writes()
+
+        asyncio.run(run())
+
+    def test_variants_are_found_in_sqlite(self):
+        self._store()
+        fuzzy_hits = db_requests.cache_stats.fuzzy_hits
+
+        async def run():
+            return [
+                await db_requests.find_similar_address(query)
+                for query in (
+                    f"{self.city.lower()}, ул. Белинского, д.86",
+                    f"г {self.city} улица Белинскго 86",
+                    f"{self.city} Белинского 87",
+                    f"{self.city} переулок Белинского 86",
+                    f"{self.city} Белинского 86 корпус 2",
+                )
+            ]
+
+        formatted, typo, other_house, other_type, building = asyncio.run(run())
+        self.assertEqual(formatted.full_address, "Адрес")
+        self.assertEqual(typo.full_address, "Адрес")
+        self.assertIsNone(other_house)
+        self.assertIsNone(other_type)
+        self.assertIsNone(building)
+        self.assertEqual(db_requests.cache_stats.fuzzy_hits - fuzzy_hits, 2)
+
+    def test_unflushed_rows_and_threshold(self):
+        self._store(flush=False)
+
+        async def run():
+            loose = await db_requests.find_similar_address(
+                f"{self.city} ул Белинскго 86")
+            strict = await db_requests.find_similar_address(
+                f"{self.city} ул Белинскго 86", threshold=1.0)
+            disabled = await db_requests.find_similar_address(
+                f"{self.city} Белинского 86", threshold=0)
+            return loose, strict, disabled
+
+        loose, strict, disabled = asyncio.run(run())
+        self.assertIsNotNone(loose)
+        self.assertIsNone(strict)
+        self.assertIsNone(disabled)
+
+    def test_pipeline_answers_variant_without_upstream(self):
+        self._store()
+
+        async def no_upstream(*_args, **_kwargs):
+            raise AssertionError("внешние сервисы не должны вызываться")
+
+        async def run():
+            with patch("Source.parsing._normalize_free_text", no_upstream), \
+                 patch("Source.response.send_request", no_upstream):
+                first = await parsing.handle_free_query(
+                    f"{self.city}, ул. Белинского, д. 86")
+                exact = await db_requests.return_address_if_exist(
+                    f"{self.city}, ул. Белинского, д. 86")
+            return first, exact
+
+        with redirect_stdout(io.StringIO()):
+            result, exact = asyncio.run(run())
+        self.assertEqual(result.status, STATUS_CACHE)
+        self.assertEqual(result.full_address, "Адрес")
+        # вариант запомнен и дальше находится точным поиском
+        self.assertIsNotNone(exact)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+# tests/test_http_client.py
+
+import asyncio
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from Source import http_client, parsing, response
+from Source.database import models
+from Source.endpoints import Endpoint, nominatim_endpoints
+from Source.scheduler import nominatim_scheduler
+from tests.stand_in import StandInServer
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+def _nominatim_handler(path, params):
+    if path == "/reverse":
+        return 200, {
+            "lat": params["lat"],
+            "lon": params["lon"],
+            "address": {
+                "city": "Екатеринбург",
+                "road": "Малышева улица",
+                "house_number": "51",
+                "country": "Россия",
+            },
+        }
+    if params.get("q") == "пусто":
+        return 200, []
+    return 200, [{
+        "lat": "56.7928003",
+        "lon": "60.6165292",
+        "address": {
+            "state": "Свердловская область",
+            "city": "Екатеринбург",
+            "road": "Родонитовая улица",
+            "house_number": "1",
+            "country": "Россия",
+        },
+    }]
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        self._saved_settings = http_client.settings
+        self._saved_bucket = nominatim_scheduler.bucket
+        nominatim_scheduler.configure(rate=0)
+
+    def tearDown(self):
+        http_client.configure(**vars(self._saved_settings))
+        nominatim_scheduler.bucket = self._saved_bucket
+
+    def test_connections_are_reused(self):
+        async def run(url):
+            try:
+                for _ in range(5):
+                    resp = await http_client.get(url + "/search")
+                    self.assertTrue(resp.is_success)
+            finally:
+                await http_client.close()
+
+        with StandInServer(_nominatim_handler) as server:
+            asyncio.run(run(server.url))
+
+        self.assertEqual(server.requests, 5)
+        self.assertEqual(len(server.connections), 1)
+
+    def test_per_host_limit(self):
+        http_client.configure(per_host_limit=2)
+
+        async def run(url):
+            try:
+                await asyncio.gather(*(
+                    http_client.get(url + "/search") for _ in range(6)
+                ))
+            finally:
+                await http_client.close()
+
+        with StandInServer(_nominatim_handler, delay=0.05) as server:
+            asyncio.run(run(server.url))
+
+        self.assertEqual(server.requests, 6)
+        self.assertLessEqual(server.peak, 2)
+
+    def test_timeout_is_reported(self):
+        http_client.configure(timeout=0.05)
+
+        async def run(url):
+            async def no_cache(_query, _key=None):
+                return None
+
+            try:
+                with patch.object(nominatim_endpoints, "endpoints", [Endpoint(url)]), \
+                     patch("Source.response.return_address_if_exist",
+                           no_cache):
+                    buf = io.StringIO()
+                    with redirect_stdout(buf):
+                        result = await response.send_request("Екатеринбург")
+                    return result, buf.getvalue()
+            finally:
+                await http_client.close()
+
+        with StandInServer(_nominatim_handler, delay=0.3) as server:
+            result, out = asyncio.run(run(server.url))
+
+        self.assertEqual(result.status, "error")
+        self.assertIn("Ошибка при обращении к сервису геокодирования", out)
+
+    def test_send_request_against_stand_in(self):
+        parsed = {}
+
+        async def no_cache(_query, _key=None):
+            return None
+
+        async def fake_parse_output_address(input_address, output):
+            parsed["output"] = output
+
+        async def run(url):
+            try:
+                with patch.object(nominatim_endpoints, "endpoints", [Endpoint(url)]), \
+                     patch("Source.response.return_address_if_exist",
+                           no_cache), \
+                     patch("Source.response.parsing.parse_output_address",
+                           fake_parse_output_address):
+                    await response.send_request("Екатеринбург, Родонитовая 1")
+                    buf = io.StringIO()
+                    with redirect_stdout(buf):
+                        empty = await response.send_request("пусто")
+                    return empty, buf.getvalue()
+            finally:
+                await http_client.close()
+
+        with StandInServer(_nominatim_handler) as server:
+            empty, out = asyncio.run(run(server.url))
+
+        self.assertEqual(parsed["output"]["lat"], "56.7928003")
+        self.assertEqual(empty.status, "not_found")
+        self.assertIn("ничего не найдено", out)
+        self.assertEqual(len(server.connections), 1)
+
+
+class TestReverseGeocoding(unittest.TestCase):
+    def setUp(self):
+        self._saved_bucket = nominatim_scheduler.bucket
+        nominatim_scheduler.configure(rate=0)
+
+    def tearDown(self):
+        nominatim_scheduler.bucket = self._saved_bucket
+
+    def test_nearby_points_share_one_reverse_call(self):
+        lat, lon = 56.838701, 60.603501
+
+        async def run(url):
+            await models.init_db()
+            try:
+                with patch.object(nominatim_endpoints, "endpoints",
+                                  [Endpoint(url)]), \
+                     patch("Source.response.REVERSE_RADIUS_M", 0):
+                    with redirect_stdout(io.StringIO()):
+                        first = await parsing.handle_free_query(
+                            f"{lat:.7f} {lon:.7f}")
+                        second = await parsing.handle_free_query(
+                            f"{lat + 0.000002:.7f}, {lon - 0.000002:.7f}")
+                return first, second
+            finally:
+                await http_client.close()
+
+        with StandInServer(_nominatim_handler) as server:
+            first, second = asyncio.run(run(server.url))
+
+        self.assertEqual(server.requests, 1)
+        self.assertEqual(first.status, "upstream")
+        self.assertEqual(first.full_address, "Екатеринбург, Малышева улица 51")
+        self.assertAlmostEqual(first.latitude, lat, places=5)
+        self.assertEqual(second.status, "cache")
+        self.assertEqual(second.full_address, first.full_address)
+
+    def test_unable_to_geocode_is_not_found(self):
+        async def run(url):
+            try:
+                with patch.object(nominatim_endpoints, "endpoints",
+                                  [Endpoint(url)]), \
+                     patch("Source.response.REVERSE_RADIUS_M", 0):
+                    with redirect_stdout(io.StringIO()):
+                        return await response.reverse_geocode(-55.5, -35.5)
+            finally:
+                await http_client.close()
+
+        nowhere = StandInServer(lambda *_: (200, {"error": "Unable to geocode"}))
+        with nowhere as server:
+            result = asyncio.run(run(server.url))
+
+        self.assertEqual(result.status, "not_found")
+
+
+if __name__ == "__main__":
+    unittest.main()
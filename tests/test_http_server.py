@@ -0,0 +1,182 @@
+# tests/test_http_server.py
+
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+import http_server
+from Source.result import (STATUS_INVALID, STATUS_NOT_FOUND, STATUS_UPSTREAM,
+                           GeocodeResult)
+
+
+SEARCH_SCHEMA = ["query", "status", "source", "full_address", "latitude",
+                 "longitude", "components", "latency_ms"]
+
+
+async def fake_handle_free_query(text):
+    if text == "нет такого":
+        return GeocodeResult(text, STATUS_NOT_FOUND)
+    if text.startswith("медленно"):
+        await asyncio.sleep(0.02)
+    return GeocodeResult(text, STATUS_UPSTREAM, "Адрес " + text, 56.8, 60.6)
+
+
+class TestHttpServer(unittest.TestCase):
+    def _run(self, scenario, concurrency=4):
+        async def run():
+            server = http_server.GeocoderServer(concurrency)
+            listener = await server.start("127.0.0.1", 0)
+            base = f"http://127.0.0.1:{server.port}"
+            try:
+                with patch("http_server.parsing.handle_free_query",
+                           fake_handle_free_query):
+                    async with httpx.AsyncClient(base_url=base) as client:
+                        return await scenario(client, server)
+            finally:
+                listener.close()
+                await listener.wait_closed()
+
+        return asyncio.run(run())
+
+    def test_health_and_search_share_connection(self):
+        async def scenario(client, _server):
+            health = await client.get("/health")
+            found = await client.get(
+                "/search", params={"q": "Екатеринбург, Белинского 86"})
+            missing = await client.get("/search", params={"q": "нет такого"})
+            return health, found, missing
+
+        health, found, missing = self._run(scenario)
+        self.assertEqual(health.json(), {"status": "ok"})
+        self.assertEqual(found.status_code, 200)
+        self.assertEqual(found.json()["status"], STATUS_UPSTREAM)
+        self.assertEqual(found.json()["latitude"], 56.8)
+        self.assertEqual(list(found.json()), SEARCH_SCHEMA)
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(found.headers["connection"], "keep-alive")
+
+    def test_metrics_endpoint(self):
+        async def scenario(client, _server):
+            return await client.get("/metrics")
+
+        reply = self._run(scenario)
+        self.assertEqual(reply.status_code, 200)
+        self.assertTrue(reply.headers["content-type"].startswith("text/plain"))
+        self.assertIn("# TYPE geocoder_stage_seconds histogram", reply.text)
+
+    def test_reverse(self):
+        async def scenario(client, _server):
+            ok = await client.get("/reverse",
+                                  params={"lat": "56.8", "lon": "60.6"})
+            bad = await client.get("/reverse", params={"lat": "север"})
+            return ok, bad
+
+        ok, bad = self._run(scenario)
+        self.assertEqual(ok.json()["query"], "56.8 60.6")
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(bad.json()["status"], STATUS_INVALID)
+
+    def test_unknown_path_and_method(self):
+        async def scenario(client, _server):
+            return (await client.get("/nope"),
+                    await client.post("/search", content=b"x"))
+
+        unknown, wrong_method = self._run(scenario)
+        self.assertEqual(unknown.status_code, 404)
+        self.assertEqual(wrong_method.status_code, 405)
+
+    def test_batch_streams_ndjson_in_order(self):
+        lines = [
+            json.dumps({"id": i, "query": f"медленно {i}"}, ensure_ascii=False)
+            for i in range(5)
+        ] + ['"нет такого"', "мусор"]
+
+        async def body():
+            for line in lines:
+                yield (line + "\n").encode("utf-8")
+
+        async def scenario(client, _server):
+            async with client.stream(
+                    "POST", "/batch", params={"concurrency": 3},
+                    content=body()) as resp:
+                results = [json.loads(line) async for line in resp.aiter_lines()
+                           if line]
+            after = await client.get("/health")
+            return resp, results, after
+
+        resp, results, after = self._run(scenario)
+        self.assertEqual(resp.headers["content-type"],
+                         "application/x-ndjson; charset=utf-8")
+        self.assertEqual([r.get("id") for r in results[:5]], list(range(5)))
+        self.assertEqual(results[5]["status"], STATUS_NOT_FOUND)
+        self.assertEqual(results[6]["status"], STATUS_INVALID)
+        self.assertEqual(after.status_code, 200)
+
+    def test_malformed_body_framing_is_rejected(self):
+        async def send(raw):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            reply = await reader.read()
+            writer.close()
+            return reply
+
+        async def scenario(_client, server):
+            nonlocal port
+            port = server.port
+            return (
+                await send(b"GET /health HTTP/1.1\r\nHost: x\r\n"
+                           b"Content-Length: abc\r\n\r\n"),
+                await send(b"POST /search HTTP/1.1\r\nHost: x\r\n"
+                           b"Transfer-Encoding: chunked\r\n\r\nzz\r\n"),
+                await send(b"POST /batch?concurrency=1 HTTP/1.1\r\nHost: x\r\n"
+                           b"Transfer-Encoding: chunked\r\n\r\n"
+                           b"6\r\n\"abc\"\n\r\nzz\r\n"),
+                await send(b"POST /batch HTTP/1.1\r\nHost: x\r\n"
+                           b"Transfer-Encoding: chunked\r\n\r\n"
+                           b"fffffff\r\n"),
+                await send(b"POST /batch HTTP/1.1\r\nHost: x\r\n"
+                           b"Content-Length: 40\r\n\r\n" + b"a" * 40),
+            )
+
+        port = None
+        with patch.object(http_server, "MAX_LINE_BYTES", 16):
+            length, chunk, streamed, huge_chunk, long_line = self._run(
+                scenario)
+        self.assertTrue(length.startswith(b"HTTP/1.1 400 "))
+        self.assertIn("Content-Length".encode(), length)
+        self.assertTrue(chunk.startswith(b"HTTP/1.1 400 "))
+        self.assertTrue(streamed.startswith(b"HTTP/1.1 200 "))
+        self.assertIn("Некорректный размер блока".encode(), streamed)
+        self.assertTrue(streamed.endswith(b"0\r\n\r\n"))
+        self.assertTrue(huge_chunk.startswith(b"HTTP/1.1 413 "))
+        self.assertIn("Слишком большой блок".encode(), huge_chunk)
+        self.assertTrue(long_line.startswith(b"HTTP/1.1 413 "))
+        self.assertIn("Слишком длинная строка".encode(), long_line)
+
+    def test_concurrency_limit(self):
+        state = {"active": 0, "peak": 0}
+
+        async def scenario(client, server):
+            async def counting(text):
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+                await asyncio.sleep(0.01)
+                state["active"] -= 1
+                return GeocodeResult(text, STATUS_UPSTREAM, "Адрес", 1, 2)
+
+            with patch("http_server.parsing.handle_free_query", counting):
+                await asyncio.gather(*(
+                    client.get("/search", params={"q": f"адрес {i}"})
+                    for i in range(10)
+                ))
+
+        self._run(scenario, concurrency=2)
+        self.assertLessEqual(state["peak"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
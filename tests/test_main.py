@@ -1,6 +1,9 @@
 # tests/test_main.py
 
 import io
+import json
+import os
+import tempfile
 import unittest
 from contextlib import redirect_stdout
 import asyncio
@@ -9,6 +12,7 @@ from unittest.mock import patch
 
 from main import show_help
 import main
+from Source.result import STATUS_UPSTREAM, GeocodeResult
 import sys
 
 
@@ -74,6 +78,29 @@ class TestMainExtra(unittest.TestCase):
         asyncio.run(run())
         self.assertEqual(calls.get("text"), "Екатеринбург, Родонитовая 1")
 
+    def test_jsonl_mode_reads_stdin(self):
+        async def fake_handle_free_query(text: str):
+            print("сообщение конвейера")
+            return GeocodeResult(text, STATUS_UPSTREAM, "Адрес", 1.0, 2.0)
+
+        stdin = io.StringIO("первый запрос\n\nвторой запрос\n")
+        out, err = io.StringIO(), io.StringIO()
+
+        async def run():
+            with patch("main.parsing.handle_free_query",
+                       fake_handle_free_query), \
+                 patch.object(sys, "stdin", stdin), \
+                 patch.object(sys, "stdout", out), \
+                 patch.object(sys, "stderr", err):
+                await main.run_command(["--jsonl"])
+
+        asyncio.run(run())
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line["query"] for line in lines],
+                         ["первый запрос", "второй запрос"])
+        self.assertEqual(lines[0]["source"], "upstream")
+        self.assertIn("сообщение конвейера", err.getvalue())
+
     def test_interactive_mode_help_and_exit(self):
         inputs = iter(["--help", "exit"])
 
@@ -164,20 +191,57 @@ class TestMainExtra(unittest.TestCase):
             main.ensure_dependencies_installed("req.txt")
         mock_call.assert_not_called()
 
-    def test_ensure_dependencies_success(self):
-        with patch("main.os.path.exists", return_value=True), \
-             patch("main.subprocess.check_call") as mock_call:
-            main.ensure_dependencies_installed("req.txt")
+    def _requirements(self, tmp, content):
+        path = os.path.join(tmp, "requirements.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_ensure_dependencies_installs_missing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._requirements(tmp, "surely-not-installed-package\n")
+            with patch("main.subprocess.check_call") as mock_call:
+                main.ensure_dependencies_installed(path)
+            stamped = os.path.exists(os.path.join(tmp, main.STAMP_NAME))
         self.assertTrue(mock_call.called)
+        self.assertTrue(stamped)
+
+    def test_ensure_dependencies_uses_stamp(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._requirements(tmp, "surely-not-installed-package\n")
+            with patch("main.subprocess.check_call"):
+                main.ensure_dependencies_installed(path)
+            with patch("main.subprocess.check_call") as mock_call, \
+                 patch("main._missing_requirements") as mock_check:
+                main.ensure_dependencies_installed(path)
+            mock_call.assert_not_called()
+            mock_check.assert_not_called()
+
+            # изменился список зависимостей — проверка выполняется заново
+            self._requirements(tmp, "another-missing-package\n")
+            with patch("main.subprocess.check_call") as mock_call:
+                main.ensure_dependencies_installed(path)
+        self.assertTrue(mock_call.called)
+
+    def test_ensure_dependencies_installed_packages_skip_pip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._requirements(tmp, "# комментарий\nhttpx>=0.20\n")
+            with patch("main.subprocess.check_call") as mock_call:
+                main.ensure_dependencies_installed(path)
+        mock_call.assert_not_called()
 
     def test_ensure_dependencies_install_error(self):
-        with patch("main.os.path.exists", return_value=True), \
-             patch(
-                 "main.subprocess.check_call",
-                 side_effect=RuntimeError("boom")
-                 ):
-            # просто не должно выбросить исключение
-            main.ensure_dependencies_installed("req.txt")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._requirements(tmp, "surely-not-installed-package\n")
+            with patch(
+                    "main.subprocess.check_call",
+                    side_effect=RuntimeError("boom")
+                    ):
+                # просто не должно выбросить исключение
+                main.ensure_dependencies_installed(path)
+            # неудачная установка не отмечается как проверенная
+            stamped = os.path.exists(os.path.join(tmp, main.STAMP_NAME))
+        self.assertFalse(stamped)
 
     def test_main_with_exit_argument(self):
         calls = {
@@ -203,6 +267,47 @@ class TestMainExtra(unittest.TestCase):
         asyncio.run(run())
         self.assertFalse(calls["called"])
 
+    def test_main_with_batch_argument(self):
+        calls = {}
+
+        async def fake_batch_mode(argv):
+            calls["argv"] = argv
+
+        async def fake_init_db():
+            return None
+
+        async def run():
+            with patch.object(
+                    sys, "argv", ["main.py", "--batch", "in.jsonl", "-c", "4"]
+                    ), \
+                 patch("main.batch_mode", fake_batch_mode), \
+                 patch("main.init_db", fake_init_db):
+                await main.main()
+
+        asyncio.run(run())
+        self.assertEqual(calls["argv"], ["in.jsonl", "-c", "4"])
+
+    def test_stats_flag_prints_summary(self):
+        calls = {}
+
+        async def fake_handle_query(query):
+            calls["query"] = query
+
+        async def run():
+            with patch("main.handle_query", fake_handle_query), \
+                 patch("sys.stderr", new_callable=io.StringIO) as err:
+                await main.run_command(["--stats", "Москва,", "Тверская", "1"])
+                return err.getvalue()
+
+        err = asyncio.run(run())
+        self.assertEqual(calls["query"], "Москва, Тверская 1")
+        self.assertIn("Этапы", err)
+
+    def test_batch_parser_defaults(self):
+        args = main.build_batch_parser().parse_args(["in.jsonl"])
+        self.assertEqual(args.output, "-")
+        self.assertFalse(args.unordered)
+
     def test_interactive_mode_keyboard_interrupt(self):
 
         def fake_input(_prompt: str) -> str:
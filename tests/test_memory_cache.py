@@ -0,0 +1,114 @@
+# tests/test_memory_cache.py
+
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from Source.database import models
+from Source.database import requests as db_requests
+from Source.database.memory_cache import MemoryCache, memory_cache
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = MemoryCache(max_entries=2, ttl=0)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_ttl_expiration(self):
+        clock = FakeClock()
+        cache = MemoryCache(max_entries=10, ttl=5, clock=clock)
+        cache.set("a", 1)
+        clock.now = 4.9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 5.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.expirations, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = MemoryCache(max_entries=0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_shrink_on_configure(self):
+        cache = MemoryCache(max_entries=3)
+        for key in "abc":
+            cache.set(key, key)
+        cache.configure(max_entries=1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get("c"), "c")
+
+
+class TestMemoryTier(unittest.TestCase):
+    def setUp(self):
+        memory_cache.clear()
+
+    def test_write_populates_memory_and_skips_sqlite(self):
+        async def run():
+            await models.init_db()
+
+            query = "горячий адрес"
+            await db_requests.add_new_address(
+                query, "Адрес", 1.0, 2.0, normalized_query="норм " + query)
+
+            def no_session():
+                raise AssertionError("SQLite не должна читаться")
+
+            with patch("Source.database.requests.async_session", no_session):
+                by_query = await db_requests.return_address_if_exist(query)
+                by_normalized = await db_requests.return_address_if_exist(
+                    "НОРМ " + query)
+            return by_query, by_normalized
+
+        by_query, by_normalized = asyncio.run(run())
+        self.assertEqual(by_query.full_address, "Адрес")
+        self.assertIs(by_query, by_normalized)
+
+    def test_sqlite_hit_is_remembered(self):
+        async def run():
+            await models.init_db()
+
+            query = "из базы"
+            await db_requests.add_new_address(query, "Адрес", 1.0, 2.0)
+            memory_cache.clear()
+
+            first = await db_requests.return_address_if_exist(query)
+            hits = memory_cache.hits
+            second = await db_requests.return_address_if_exist(query)
+            self.assertEqual(memory_cache.hits, hits + 1)
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertIs(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# tests/test_metrics.py
+
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from Source import parsing
+from Source.metrics import Histogram, Metrics, metrics
+from Source.result import STATUS_UPSTREAM, GeocodeResult
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets_and_quantiles(self):
+        histogram = Histogram((0.01, 0.1, 1.0))
+        for value in (0.005, 0.005, 0.05, 0.5, 5.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.total, 5.56)
+        self.assertEqual(histogram.quantile(0.4), 0.01)
+        self.assertEqual(histogram.quantile(0.6), 0.1)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_stage_records_time_and_errors(self):
+        registry = Metrics()
+        with registry.stage("nominatim"):
+            pass
+        with self.assertRaises(ValueError):
+            with registry.stage("nominatim"):
+                raise ValueError("плохой ответ")
+
+        self.assertEqual(registry.stages["nominatim"].count, 2)
+        self.assertEqual(
+            registry.value("errors", stage="nominatim", type="ValueError"), 1)
+
+    def test_disabled_registry_records_nothing(self):
+        registry = Metrics(enabled=False)
+        with registry.stage("sanitize"):
+            pass
+        registry.count("cache_lookups", tier="memory", result="hit")
+        self.assertEqual(registry.stages, {})
+        self.assertEqual(registry.counters, {})
+        self.assertIn("отключены", registry.format_summary())
+
+    def test_prometheus_text(self):
+        registry = Metrics(buckets=(0.1, 1.0))
+        registry.observe("cache_lookup", 0.05)
+        registry.observe("cache_lookup", 2.0)
+        registry.count("upstream_responses", service="nominatim", code="503")
+        registry.count("errors", stage="query", type='Bad"Name')
+        text = registry.render_prometheus()
+
+        self.assertIn("# TYPE geocoder_stage_seconds histogram", text)
+        self.assertIn(
+            'geocoder_stage_seconds_bucket{stage="cache_lookup",le="0.1"} 1',
+            text)
+        self.assertIn(
+            'geocoder_stage_seconds_bucket{stage="cache_lookup",le="+Inf"} 2',
+            text)
+        self.assertIn('geocoder_stage_seconds_count{stage="cache_lookup"} 2',
+                      text)
+        self.assertIn(
+            'geocoder_upstream_responses_total'
+            '{code="503",service="nominatim"} 1', text)
+        self.assertIn('type="Bad\\"Name"', text)
+        self.assertIn("# TYPE geocoder_cache_lookups_total counter", text)
+        self.assertTrue(text.endswith("\n"))
+
+    def test_summary_lists_stages_in_pipeline_order(self):
+        registry = Metrics()
+        registry.observe("nominatim", 0.2)
+        registry.observe("sanitize", 0.0001)
+        summary = registry.format_summary()
+        self.assertLess(summary.index("sanitize"), summary.index("nominatim"))
+
+    def test_merge_adds_snapshot_of_another_registry(self):
+        worker = Metrics()
+        worker.observe("query", 0.002)
+        worker.count("results", status="cache")
+        registry = Metrics()
+        registry.observe("query", 0.2)
+        registry.count("results", status="cache")
+        registry.merge(worker.snapshot())
+        registry.merge(Metrics().snapshot())
+
+        self.assertEqual(registry.stages["query"].count, 2)
+        self.assertAlmostEqual(registry.stages["query"].total, 0.202)
+        self.assertEqual(registry.value("results", status="cache"), 2)
+        self.assertEqual(worker.stages["query"].count, 1)
+
+
+class TestPipelineInstrumentation(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_address_query_passes_through_stages(self):
+        async def fake_find_cached(_query):
+            return None
+
+        async def fake_normalize(text):
+            return text
+
+        async def fake_send_request(address, input_query=None):
+            return GeocodeResult(input_query, STATUS_UPSTREAM, address, 1, 2)
+
+        async def run():
+            with patch("Source.parsing.response.find_cached",
+                       fake_find_cached), \
+                 patch("Source.parsing._normalize_free_text", fake_normalize), \
+                 patch("Source.parsing.response.send_request",
+                       fake_send_request):
+                return await parsing.handle_free_query("Москва, Тверская 1")
+
+        result = asyncio.run(run())
+        self.assertEqual(result.status, STATUS_UPSTREAM)
+        for stage in ("query", "sanitize", "parse_coordinates", "normalize"):
+            self.assertEqual(metrics.stages[stage].count, 1, stage)
+        self.assertEqual(metrics.value("results", status=STATUS_UPSTREAM), 1)
+
+    def test_failure_is_counted_by_type(self):
+        async def broken(_query):
+            raise RuntimeError("нет базы")
+
+        async def run():
+            with patch("Source.parsing.response.find_cached", broken):
+                await parsing.handle_free_query("Москва, Тверская 1")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(run())
+        self.assertEqual(
+            metrics.value("errors", stage="query", type="RuntimeError"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+# tests/test_negative_cache.py
+
+import asyncio
+import io
+import unittest
+from contextlib import redirect_stdout
+from datetime import timedelta
+from unittest.mock import patch
+
+from Source import parsing
+from Source.database import models
+from Source.database import negative_cache
+from Source.database import requests as db_requests
+from Source.metrics import metrics
+from Source.result import STATUS_NOT_FOUND, STATUS_OUTSIDE_RUSSIA
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+class EmptyReply:
+    status_code = 200
+    is_success = True
+
+    def json(self):
+        return []
+
+
+class TestNegativeCache(unittest.TestCase):
+    def setUp(self):
+        negative_cache._memory.clear()
+
+    def test_remember_and_find(self):
+        query = "Нигдеград, улица Первая 1"
+
+        async def run():
+            await models.init_db()
+            before = await negative_cache.find_negative(query)
+            await negative_cache.remember_negative(query, STATUS_NOT_FOUND)
+            # без памяти процесса запись читается из SQLite
+            negative_cache._memory.clear()
+            return before, await negative_cache.find_negative(
+                query.upper() + ",")
+
+        hits_before = metrics.value("negative_hits", reason=STATUS_NOT_FOUND)
+        before, after = asyncio.run(run())
+        self.assertIsNone(before)
+        self.assertEqual(after, STATUS_NOT_FOUND)
+        self.assertEqual(
+            metrics.value("negative_hits", reason=STATUS_NOT_FOUND),
+            hits_before + 1)
+
+    def test_expired_entry_is_ignored(self):
+        query = "Нигдеград, улица Вторая 2"
+        later = models.utcnow() + timedelta(
+            seconds=negative_cache.NEGATIVE_TTL + 1)
+
+        async def run():
+            await models.init_db()
+            await negative_cache.remember_negative(
+                query, STATUS_OUTSIDE_RUSSIA)
+            with patch("Source.database.negative_cache.utcnow",
+                       lambda: later):
+                return await negative_cache.find_negative(query)
+
+        self.assertIsNone(asyncio.run(run()))
+
+    def test_unknown_reason_is_not_stored(self):
+        query = "Нигдеград, улица Третья 3"
+
+        async def run():
+            await models.init_db()
+            await negative_cache.remember_negative(query, "error")
+            return await negative_cache.find_negative(query)
+
+        self.assertIsNone(asyncio.run(run()))
+
+    def test_rows_are_written_in_one_batch(self):
+        queries = [f"Нигдеград, переулок Пачечный {n}" for n in range(1, 6)]
+
+        async def run():
+            await models.init_db()
+            await db_requests.flush_pending_writes()
+            flushes = negative_cache._buffer.flushes
+            stored = negative_cache.negative_stats.stored
+            for query in queries:
+                await negative_cache.remember_negative(
+                    query, STATUS_NOT_FOUND)
+            # ещё не записаны, но уже видны
+            negative_cache._memory.clear()
+            pending = await negative_cache.find_negative(queries[0])
+            await db_requests.flush_pending_writes()
+            negative_cache._memory.clear()
+            found = [await negative_cache.find_negative(query)
+                     for query in queries]
+            return (pending, found, negative_cache._buffer.flushes - flushes,
+                    negative_cache.negative_stats.stored - stored)
+
+        pending, found, flushes, stored = asyncio.run(run())
+        self.assertEqual(pending, STATUS_NOT_FOUND)
+        self.assertEqual(found, [STATUS_NOT_FOUND] * len(queries))
+        self.assertEqual(flushes, 1)
+        self.assertEqual(stored, len(queries))
+
+
+class TestNegativeCacheInPipeline(unittest.TestCase):
+    def test_not_found_is_not_requested_twice(self):
+        query = "Нигдеград, улица Четвёртая 4"
+        calls = []
+
+        async def fake_normalize(text):
+            return text
+
+        async def no_similar(_query):
+            return None
+
+        async def fake_get(*_args, **_kwargs):
+            calls.append(1)
+            return EmptyReply()
+
+        async def run():
+            await models.init_db()
+            with patch("Source.parsing._normalize_free_text", fake_normalize), \
+                 patch("Source.parsing.response.find_similar", no_similar), \
+                 patch("Source.response.http_client.get", fake_get):
+                buf = io.StringIO()
+                with redirect_stdout(buf):
+                    first = await parsing.handle_free_query(query)
+                    second = await parsing.handle_free_query(query)
+                return first, second, buf.getvalue()
+
+        first, second, out = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first.status, STATUS_NOT_FOUND)
+        self.assertEqual(second.status, STATUS_NOT_FOUND)
+        self.assertIn("(запомненный ответ)", out)
+
+    def test_outside_russia_is_remembered(self):
+        query = "Нигдеград, улица Пятая 5"
+        output = {
+            "lat": "52.52", "lon": "13.40",
+            "address": {"city": "Berlin", "country": "Deutschland"},
+        }
+
+        async def run():
+            await models.init_db()
+            with redirect_stdout(io.StringIO()):
+                await parsing.parse_output_address(query, output)
+            return await negative_cache.find_negative(query)
+
+        self.assertEqual(asyncio.run(run()), STATUS_OUTSIDE_RUSSIA)
+
+
+if __name__ == "__main__":
+    unittest.main()
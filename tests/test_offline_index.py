@@ -0,0 +1,281 @@
+# tests/test_offline_index.py
+
+import asyncio
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import main
+from Source import parsing, response
+from Source.database import offline_index
+from Source.result import STATUS_NOT_FOUND, STATUS_OFFLINE
+from tests.temp_db import TempDatabase
+
+OSM_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="56.8386" lon="60.6055">
+    <tag k="addr:housenumber" v="10 корпус 2"/>
+    <tag k="addr:street" v="улица {street}"/>
+    <tag k="addr:city" v="Екатеринбург"/>
+    <tag k="addr:postcode" v="620014"/>
+  </node>
+  <node id="2" lat="56.0" lon="60.0">
+    <tag k="amenity" v="cafe"/>
+  </node>
+  <way id="3">
+    <nd ref="1"/>
+    <center lat="56.8400" lon="60.6100"/>
+    <tag k="addr:housenumber" v="86"/>
+    <tag k="addr:street" v="улица {street}"/>
+    <tag k="building" v="yes"/>
+  </way>
+  <way id="4">
+    <nd ref="1"/>
+    <tag k="addr:housenumber" v="5"/>
+    <tag k="addr:street" v="улица {street}"/>
+  </way>
+</osm>
+"""
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+class TestQueryParsing(unittest.TestCase):
+    def test_house_key(self):
+        self.assertEqual(offline_index.house_key("10 корпус 2"), "10к2")
+        self.assertEqual(offline_index.house_key("10К2"), "10к2")
+        self.assertEqual(offline_index.house_key("3 стр. 1"), "3с1")
+        self.assertEqual(offline_index.house_key("5 литера А"), "5а")
+
+    def test_parse_query(self):
+        parts = offline_index.parse_query(
+            "ул Белинского д 86 г Екатеринбург 620014 Россия")
+        self.assertEqual(parts.house, "86")
+        self.assertEqual(parts.street_types, ["улица"])
+        self.assertEqual(parts.words, ["белинского", "екатеринбург"])
+
+        self.assertEqual(
+            offline_index.parse_query("Москва, Тверская 10 к2").house, "10к2")
+        self.assertIsNone(offline_index.parse_query("Москва, Тверская").house)
+
+    def test_parse_query_keeps_building_parts(self):
+        parts = offline_index.parse_query("Москва, пр-т Мира 5 корпус 2, кв 7")
+        self.assertEqual(parts.house, "5к2")
+        self.assertEqual(parts.street_types, ["проспект"])
+        self.assertEqual(parts.words, ["москва", "мира"])
+        self.assertEqual(offline_index.parse_query(
+            "Мира 5 стр. 1").house, "5с1")
+        self.assertEqual(offline_index.parse_query(
+            "Мира 5 литера А").house, "5а")
+
+        parts = offline_index.parse_query(
+            "Свердловская обл, г Екатеринбург, ул 8 Марта, д 10")
+        self.assertEqual(parts.house, "10")
+        self.assertEqual(parts.region_words, ["свердловская"])
+        self.assertEqual(parts.words, ["екатеринбург", "8", "марта"])
+
+
+class TestParsers(unittest.TestCase):
+    def test_osm_xml_nodes_and_way_centers(self):
+        xml = OSM_XML.format(street="Ленина").encode("utf-8")
+        rows = list(offline_index.iter_osm_xml(
+            io.BytesIO(xml), region="Свердловская область"))
+
+        self.assertEqual([row["house_key"] for row in rows], ["10к2", "86"])
+        self.assertEqual(rows[0]["postcode"], "620014")
+        self.assertEqual(rows[0]["region"], "Свердловская область")
+        self.assertAlmostEqual(rows[1]["latitude"], 56.84)
+        self.assertEqual(rows[1]["city"], "")
+
+    def test_geojson_lines(self):
+        features = [
+            {"type": "Feature",
+             "geometry": {"type": "Point", "coordinates": [37.6, 55.7]},
+             "properties": {"addr:housenumber": "1",
+                            "addr:street": "Тверская улица"}},
+            {"type": "Feature",
+             "geometry": {"type": "Polygon", "coordinates": [
+                 [[37.0, 55.0], [38.0, 55.0], [38.0, 56.0], [37.0, 55.0]]]},
+             "properties": {"addr:housenumber": "2",
+                            "addr:street": "Тверская улица"}},
+            {"type": "Feature",
+             "geometry": {"type": "Point", "coordinates": [37.6, 55.7]},
+             "properties": {"name": "без адреса"}},
+        ]
+        text = "".join("\x1e" + json.dumps(f) + "\n" for f in features)
+        rows = list(offline_index.iter_geojson_lines(
+            io.StringIO(text), city="Москва"))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["city"], "Москва")
+        self.assertAlmostEqual(rows[0]["latitude"], 55.7)
+        self.assertAlmostEqual(rows[1]["latitude"], 55.5)
+        self.assertAlmostEqual(rows[1]["longitude"], 37.5)
+
+    def test_detect_format(self):
+        self.assertEqual(offline_index.detect_format("ural.osm.bz2"), "xml")
+        self.assertEqual(
+            offline_index.detect_format("ru.geojsonseq.gz"), "geojson")
+        with self.assertRaises(ValueError):
+            offline_index.detect_format("ru.osm.pbf")
+
+
+def _node(node_id, street, house, city, lat=55.0, lon=37.0, region=""):
+    return (
+        f'  <node id="{node_id}" lat="{lat}" lon="{lon}">\n'
+        f'    <tag k="addr:housenumber" v="{house}"/>\n'
+        f'    <tag k="addr:street" v="{street}"/>\n'
+        f'    <tag k="addr:city" v="{city}"/>\n'
+        f'    <tag k="addr:region" v="{region}"/>\n'
+        "  </node>\n"
+    )
+
+
+CITIES_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n'
+    + _node(1, "улица Ленина", "10", "Екатеринбург", 56.83, 60.60,
+            "Свердловская область")
+    + _node(2, "проспект Мира", "5", "Москва", 55.78, 37.63)
+    + _node(3, "улица Мира", "7", "Москва", 55.70, 37.50)
+    + _node(4, "улица Мира", "7", "Пермь", 58.00, 56.20)
+    + "</osm>\n"
+)
+
+
+class TestOfflineMatching(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cities.osm")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(CITIES_XML)
+            with patch("sys.stderr", new_callable=io.StringIO):
+                asyncio.run(main.import_mode([path, "--replace"]))
+
+    def _find(self, *queries):
+        async def run():
+            return [await offline_index.find_offline_address(query)
+                    for query in queries]
+        return asyncio.run(run())
+
+    def test_matching_city_and_street_type(self):
+        lenina, mira = self._find(
+            "Свердловская обл, г Екатеринбург, ул Ленина, д 10",
+            "Москва, проспект Мира 5")
+        self.assertAlmostEqual(lenina.latitude, 56.83)
+        self.assertAlmostEqual(mira.latitude, 55.78)
+
+    def test_other_city_misses(self):
+        self.assertEqual(self._find(
+            "Пермь Ленина 10",
+            "Новосибирск Мира 5",
+            "Челябинская обл, Екатеринбург, Ленина 10",
+        ), [None, None, None])
+
+    def test_other_street_type_misses(self):
+        self.assertEqual(self._find(
+            "Москва переулок Мира 5",
+            "Екатеринбург проспект Ленина 10",
+        ), [None, None])
+
+    def test_building_part_must_match(self):
+        self.assertEqual(self._find(
+            "Москва проспект Мира 5 корпус 2",
+            "Москва проспект Мира 5 строение 1",
+        ), [None, None])
+
+    def test_ambiguous_city_misses(self):
+        without_city, perm = self._find("улица Мира 7", "Пермь, улица Мира 7")
+        self.assertIsNone(without_city)
+        self.assertAlmostEqual(perm.latitude, 58.0)
+
+
+class TestOfflineLookup(unittest.TestCase):
+    def setUp(self):
+        self.street = "Проверочная"
+        self._saved_mode = response.OFFLINE_MODE
+
+    def tearDown(self):
+        response.OFFLINE_MODE = self._saved_mode
+
+    def _import(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "extract.osm.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                f.write(OSM_XML.format(street=self.street))
+
+            with patch("sys.stderr", new_callable=io.StringIO):
+                asyncio.run(main.import_mode(
+                    [path, "--replace", "--region", "Свердловская область",
+                     "--city", "Екатеринбург"]))
+
+    def test_find_imported_house(self):
+        self._import()
+
+        async def run():
+            exact = await offline_index.find_offline_address(
+                f"Екатеринбург, {self.street} 10к2")
+            normalized = await offline_index.find_offline_address(
+                f"ул {self.street} д 86 г Екатеринбург Россия")
+            wrong_house = await offline_index.find_offline_address(
+                f"Екатеринбург, {self.street} 87")
+            return exact, normalized, wrong_house
+
+        exact, normalized, wrong_house = asyncio.run(run())
+        self.assertIsNotNone(exact)
+        self.assertAlmostEqual(exact.latitude, 56.8386)
+        self.assertIn("620014", exact.full_address)
+        self.assertIn("10 корпус 2", exact.full_address)
+        self.assertAlmostEqual(normalized.longitude, 60.61)
+        self.assertIn("Свердловская область", normalized.full_address)
+        self.assertIsNone(wrong_house)
+
+    def test_offline_only_never_calls_network(self):
+        self._import()
+        response.OFFLINE_MODE = response.OFFLINE_ONLY
+
+        async def no_network(*_args, **_kwargs):
+            raise AssertionError("сеть не должна использоваться")
+
+        async def no_dadata(_text):
+            return None
+
+        async def run():
+            with patch("Source.response.http_client.get", no_network), \
+                 patch("Source.parsing._normalize_free_text", no_dadata), \
+                 patch("sys.stdout", new_callable=io.StringIO):
+                found = await parsing.handle_free_query(
+                    f"Екатеринбург, {self.street} 86")
+                again = await parsing.handle_free_query(
+                    f"Екатеринбург, {self.street} 86")
+                missing = await parsing.handle_free_query(
+                    f"Екатеринбург, {self.street} 999")
+            return found, again, missing
+
+        found, again, missing = asyncio.run(run())
+        self.assertEqual(found.status, STATUS_OFFLINE)
+        self.assertTrue(found.found)
+        self.assertEqual(again.status, "cache")
+        self.assertEqual(missing.status, STATUS_NOT_FOUND)
+
+    def test_import_requires_format_for_stdin(self):
+        with patch.object(sys, "stderr", new_callable=io.StringIO), \
+             self.assertRaises(SystemExit):
+            asyncio.run(main.import_mode(["-"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
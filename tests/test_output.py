@@ -0,0 +1,99 @@
+# tests/test_output.py
+
+import asyncio
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from Source import output, parsing, response
+from Source.result import (STATUS_CACHE, STATUS_INVALID, STATUS_UPSTREAM,
+                           GeocodeResult)
+
+SCHEMA = ["query", "status", "source", "full_address", "latitude",
+          "longitude", "components", "latency_ms"]
+
+
+class TestResultRecord(unittest.TestCase):
+    def test_schema_is_stable(self):
+        found = output.result_record(GeocodeResult(
+            "q", STATUS_CACHE, "Адрес", 1.0, 2.0, latency_ms=1.23456))
+        failed = output.result_record(
+            GeocodeResult("q", STATUS_INVALID), {"id": 7, "query": "q "})
+
+        self.assertEqual(list(found), SCHEMA)
+        self.assertEqual(list(failed), ["id"] + SCHEMA)
+        self.assertEqual(found["source"], STATUS_CACHE)
+        self.assertEqual(found["latency_ms"], 1.235)
+        self.assertEqual(list(found["components"]),
+                         ["region", "city", "street", "house", "postcode"])
+        self.assertIsNone(failed["source"])
+        self.assertEqual(failed["query"], "q ")
+
+    def test_dumps_without_orjson(self):
+        payload = output.result_record(
+            GeocodeResult("Москва", STATUS_UPSTREAM, "Адрес", 1.5, 2.5))
+        fast = output.dumps(payload)
+        with patch.object(output, "orjson", None):
+            plain = output.dumps(payload)
+        self.assertEqual(json.loads(fast), json.loads(plain))
+        self.assertIn("Москва", plain)
+        self.assertNotIn("\n", plain)
+
+    def test_writer_buffers_lines(self):
+        stream = io.StringIO()
+        writer = output.JsonlWriter(stream, buffer_lines=2)
+        writer.write(GeocodeResult("a", STATUS_INVALID))
+        self.assertEqual(stream.getvalue(), "")
+        writer.write(GeocodeResult("b", STATUS_INVALID))
+        writer.write(GeocodeResult("c", STATUS_INVALID))
+        self.assertEqual(len(stream.getvalue().splitlines()), 2)
+        writer.flush()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line["query"] for line in lines], ["a", "b", "c"])
+
+
+class TestQuietPipeline(unittest.TestCase):
+    def test_upstream_result_has_components_and_no_human_output(self):
+        async def fake_add(*_args, **_kwargs):
+            return None
+
+        nominatim = {
+            "lat": "56.8", "lon": "60.6",
+            "address": {"state": "Свердловская область",
+                        "city": "Екатеринбург", "road": "улица Белинского",
+                        "house_number": "86", "country": "Россия"},
+        }
+
+        async def run():
+            quiet = output.human_output.set(False)
+            try:
+                with patch("Source.parsing.add_new_address", fake_add):
+                    result = await parsing.parse_output_address(
+                        "Екатеринбург, Белинского 86", nominatim)
+                response._print_json_result("q", "Адрес", 1.0, 2.0)
+            finally:
+                output.human_output.reset(quiet)
+            return result
+
+        buf = io.StringIO()
+        with redirect_stdout(buf):
+            result = asyncio.run(run())
+
+        self.assertEqual(buf.getvalue(), "")
+        self.assertEqual(result.source, STATUS_UPSTREAM)
+        self.assertEqual(result.components["house"], "86")
+        self.assertEqual(result.components["city"], "Екатеринбург")
+        self.assertIsNone(result.components["postcode"])
+
+    def test_handle_free_query_reports_latency(self):
+        buf = io.StringIO()
+        with redirect_stdout(buf):
+            result = asyncio.run(parsing.handle_free_query("abc"))
+        self.assertEqual(result.status, STATUS_INVALID)
+        self.assertGreaterEqual(result.latency_ms, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
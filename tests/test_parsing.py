@@ -2,6 +2,8 @@
 
 import asyncio
 import io
+import threading
+import time
 import unittest
 from contextlib import redirect_stdout
 from unittest.mock import patch
@@ -36,7 +38,9 @@ class TestParsing(unittest.TestCase):
                     input_query,
                     full_address,
                     lat,
-                    lon
+                    lon,
+                    normalized_query=None,
+                    query_key=None
                     ):
                 calls["input_query"] = input_query
                 calls["full_address"] = full_address
@@ -123,7 +127,7 @@ class TestParsingExtra(unittest.TestCase):
             client.clean = boom
             buf = io.StringIO()
             with redirect_stdout(buf):
-                res = parsing._clean_with_dadata("Екб")
+                res = asyncio.run(parsing._clean_with_dadata("Екб"))
             out = buf.getvalue()
             self.assertIsNone(res)
             self.assertIn("Не удалось нормализовать адрес", out)
@@ -136,19 +140,21 @@ class TestParsingExtra(unittest.TestCase):
                 return fake_result
 
         with patch("Source.parsing._client", DummyClient()):
-            res = parsing._clean_with_dadata("Екатеринбург, Белинского 86")
+            res = asyncio.run(
+                parsing._clean_with_dadata("Екатеринбург, Белинского 86"))
         self.assertEqual(res, fake_result)
 
     def test_normalize_free_text_failure(self):
-        def fake_clean(_addr: str):
+        async def fake_clean(_addr: str):
             return None
 
         with patch("Source.parsing._clean_with_dadata", fake_clean):
-            res = parsing._normalize_free_text("Екб, Белинского 86")
+            res = asyncio.run(
+                parsing._normalize_free_text("Екб, Белинского 86"))
         self.assertIsNone(res)
 
     def test_normalize_free_text_success(self):
-        def fake_clean(_addr: str):
+        async def fake_clean(_addr: str):
             return {
                 "street": "Белинского",
                 "house": "86",
@@ -158,7 +164,8 @@ class TestParsingExtra(unittest.TestCase):
             }
 
         with patch("Source.parsing._clean_with_dadata", fake_clean):
-            res = parsing._normalize_free_text("Екб, Белинского 86")
+            res = asyncio.run(
+                parsing._normalize_free_text("Екб, Белинского 86"))
 
         self.assertEqual(
             res,
@@ -283,11 +290,16 @@ class TestParsingExtra(unittest.TestCase):
         self.assertIn("Слишком короткий адрес", out)
 
     def test_handle_free_query_normalize_fails(self):
-        def fake_normalize(_text: str):
+        async def fake_normalize(_text: str):
+            return None
+
+        async def no_cache(_query: str):
             return None
 
         async def run():
-            with patch("Source.parsing._normalize_free_text", fake_normalize):
+            with patch("Source.parsing._normalize_free_text", fake_normalize), \
+                 patch("Source.parsing.response.find_cached", no_cache), \
+                 patch("Source.parsing.response.find_similar", no_cache):
                 buf = io.StringIO()
                 with redirect_stdout(buf):
                     await parsing.handle_free_query(
@@ -301,28 +313,29 @@ class TestParsingExtra(unittest.TestCase):
     def test_handle_free_query_coords_path(self):
         calls = {}
 
-        async def fake_send_request(text: str):
-            calls["query"] = text
+        async def fake_reverse_geocode(lat: float, lon: float):
+            calls["point"] = (lat, lon)
 
         async def run():
             with patch(
-                "Source.parsing.response.send_request",
-                fake_send_request
+                "Source.parsing.response.reverse_geocode",
+                fake_reverse_geocode
                 ):
                 await parsing.handle_free_query("55.75, 37.61")
 
         asyncio.run(run())
-        self.assertEqual(calls.get("query"), "55.75 37.61")
+        self.assertEqual(calls.get("point"), (55.75, 37.61))
 
     def test_handle_free_query_normalized_success(self):
 
-        def fake_normalize(_text: str) -> str:
+        async def fake_normalize(_text: str) -> str:
             return "Екатеринбург, Родонитовая 1"
 
         calls = {}
 
-        async def fake_send_request(text: str):
+        async def fake_send_request(text: str, input_query=None):
             calls["query"] = text
+            calls["input_query"] = input_query
 
         async def run():
             with patch(
@@ -336,6 +349,91 @@ class TestParsingExtra(unittest.TestCase):
 
         asyncio.run(run())
         self.assertEqual(calls.get("query"), "Екатеринбург, Родонитовая 1")
+        self.assertEqual(calls.get("input_query"), "что-то там")
+
+
+class TestAsyncDadata(unittest.TestCase):
+    def test_clean_runs_concurrently_up_to_limit(self):
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+
+        class SlowClient:
+            def clean(self, *_args, **_kwargs):
+                with lock:
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                time.sleep(0.05)
+                with lock:
+                    state["active"] -= 1
+                return {"city": "Екатеринбург"}
+
+        async def run():
+            ticks = 0
+
+            async def ticker():
+                # event loop не должен простаивать, пока DaData отвечает
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.005)
+
+            tick_task = asyncio.ensure_future(ticker())
+            results = await asyncio.gather(*(
+                parsing._clean_with_dadata(f"адрес {i}") for i in range(6)
+            ))
+            tick_task.cancel()
+            return results, ticks
+
+        with patch("Source.parsing._client", SlowClient()), \
+             patch("Source.parsing.DADATA_CONCURRENCY", 3):
+            results, ticks = asyncio.run(run())
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(state["peak"], 3)
+        self.assertGreater(ticks, 5)
+
+    def test_clean_timeout(self):
+        class HangingClient:
+            def clean(self, *_args, **_kwargs):
+                time.sleep(0.2)
+                return {"city": "Екатеринбург"}
+
+        buf = io.StringIO()
+        with patch("Source.parsing._client", HangingClient()), \
+             patch("Source.parsing.DADATA_TIMEOUT", 0.01), \
+             redirect_stdout(buf):
+            res = asyncio.run(parsing._clean_with_dadata("Екб"))
+
+        self.assertIsNone(res)
+        self.assertIn("Нет ответа", buf.getvalue())
+
+    def test_timed_out_call_keeps_its_slot(self):
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+
+        class SlowClient:
+            def clean(self, *_args, **_kwargs):
+                with lock:
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                time.sleep(0.1)
+                with lock:
+                    state["active"] -= 1
+                return {"city": "Екатеринбург"}
+
+        async def run():
+            return await asyncio.gather(*(
+                parsing._clean_with_dadata(f"адрес {i}") for i in range(4)
+            ))
+
+        with patch("Source.parsing._client", SlowClient()), \
+             patch("Source.parsing.DADATA_CONCURRENCY", 2), \
+             patch("Source.parsing.DADATA_TIMEOUT", 0.02), \
+             redirect_stdout(io.StringIO()):
+            results = asyncio.run(run())
+
+        self.assertEqual(results, [None] * 4)
+        self.assertEqual(state["peak"], 2)
 
 
 if __name__ == "__main__":
@@ -7,6 +7,7 @@ from contextlib import redirect_stdout
 from unittest.mock import patch
 
 from Source import parsing
+from Source.result import STATUS_CACHE, GeocodeResult
 
 
 class TestHandleFreeQuery(unittest.TestCase):
@@ -29,12 +30,12 @@ class TestHandleFreeQuery(unittest.TestCase):
         self.assertIn("Слишком короткий адрес", out)
 
     def test_normalized_address_calls_send_request(self):
-        def fake_normalize(text):
+        async def fake_normalize(text):
             return "Екатеринбург, Родонитовая 1"
 
         calls = {}
 
-        async def fake_send_request(text):
+        async def fake_send_request(text, input_query=None):
             calls["query"] = text
 
         async def run():
@@ -50,6 +51,24 @@ class TestHandleFreeQuery(unittest.TestCase):
         asyncio.run(run())
         self.assertEqual(calls.get("query"), "Екатеринбург, Родонитовая 1")
 
+    def test_cached_query_skips_normalization(self):
+        async def fake_normalize(_text):
+            raise AssertionError("DaData не должна вызываться при попадании")
+
+        async def fake_find_cached(query):
+            return GeocodeResult(query, STATUS_CACHE, "Адрес", 1.0, 2.0)
+
+        async def run():
+            with patch("Source.parsing._normalize_free_text",
+                       fake_normalize), \
+                 patch("Source.parsing.response.find_cached",
+                       fake_find_cached):
+                return await parsing.handle_free_query(
+                    "Екатеринбург, Родонитовая 1")
+
+        result = asyncio.run(run())
+        self.assertEqual(result.status, STATUS_CACHE)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -8,9 +8,18 @@ from contextlib import redirect_stdout
 from unittest.mock import patch
 
 from Source import response
+from Source.scheduler import nominatim_scheduler
 
 
 class TestResponse(unittest.TestCase):
+    def setUp(self):
+        # частоту запросов к Nominatim в этих тестах не ограничиваем
+        self._saved_bucket = nominatim_scheduler.bucket
+        nominatim_scheduler.configure(rate=0)
+
+    def tearDown(self):
+        nominatim_scheduler.bucket = self._saved_bucket
+
     def test_print_json_result(self):
         buf = io.StringIO()
         with redirect_stdout(buf):
@@ -29,18 +38,18 @@ class TestResponse(unittest.TestCase):
             latitude = 10.0
             longitude = 20.0
 
-        async def fake_return_address_if_exist(query):
+        async def fake_return_address_if_exist(query, key=None):
             return Dummy()
 
-        def fake_requests_get(*args, **kwargs):
+        async def fake_http_get(*args, **kwargs):
             raise AssertionError("HTTP не должен вызываться при наличии кэша")
 
         async def run():
             with patch(
                 "Source.response.return_address_if_exist",
                 fake_return_address_if_exist), \
-                 patch("Source.response.requests.get",
-                       fake_requests_get
+                 patch("Source.response.http_client.get",
+                       fake_http_get
                        ):
                 buf = io.StringIO()
                 with redirect_stdout(buf):
@@ -52,11 +61,12 @@ class TestResponse(unittest.TestCase):
         asyncio.run(run())
 
     def test_send_request_calls_parsing_when_not_cached(self):
-        async def fake_return_address_if_exist(query):
+        async def fake_return_address_if_exist(query, key=None):
             return None
 
         class DummyResp:
-            ok = True
+            is_success = True
+            status_code = 200
 
             def json(self):
                 return [
@@ -76,7 +86,7 @@ class TestResponse(unittest.TestCase):
                     }
                 ]
 
-        def fake_requests_get(*args, **kwargs):
+        async def fake_http_get(*args, **kwargs):
             return DummyResp()
 
         calls = {}
@@ -89,8 +99,8 @@ class TestResponse(unittest.TestCase):
             with patch(
                 "Source.response.return_address_if_exist",
                 fake_return_address_if_exist), \
-                 patch("Source.response.requests.get",
-                       fake_requests_get
+                 patch("Source.response.http_client.get",
+                       fake_http_get
                        ), \
                  patch(
                      "Source.response.parsing.parse_output_address",
@@ -104,19 +114,27 @@ class TestResponse(unittest.TestCase):
 
 
 class TestResponseExtra(unittest.TestCase):
+    def setUp(self):
+        # частоту запросов к Nominatim в этих тестах не ограничиваем
+        self._saved_bucket = nominatim_scheduler.bucket
+        nominatim_scheduler.configure(rate=0)
+
+    def tearDown(self):
+        nominatim_scheduler.bucket = self._saved_bucket
+
     def test_send_request_http_exception(self):
         async def run():
-            async def fake_return_address_if_exist(query):
+            async def fake_return_address_if_exist(query, key=None):
                 return None
 
-            def fake_get(*args, **kwargs):
+            async def fake_get(*args, **kwargs):
                 raise RuntimeError("network down")
 
             with patch(
                     "Source.response.return_address_if_exist",
                     fake_return_address_if_exist
                     ), \
-                    patch("Source.response.requests.get", fake_get):
+                    patch("Source.response.http_client.get", fake_get):
                 buf = io.StringIO()
                 with redirect_stdout(buf):
                     await response.send_request("Екатеринбург, Белинского 86")
@@ -130,26 +148,26 @@ class TestResponseExtra(unittest.TestCase):
 
     def test_send_request_http_not_ok(self):
         class DummyResp:
-            ok = False
+            is_success = False
             status_code = 503
 
             def json(self):
                 raise AssertionError(
-                    "json() не должен вызываться при ok=False"
+                    "json() не должен вызываться при is_success=False"
                     )
 
         async def run():
-            async def fake_return_address_if_exist(query):
+            async def fake_return_address_if_exist(query, key=None):
                 return None
 
-            def fake_get(*args, **kwargs):
+            async def fake_get(*args, **kwargs):
                 return DummyResp()
 
             with patch(
                     "Source.response.return_address_if_exist",
                     fake_return_address_if_exist
                     ), \
-                    patch("Source.response.requests.get", fake_get):
+                    patch("Source.response.http_client.get", fake_get):
                 buf = io.StringIO()
                 with redirect_stdout(buf):
                     await response.send_request("Екатеринбург, Белинского 86")
@@ -160,23 +178,24 @@ class TestResponseExtra(unittest.TestCase):
 
     def test_send_request_empty_payload(self):
         class DummyResp:
-            ok = True
+            is_success = True
+            status_code = 200
 
             def json(self):
                 return []
 
         async def run():
-            async def fake_return_address_if_exist(query):
+            async def fake_return_address_if_exist(query, key=None):
                 return None
 
-            def fake_get(*args, **kwargs):
+            async def fake_get(*args, **kwargs):
                 return DummyResp()
 
             with patch(
                     "Source.response.return_address_if_exist",
                     fake_return_address_if_exist
                     ), \
-                    patch("Source.response.requests.get", fake_get):
+                    patch("Source.response.http_client.get", fake_get):
                 buf = io.StringIO()
                 with redirect_stdout(buf):
                     await response.send_request("Екатеринбург")
@@ -185,6 +204,37 @@ class TestResponseExtra(unittest.TestCase):
 
         asyncio.run(run())
 
+    def test_send_request_remembers_input_query_on_cache_hit(self):
+        class Dummy:
+            full_address = "Адрес из БД"
+            latitude = 10.0
+            longitude = 20.0
+
+        saved = {}
+
+        async def fake_return_address_if_exist(query, key=None):
+            return Dummy()
+
+        async def fake_add_new_address(input_query, full_address, lat, lon,
+                                       normalized_query=None):
+            saved["input_query"] = input_query
+            saved["normalized_query"] = normalized_query
+
+        async def run():
+            with patch("Source.response.return_address_if_exist",
+                       fake_return_address_if_exist), \
+                 patch("Source.response.add_new_address",
+                       fake_add_new_address):
+                with redirect_stdout(io.StringIO()):
+                    return await response.send_request(
+                        "Белинского 86 Екатеринбург", "Екб, Белинского 86")
+
+        result = asyncio.run(run())
+        self.assertEqual(result.status, "cache")
+        self.assertEqual(saved["input_query"], "Екб, Белинского 86")
+        self.assertEqual(saved["normalized_query"],
+                         "Белинского 86 Екатеринбург")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,105 @@
+# tests/test_scheduler.py
+
+import asyncio
+import unittest
+
+from Source.scheduler import (PRIORITY_BATCH, PRIORITY_INTERACTIVE,
+                              TokenBucket, UpstreamScheduler,
+                              current_priority)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=3, clock=clock)
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(), 0.5)
+
+        clock.now = 0.5
+        self.assertEqual(bucket.take(), 0)
+        self.assertGreater(bucket.take(), 0)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(rate=0)
+        self.assertTrue(all(bucket.take() == 0 for _ in range(100)))
+
+
+class TestUpstreamScheduler(unittest.TestCase):
+    def test_rate_is_respected(self):
+        scheduler = UpstreamScheduler("тест", rate=50, burst=1)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await asyncio.gather(*(scheduler.acquire() for _ in range(6)))
+            return loop.time() - started
+
+        elapsed = asyncio.run(run())
+        # первый запрос сразу, остальные пять — по одному за 20 мс
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertEqual(scheduler.granted["interactive"], 6)
+        self.assertGreaterEqual(scheduler.max_queue_depth, 4)
+
+    def test_interactive_goes_before_batch(self):
+        scheduler = UpstreamScheduler("тест", rate=100, burst=1)
+        order = []
+
+        async def request(name, priority):
+            await scheduler.acquire(priority)
+            order.append(name)
+
+        async def run():
+            await scheduler.acquire()  # забираем единственный токен
+            batch = [
+                asyncio.ensure_future(request(f"batch{i}", PRIORITY_BATCH))
+                for i in range(3)
+            ]
+            await asyncio.sleep(0)
+            interactive = asyncio.ensure_future(
+                request("interactive", PRIORITY_INTERACTIVE))
+            await asyncio.gather(*batch, interactive)
+
+        asyncio.run(run())
+        self.assertEqual(order[0], "interactive")
+        self.assertEqual(order[1:], ["batch0", "batch1", "batch2"])
+        self.assertIn("batch: 3", scheduler.format())
+
+    def test_priority_from_context(self):
+        scheduler = UpstreamScheduler("тест", rate=0)
+
+        async def batch_job():
+            current_priority.set(PRIORITY_BATCH)
+            await scheduler.acquire()
+
+        async def run():
+            await asyncio.ensure_future(batch_job())
+            await scheduler.acquire()
+
+        asyncio.run(run())
+        self.assertEqual(scheduler.granted["batch"], 1)
+        self.assertEqual(scheduler.granted["interactive"], 1)
+
+    def test_cancelled_waiter_is_skipped(self):
+        scheduler = UpstreamScheduler("тест", rate=50, burst=1)
+
+        async def run():
+            await scheduler.acquire()
+            waiter = asyncio.ensure_future(scheduler.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.wait_for(scheduler.acquire(), 1)
+
+        asyncio.run(run())
+        self.assertEqual(scheduler.queue_depth, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
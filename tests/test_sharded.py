@@ -0,0 +1,119 @@
+# tests/test_sharded.py
+
+import io
+import json
+import multiprocessing
+import os
+import unittest
+from unittest.mock import patch
+
+from Source import sharded
+from Source.metrics import metrics
+from Source.result import STATUS_INVALID, STATUS_NOT_FOUND
+from Source.scheduler import SharedTokenBucket
+
+
+def _take_tokens(bucket, count, results):
+    results.put([bucket.take() for _ in range(count)])
+
+
+def _second_worker_fails(index, inbox, outbox, buckets, concurrency):
+    # в дочернем процессе sharded._worker — настоящий; без очереди
+    # второй рабочий падает на первой же записи
+    sharded._worker(index, inbox if index == 0 else None, outbox,
+                    buckets, concurrency)
+
+
+def _numbered(count):
+    return io.StringIO("".join(
+        json.dumps({"id": n, "query": "abc"}) + "\n" for n in range(count)))
+
+
+class TestSharding(unittest.TestCase):
+    def test_same_key_goes_to_same_worker(self):
+        variants = ["Екатеринбург, ул. Ленина, д. 5",
+                    "екатеринбург улица ленина 5",
+                    "ЕКБ, ул Ленина 5"]
+        shards = {sharded.shard_for({"query": q}, seq, 8)
+                  for seq, q in enumerate(variants)}
+        self.assertEqual(len(shards), 1)
+        spread = {sharded.shard_for({"query": f"Пермь, Ленина {n}"}, 0, 4)
+                  for n in range(40)}
+        self.assertEqual(spread, {0, 1, 2, 3})
+        self.assertEqual(sharded.shard_for({"query": None}, 6, 4), 2)
+
+
+class TestSharedTokenBucket(unittest.TestCase):
+    def test_budget_is_shared_between_processes(self):
+        context = multiprocessing.get_context("spawn")
+        bucket = SharedTokenBucket(rate=0.01, burst=3, context=context)
+        results = context.Queue()
+        child = context.Process(
+            target=_take_tokens, args=(bucket, 2, results))
+        child.start()
+        taken_by_child = results.get(timeout=30)
+        child.join()
+
+        self.assertEqual(taken_by_child, [0.0, 0.0])
+        self.assertEqual(bucket.take(), 0.0)
+        self.assertGreater(bucket.take(), 0.0)
+
+    def test_unlimited_rate(self):
+        bucket = SharedTokenBucket(rate=0)
+        self.assertEqual([bucket.take() for _ in range(5)], [0.0] * 5)
+
+
+class TestRunSharded(unittest.TestCase):
+    def test_results_are_merged_in_input_order(self):
+        queries = []
+        for n in range(60):
+            if n % 3 == 0:
+                queries.append({"id": n, "query": "abc"})
+            else:
+                queries.append({"id": n, "query": f"{n % 7}.5 {n % 5}.5"})
+        source = io.StringIO(
+            "".join(json.dumps(q, ensure_ascii=False) + "\n" for q in queries))
+        out = io.StringIO()
+
+        # рабочие процессы читают окружение при запуске: в сеть не ходим
+        with patch.dict(os.environ, {"GEOCODER_OFFLINE": "only"}), \
+             patch.object(sharded, "INPUT_CHUNK", 4), \
+             patch.object(metrics, "stages", {}), \
+             patch.object(metrics, "counters", {}), \
+             patch.object(metrics, "enabled", True):
+            stats = sharded.run_sharded(source, out, workers=2, concurrency=4)
+            summary = metrics.format_summary()
+            queries = metrics.stages["query"].count
+            invalid = metrics.value("results", status=STATUS_INVALID)
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line["id"] for line in lines], list(range(60)))
+        self.assertEqual(stats.total, 60)
+        self.assertEqual(stats.by_status[STATUS_INVALID], 20)
+        self.assertEqual(stats.by_status[STATUS_NOT_FOUND], 40)
+        self.assertEqual(sorted(stats.worker_reports), [0, 1])
+        self.assertIn("Процесс 1:", stats.format_report())
+        # время этапов из обоих процессов сведено в главном
+        self.assertEqual(queries, 60)
+        self.assertEqual(invalid, 20)
+        self.assertIn("    query: 60,", summary)
+        self.assertNotIn("нет данных", summary)
+
+    def test_worker_error_stops_the_run(self):
+        out = io.StringIO()
+        with patch.dict(os.environ, {"GEOCODER_OFFLINE": "only"}), \
+             patch.object(sharded, "INPUT_CHUNK", 4), \
+             patch.object(sharded, "_worker", _second_worker_fails):
+            with self.assertRaises(RuntimeError) as caught:
+                sharded.run_sharded(_numbered(200), out, workers=2,
+                                    concurrency=4)
+
+        self.assertIn("Рабочий процесс 1", str(caught.exception))
+        self.assertIn("AttributeError", str(caught.exception))
+        # только непрерывное начало входа, без пропусков
+        ids = [json.loads(line)["id"] for line in out.getvalue().splitlines()]
+        self.assertEqual(ids, list(range(len(ids))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# tests/test_singleflight.py
+
+import asyncio
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from Source import parsing, response
+from Source.result import STATUS_UPSTREAM, GeocodeResult
+from Source.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_result(self):
+        flight = SingleFlight()
+        calls = {"count": 0}
+
+        async def work():
+            calls["count"] += 1
+            await asyncio.sleep(0.01)
+            return "готово"
+
+        async def run():
+            return await asyncio.gather(*(
+                flight.do("ключ", work) for _ in range(5)
+            ))
+
+        results = asyncio.run(run())
+        self.assertEqual(results, ["готово"] * 5)
+        self.assertEqual(calls["count"], 1)
+        self.assertEqual(flight.executed, 1)
+        self.assertEqual(flight.coalesced, 4)
+        self.assertEqual(flight.in_flight, 0)
+
+    def test_error_is_shared(self):
+        flight = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("сеть недоступна")
+
+        async def run():
+            return await asyncio.gather(
+                *(flight.do("ключ", boom) for _ in range(3)),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(flight.executed, 1)
+
+    def test_different_keys_are_independent(self):
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            return 1
+
+        async def run():
+            await asyncio.gather(flight.do("a", work), flight.do("b", work))
+
+        asyncio.run(run())
+        self.assertEqual(flight.executed, 2)
+        self.assertEqual(flight.coalesced, 0)
+
+    def test_waiter_takes_over_when_leader_cancelled(self):
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "готово"
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do("ключ", work))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(flight.do("ключ", work))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await waiter
+
+        self.assertEqual(asyncio.run(run()), "готово")
+        self.assertEqual(flight.executed, 2)
+
+
+class TestCoalescedPipeline(unittest.TestCase):
+    def test_identical_queries_hit_upstream_once(self):
+        calls = {"nominatim": 0, "dadata": 0}
+
+        async def fake_clean(_address):
+            calls["dadata"] += 1
+            await asyncio.sleep(0.01)
+            return {"street": "Белинского", "house": "86",
+                    "city": "Екатеринбург"}
+
+        async def no_cache(_query):
+            return None
+
+        async def fake_upstream(address, input_query):
+            calls["nominatim"] += 1
+            await asyncio.sleep(0.01)
+            return GeocodeResult(input_query, STATUS_UPSTREAM, "Адрес", 1, 2)
+
+        async def run():
+            with patch("Source.parsing._clean_with_dadata", fake_clean), \
+                 patch("Source.parsing.response.find_cached", no_cache), \
+                 patch("Source.parsing.response.find_similar", no_cache), \
+                 patch("Source.response._send_request", fake_upstream):
+                return await asyncio.gather(*(
+                    parsing.handle_free_query("Екатеринбург, Белинского 86")
+                    for _ in range(4)
+                ))
+
+        with redirect_stdout(io.StringIO()):
+            results = asyncio.run(run())
+
+        self.assertTrue(all(r.status == STATUS_UPSTREAM for r in results))
+        self.assertEqual(calls, {"nominatim": 1, "dadata": 1})
+        self.assertGreaterEqual(response.upstream_flight.coalesced, 3)
+        self.assertGreaterEqual(parsing.normalize_flight.coalesced, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
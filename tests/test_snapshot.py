@@ -0,0 +1,163 @@
+# tests/test_snapshot.py
+
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, text
+
+from Source.database import models
+from Source.database import requests as db_requests
+from Source.database import snapshot
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+def _row(query, address="Адрес", lat=56.1, lon=60.1, hits=0):
+    return (query, query, None, address, lat, lon, hits,
+            "2024-01-01 00:00:00.000000", None)
+
+
+def _snapshot_stream(rows, **header):
+    header = {"format": snapshot.SNAPSHOT_FORMAT,
+              "version": snapshot.SNAPSHOT_VERSION,
+              "key_version": models.KEY_VERSION,
+              "columns": list(snapshot.COLUMNS), **header}
+    lines = [json.dumps(header)] + [
+        row if isinstance(row, str) else json.dumps(row) for row in rows]
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+class TestSnapshotFormat(unittest.TestCase):
+    def test_export_contains_cached_address(self):
+        query = "Екатеринбург, ул. Ленина, д. 5"
+        address = "Екатеринбург, улица Ленина 5"
+
+        async def run(path):
+            await db_requests.add_new_address(query, address, 56.5, 60.5)
+            return await snapshot.export_cache(path)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.jsonl.gz")
+            stats = asyncio.run(run(path))
+            with gzip.open(path, "rt", encoding="utf-8") as stream:
+                header = snapshot.read_header(stream)
+                read = snapshot.SnapshotStats("Прочитано")
+                rows = list(snapshot.iter_rows(stream, header, read))
+
+        self.assertEqual(header["key_version"], models.KEY_VERSION)
+        self.assertEqual(stats.rows, 1)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][0], query)
+        self.assertEqual(rows[0][1], db_requests.cache_key(query))
+        self.assertEqual(rows[0][3], address)
+        self.assertEqual((rows[0][4], rows[0][5]), (56.5, 60.5))
+
+    def test_newer_version_is_rejected(self):
+        stream = _snapshot_stream([], version=snapshot.SNAPSHOT_VERSION + 1)
+        with self.assertRaises(ValueError):
+            snapshot.read_header(stream)
+        with self.assertRaises(ValueError):
+            snapshot.read_header(io.StringIO("not a snapshot\n"))
+
+    def test_broken_rows_are_skipped_and_old_keys_rekeyed(self):
+        stream = _snapshot_stream([
+            _row("ЕКБ, ул. Ленина, д. 5"),
+            ["слишком", "короткая"],
+            _row("без координат", lat=None),
+            "{не json",
+        ], key_version=0)
+        stats = snapshot.SnapshotStats("Прочитано")
+        header = snapshot.read_header(stream)
+        rows = list(snapshot.iter_rows(stream, header, stats))
+
+        self.assertEqual(stats.read, 4)
+        self.assertEqual([row[1] for row in rows],
+                         ["екатеринбург улица ленина 5"])
+
+
+class TestSnapshotLoad(unittest.TestCase):
+    def _load(self, engine, rows, replace=False):
+        with engine.begin() as connection:
+            return snapshot._load(connection, iter(rows), replace, 2)
+
+    def test_bulk_load_and_merge_rebuild_indexes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'node.db')}")
+            with engine.begin() as connection:
+                models.Base.metadata.create_all(connection)
+                models._migrate_addresses(connection)
+
+            # пустая база: индексы снимаются целиком, повторы убираются потом
+            first = self._load(engine, [
+                _row("пермь"), _row("пермь", address="Дубль"),
+                _row("тюмень", lat=57.1, lon=65.5),
+            ])
+            # слияние: уже известный ключ не перезаписывается
+            second = self._load(engine, [
+                _row("пермь", address="Новый"), _row("омск", lat=55.0),
+            ])
+
+            with engine.begin() as connection:
+                connection.execute(text(
+                    "INSERT INTO addresses (full_address, latitude, longitude, "
+                    "query_key) VALUES ('После', 50.0, 40.0, 'курск')"))
+            with engine.connect() as connection:
+                rows = connection.execute(text(
+                    "SELECT query_key, full_address FROM addresses "
+                    "ORDER BY id")).all()
+                in_rtree = connection.execute(text(
+                    "SELECT count(*) FROM addresses_rtree")).scalar()
+                in_fts = connection.execute(text(
+                    "SELECT count(*) FROM addresses_fts "
+                    "WHERE addresses_fts MATCH 'тюмень'")).scalar()
+                indexes = {name for (name,) in connection.execute(text(
+                    "SELECT name FROM sqlite_master "
+                    "WHERE type = 'index' AND tbl_name = 'addresses'"))}
+            engine.dispose()
+
+        self.assertEqual(first, (0, 2))
+        self.assertEqual(second, (2, 3))
+        self.assertEqual([tuple(row) for row in rows], [
+            ("пермь", "Адрес"), ("тюмень", "Адрес"),
+            ("омск", "Адрес"), ("курск", "После"),
+        ])
+        self.assertEqual(in_rtree, 4)
+        self.assertEqual(in_fts, 1)
+        self.assertIn("ix_addresses_query_key", indexes)
+
+    def test_replace_clears_existing_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'node.db')}")
+            with engine.begin() as connection:
+                models.Base.metadata.create_all(connection)
+                models._migrate_addresses(connection)
+            self._load(engine, [_row("пермь"), _row("омск")])
+            result = self._load(engine, [_row("курск")], replace=True)
+            with engine.connect() as connection:
+                keys = connection.execute(text(
+                    "SELECT query_key FROM addresses")).scalars().all()
+                in_rtree = connection.execute(text(
+                    "SELECT count(*) FROM addresses_rtree")).scalar()
+            engine.dispose()
+
+        self.assertEqual(result, (0, 1))
+        self.assertEqual(keys, ["курск"])
+        self.assertEqual(in_rtree, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
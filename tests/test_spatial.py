@@ -0,0 +1,109 @@
+# tests/test_spatial.py
+
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+
+from Source import parsing
+from Source.database import models
+from Source.database import requests as db_requests
+from Source.utils import distance_m
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+class TestLegacyMigration(unittest.TestCase):
+    def test_string_coordinates_are_migrated_in_place(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'old.db')}")
+            with engine.begin() as connection:
+                connection.execute(text(
+                    "CREATE TABLE addresses ("
+                    "id INTEGER PRIMARY KEY, full_address VARCHAR NOT NULL, "
+                    "latitude VARCHAR NOT NULL, longitude VARCHAR NOT NULL)"
+                ))
+                connection.execute(text(
+                    "INSERT INTO addresses VALUES "
+                    "(7, 'Старый адрес', '56.7928003', '60.6165292')"
+                ))
+
+            with engine.begin() as connection:
+                models._migrate_addresses(connection)
+                # повторный запуск ничего не ломает
+                models._migrate_addresses(connection)
+
+            with engine.connect() as connection:
+                row = connection.execute(text(
+                    "SELECT id, typeof(latitude), latitude, query_key "
+                    "FROM addresses"
+                )).one()
+                in_rtree = connection.execute(text(
+                    "SELECT count(*) FROM addresses_rtree WHERE id = 7"
+                )).scalar()
+            engine.dispose()
+
+        self.assertEqual(row[0], 7)
+        self.assertEqual(row[1], "real")
+        self.assertAlmostEqual(row[2], 56.7928003)
+        self.assertIsNone(row[3])
+        self.assertEqual(in_rtree, 1)
+
+
+class TestNearestAddress(unittest.TestCase):
+    def test_distance_m(self):
+        self.assertAlmostEqual(
+            distance_m(56.0, 60.0, 56.001, 60.0), 111.2, delta=0.5)
+
+    def test_nearest_within_radius(self):
+        lat, lon = 10.0, 20.0
+
+        async def run():
+            await db_requests.add_new_address(
+                "дальняя", "Дальняя", lat + 0.0004, lon)
+            await db_requests.add_new_address(
+                "ближняя", "Ближняя", lat + 0.0001, lon)
+
+            near = await db_requests.find_nearest_address(lat, lon, 30)
+            far = await db_requests.find_nearest_address(lat - 0.01, lon, 30)
+            return near, far
+
+        near, far = asyncio.run(run())
+        self.assertEqual(near.full_address, "Ближняя")
+        self.assertIsNone(far)
+
+    def test_coordinate_query_served_from_cache(self):
+        lat, lon = -10.0, -20.0
+
+        async def run():
+            await db_requests.add_new_address("точка", "Рядом", lat, lon)
+
+            async def no_upstream(*_args, **_kwargs):
+                raise AssertionError("Nominatim не должен вызываться")
+
+            with patch("Source.response._send_reverse", no_upstream):
+                with redirect_stdout(io.StringIO()):
+                    return await parsing.handle_free_query(
+                        f"{lat + 0.00005:.7f}, {lon:.7f}")
+
+        result = asyncio.run(run())
+        self.assertEqual(result.status, "cache")
+        self.assertEqual(result.full_address, "Рядом")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+# tests/test_startup.py
+
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Предел для холодного `python main.py --help`, с. Раньше запуск занимал
+# секунды из-за pip и импорта SQLAlchemy; сейчас — доли секунды.
+STARTUP_BUDGET_S = float(os.getenv("GEOCODER_STARTUP_BUDGET_S", "1.5"))
+
+HEAVY_MODULES = ("sqlalchemy", "aiosqlite", "httpx", "dadata")
+
+_PROBE = (
+    "import runpy, sys\n"
+    "sys.argv = ['main.py', '--help']\n"
+    "runpy.run_path('main.py', run_name='__main__')\n"
+    "heavy = %r\n"
+    "print(','.join(m for m in heavy if m in sys.modules), file=sys.stderr)\n"
+)
+
+
+def _run(*args):
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, capture_output=True, text=True,
+        timeout=60)
+
+
+class TestStartup(unittest.TestCase):
+    def test_help_stays_within_budget(self):
+        # первый запуск может записать отметку о проверенных зависимостях
+        _run("main.py", "--help")
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            completed = _run("main.py", "--help")
+            timings.append(time.perf_counter() - started)
+            self.assertEqual(completed.returncode, 0, completed.stderr)
+            self.assertIn("Российский геокодер", completed.stdout)
+        self.assertLess(min(timings), STARTUP_BUDGET_S)
+
+    def test_help_does_not_import_heavy_modules(self):
+        completed = _run("-c", _PROBE % (HEAVY_MODULES,))
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        self.assertEqual(completed.stderr.strip(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
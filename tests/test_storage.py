@@ -0,0 +1,92 @@
+# tests/test_storage.py
+
+import asyncio
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from Source.database import models
+from Source.database import requests as db_requests
+from Source.database.memory_cache import memory_cache
+from tests.temp_db import TempDatabase
+
+_db = TempDatabase()
+
+
+def setUpModule():
+    _db.start()
+
+
+def tearDownModule():
+    _db.stop()
+
+
+class TestSqliteTuning(unittest.TestCase):
+    def test_pragmas_on_reader_and_writer(self):
+        async def pragma(engine, name):
+            async with engine.connect() as connection:
+                return (await connection.execute(
+                    text(f"PRAGMA {name}"))).scalar()
+
+        async def run():
+            await models.init_db()
+            return {
+                "writer_journal": await pragma(models.engine, "journal_mode"),
+                "reader_journal": await pragma(
+                    models.read_engine, "journal_mode"),
+                "synchronous": await pragma(models.engine, "synchronous"),
+                "cache_size": await pragma(models.read_engine, "cache_size"),
+                "reader_query_only": await pragma(
+                    models.read_engine, "query_only"),
+                "writer_query_only": await pragma(models.engine, "query_only"),
+            }
+
+        values = asyncio.run(run())
+        self.assertEqual(values["writer_journal"], "wal")
+        self.assertEqual(values["reader_journal"], "wal")
+        self.assertEqual(values["synchronous"], 1)  # NORMAL
+        self.assertLess(values["cache_size"], 0)
+        self.assertEqual(values["reader_query_only"], 1)
+        self.assertEqual(values["writer_query_only"], 0)
+
+    def test_reader_pool_cannot_write(self):
+        async def run():
+            await models.init_db()
+            async with models.async_session() as session:
+                await session.execute(text(
+                    "DELETE FROM addresses WHERE id = -1"))
+
+        with self.assertRaises(OperationalError):
+            asyncio.run(run())
+
+    def test_concurrent_reads_and_writes(self):
+        saved_size = memory_cache.max_entries
+        memory_cache.configure(max_entries=0)
+
+        async def run():
+            await models.init_db()
+            writes = [
+                db_requests.add_new_address(
+                    f"параллельно {i}", "Адрес", 1.0, 2.0)
+                for i in range(20)
+            ]
+            reads = [
+                db_requests.return_address_if_exist(f"параллельно {i}")
+                for i in range(20)
+            ]
+            await asyncio.gather(*writes, *reads)
+            return await asyncio.gather(*(
+                db_requests.return_address_if_exist(f"параллельно {i}")
+                for i in range(20)
+            ))
+
+        try:
+            found = asyncio.run(run())
+        finally:
+            memory_cache.configure(max_entries=saved_size)
+        self.assertTrue(all(found))
+
+
+if __name__ == "__main__":
+    unittest.main()
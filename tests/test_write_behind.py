@@ -0,0 +1,193 @@
+# tests/test_write_behind.py
+
+import asyncio
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from Source.database.write_behind import WriteBehindBuffer
+
+
+def _row(n, normalized=None):
+    return {
+        "query_key": f"q{n}",
+        "normalized_key": normalized,
+        "latitude": 55.0,
+        "longitude": 37.0,
+    }
+
+
+class RecordingWriter:
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.hits = []
+        self.fail_times = fail_times
+
+    async def __call__(self, rows, hits):
+        await asyncio.sleep(0)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("disk is full")
+        if rows:
+            self.batches.append([row["query_key"] for row in rows])
+        if hits:
+            self.hits.append(dict(hits))
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    def test_flushes_in_groups_by_row_count(self):
+        writer = RecordingWriter()
+        buffer = WriteBehindBuffer(writer, flush_rows=10, flush_interval=60)
+
+        async def run():
+            for n in range(25):
+                await buffer.add(_row(n))
+
+        asyncio.run(run())
+        self.assertEqual([len(batch) for batch in writer.batches], [10, 10])
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual(buffer.flushes, 2)
+        self.assertEqual(buffer.rows_written, 20)
+
+    def test_flushes_by_timer(self):
+        writer = RecordingWriter()
+        buffer = WriteBehindBuffer(writer, flush_rows=100, flush_interval=0.01)
+
+        async def run():
+            await buffer.add(_row(1))
+            await buffer.add(_row(2))
+            await asyncio.sleep(0.1)
+
+        asyncio.run(run())
+        self.assertEqual(writer.batches, [["q1", "q2"]])
+        self.assertEqual(len(buffer), 0)
+
+    def test_pending_rows_are_visible(self):
+        writer = RecordingWriter()
+        buffer = WriteBehindBuffer(writer, flush_rows=100, flush_interval=60)
+
+        async def run():
+            await buffer.add(_row(1, normalized="moscow"))
+            found = (buffer.get("q1"), buffer.get("moscow"), buffer.get("q2"))
+            await buffer.flush()
+            return found, buffer.get("q1"), buffer.get("moscow")
+
+        (by_query, by_normalized, missing), after_q, after_n = asyncio.run(run())
+        self.assertEqual(by_query["query_key"], "q1")
+        self.assertIs(by_normalized, by_query)
+        self.assertIsNone(missing)
+        self.assertIsNone(after_q)
+        self.assertIsNone(after_n)
+
+    def test_duplicate_keys_are_written_once(self):
+        writer = RecordingWriter()
+        buffer = WriteBehindBuffer(writer, flush_rows=100, flush_interval=60)
+
+        async def run():
+            await buffer.add(_row(1))
+            await buffer.add(_row(1))
+            await buffer.flush()
+
+        asyncio.run(run())
+        self.assertEqual(writer.batches, [["q1"]])
+
+    def test_latest_row_for_key_wins(self):
+        written = []
+
+        async def writer(rows, _hits):
+            written.extend(rows)
+
+        buffer = WriteBehindBuffer(writer, flush_rows=100, flush_interval=60)
+        newer = dict(_row(1, "n1"), latitude=56.0)
+
+        async def run():
+            await buffer.add(_row(1, "n1"))
+            await buffer.add(newer)
+            self.assertIs(buffer.get("q1"), newer)
+            self.assertIs(buffer.get("n1"), newer)
+            await buffer.flush()
+
+        asyncio.run(run())
+        self.assertEqual(written, [newer])
+
+    def test_row_added_during_failed_write_is_kept(self):
+        buffer = None
+        newer = dict(_row(1), latitude=56.0)
+
+        async def writer(_rows, _hits):
+            await buffer.add(newer)
+            raise RuntimeError("disk is full")
+
+        buffer = WriteBehindBuffer(writer, flush_rows=100, flush_interval=60)
+
+        async def run():
+            await buffer.add(_row(1))
+            with self.assertRaises(RuntimeError):
+                await buffer.flush()
+            return buffer.get("q1")
+
+        self.assertIs(asyncio.run(run()), newer)
+
+    def test_buffer_is_bounded(self):
+        writer = RecordingWriter()
+        buffer = WriteBehindBuffer(
+            writer, flush_rows=5, flush_interval=60, max_rows=5)
+
+        async def run():
+            for n in range(12):
+                await buffer.add(_row(n))
+                self.assertLessEqual(len(buffer), 5)
+
+        asyncio.run(run())
+
+    def test_failed_write_keeps_rows(self):
+        writer = RecordingWriter(fail_times=1)
+        buffer = WriteBehindBuffer(writer, flush_rows=100, flush_interval=60)
+
+        async def run():
+            await buffer.add(_row(1))
+            with self.assertRaises(RuntimeError):
+                await buffer.flush()
+            self.assertIsNotNone(buffer.get("q1"))
+            await buffer.flush()
+
+        asyncio.run(run())
+        self.assertEqual(writer.batches, [["q1"]])
+        self.assertEqual(len(buffer), 0)
+
+    def test_hits_are_summed_and_survive_failed_write(self):
+        writer = RecordingWriter(fail_times=1)
+        buffer = WriteBehindBuffer(writer, flush_rows=100, flush_interval=60)
+
+        async def run():
+            await buffer.hit("q1", 1)
+            await buffer.hit("q1", 2)
+            with self.assertRaises(RuntimeError):
+                await buffer.flush()
+            await buffer.hit("q1", 3)
+            await buffer.hit("q2", 4)
+            await buffer.flush()
+
+        asyncio.run(run())
+        self.assertEqual(writer.hits, [{"q1": (3, 3), "q2": (1, 4)}])
+
+    def test_hit_does_not_wait_for_failed_write(self):
+        writer = RecordingWriter(fail_times=1)
+        buffer = WriteBehindBuffer(writer, flush_rows=2, flush_interval=60)
+
+        async def run():
+            await buffer.hit("q1", 1)
+            # пачка набрана: запись уходит в фон и там падает
+            await buffer.hit("q2", 2)
+            self.assertEqual(writer.hits, [])
+            with redirect_stdout(io.StringIO()) as out:
+                await asyncio.sleep(0.01)
+            self.assertIn("disk is full", out.getvalue())
+            await buffer.flush()
+
+        asyncio.run(run())
+        self.assertEqual(writer.hits, [{"q1": (1, 1), "q2": (1, 2)}])
+
+
+if __name__ == "__main__":
+    unittest.main()